@@ -16,7 +16,11 @@ from models import (
 from services.grading_calculation_engine import GradingCalculationEngine
 from services.semester_grading_service import SemesterGradingService
 from services.result_builder import ResultBuilder
+from services.parallel_recalculation import ParallelRecalculationService
+from services.gpa_summary_service import GPASummaryService
+from services.result_snapshot_service import ResultSnapshotService
 from datetime import datetime
+import click
 from functools import wraps
 import logging
 from flask import request, abort
@@ -53,27 +57,27 @@ def manage_grading():
     semester = request.args.get('semester')
     status_filter = request.args.get('status')
 
-    # Get all semesters with grades
-    semesters_query = db.session.query(
-        StudentCourseGrade.academic_year,
-        StudentCourseGrade.semester
-    ).distinct()
-
-    if academic_year:
-        semesters_query = semesters_query.filter_by(academic_year=academic_year)
-    if semester:
-        semesters_query = semesters_query.filter_by(semester=semester)
-
-    semesters = semesters_query.order_by(
-        StudentCourseGrade.academic_year.desc(),
-        StudentCourseGrade.semester.desc()
-    ).all()
+    # Semesters come from the course catalogue and release rows (small
+    # tables), not from a DISTINCT over every grade
+    periods = set(db.session.query(Course.academic_year, Course.semester).distinct())
+    periods.update(db.session.query(SemesterResultRelease.academic_year, SemesterResultRelease.semester))
+    periods = {(year, sem) for year, sem in periods if year and sem}
+
+    semesters = sorted(
+        (
+            (year, sem) for year, sem in periods
+            if (not academic_year or year == academic_year) and (not semester or sem == semester)
+        ),
+        reverse=True
+    )
 
     # Build semester status list
     semester_statuses = []
     
     for sem_year, sem_name in semesters:
         summary = SemesterGradingService.get_semester_summary(sem_year, sem_name)
+        if not summary['total_grades']:
+            continue
         
         # Apply status filter
         if status_filter and summary['status'] != status_filter:
@@ -90,20 +94,11 @@ def manage_grading():
             'average_gpa': summary['average_gpa']
         })
 
-    # Get unique values for filters
-    all_years = db.session.query(
-        StudentCourseGrade.academic_year
-    ).distinct().order_by(StudentCourseGrade.academic_year.desc()).all()
-    
-    all_semesters = db.session.query(
-        StudentCourseGrade.semester
-    ).distinct().order_by(StudentCourseGrade.semester).all()
-
     return render_template(
         'admin/manage_grading.html',
         semester_statuses=semester_statuses,
-        available_years=[y[0] for y in all_years],
-        available_semesters=[s[0] for s in all_semesters],
+        available_years=sorted({year for year, _ in periods}, reverse=True),
+        available_semesters=sorted({sem for _, sem in periods}),
         academic_year_filter=academic_year,
         semester_filter=semester,
         status_filter=status_filter
@@ -202,6 +197,45 @@ def finalize_course(course_id):
                           semester=course.semester))
 
 
+@grading_bp.route('/semester/<path:academic_year>/<semester>/recalculate', methods=['POST'])
+@login_required
+@admin_only
+def recalculate_semester(academic_year, semester):
+    """
+    Queue a recalculation of every course grade of a semester; the
+    grading job runner (flask grading run-jobs) runs it in a process pool.
+    Progress: recalculate_semester_status.
+    """
+    
+    result = ParallelRecalculationService.enqueue(
+        academic_year,
+        semester,
+        started_by=getattr(current_user, 'username', None)
+    )
+
+    if result.get('success'):
+        flash(result['message'], "success")
+    else:
+        flash(result['message'], "danger")
+
+    return redirect(url_for('grading.semester_details',
+                          academic_year=academic_year,
+                          semester=semester))
+
+
+@grading_bp.route('/semester/<path:academic_year>/<semester>/recalculate/status')
+@login_required
+@admin_only
+def recalculate_semester_status(academic_year, semester):
+    """API endpoint: progress and per-course timings of the semester's recalculation job"""
+    
+    status = ParallelRecalculationService.get_status(academic_year, semester)
+    if status is None:
+        return jsonify({'error': 'No recalculation has been run for this semester'}), 404
+
+    return jsonify(status)
+
+
 # ===== RESULT RELEASE OPERATIONS =====
 
 @grading_bp.route('/semester/<path:academic_year>/<semester>/release', methods=['POST'])
@@ -301,34 +335,14 @@ def semester_details(academic_year, semester):
     # Get semester status
     status = SemesterGradingService.get_semester_status(academic_year, semester)
     
-    # Get all courses
-    courses = Course.query.filter_by(
-        academic_year=academic_year,
-        semester=semester
-    ).all()
-
-    # Get course-level statistics
-    course_stats = []
-    for course in courses:
-        grades = StudentCourseGrade.query.filter_by(
-            course_id=course.id,
-            academic_year=academic_year,
-            semester=semester
-        ).all()
-
-        finalized = sum(1 for g in grades if getattr(g, 'is_finalized', g.final_score is not None))
-        released = sum(1 for g in grades if getattr(g, 'is_released', False))
-        # Compute average only over grades that have a numeric final_score
-        final_scores = [g.final_score for g in grades if g.final_score is not None]
-        avg_score = (sum(final_scores) / len(final_scores)) if final_scores else 0
-
-        course_stats.append({
-            'course': course,
-            'total_students': len(grades),
-            'finalized_count': finalized,
-            'released_count': released,
-            'average_score': round(avg_score, 2)
-        })
+    # Course-level statistics come with the (cached) summary
+    course_stats = [
+        {
+            **stat,
+            'course': {'id': stat['course_id'], 'code': stat['course_code'], 'name': stat['course_name']}
+        }
+        for stat in summary['courses']
+    ]
 
     return render_template(
         'admin/semester_details.html',
@@ -499,23 +513,82 @@ def api_course_status(course_id):
     
     course = Course.query.get_or_404(course_id)
     
-    grades = StudentCourseGrade.query.filter_by(course_id=course_id).all()
-    
-    finalized = sum(1 for g in grades if getattr(g, 'is_finalized', g.final_score is not None))
-    released = sum(1 for g in grades if getattr(g, 'is_released', False))
+    summary = SemesterGradingService.get_semester_summary(course.academic_year, course.semester)
+    stat = next((c for c in summary['courses'] if c['course_id'] == course_id), None)
+    total = stat['total_students'] if stat else 0
+    finalized = stat['finalized_count'] if stat else 0
+    released = stat['released_count'] if stat else 0
     
     return jsonify({
         'course_id': course_id,
         'course_code': course.code,
         'course_name': course.name,
-        'total_students': len(grades),
+        'total_students': total,
         'finalized': finalized,
         'released': released,
-        'finalized_percent': int((finalized / len(grades) * 100)) if grades else 0,
-        'released_percent': int((released / len(grades) * 100)) if grades else 0
+        'finalized_percent': int((finalized / total * 100)) if total else 0,
+        'released_percent': int((released / total * 100)) if total else 0
     })
 
 
+# ===== CLI: flask --app app grading recalculate =====
+
+@grading_bp.cli.command('recalculate')
+@click.option('--academic-year', required=True, help='Academic year, e.g. 2024.')
+@click.option('--semester', required=True, help='Semester, e.g. 1 or First.')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: GRADING_JOB_WORKERS).')
+def recalculate_semester_command(academic_year, semester, workers):
+    """Recalculate all course grades of a semester across a process pool."""
+    result = ParallelRecalculationService.start(academic_year, semester, workers=workers, started_by='cli')
+    if not result.get('success'):
+        raise click.ClickException(result['message'])
+
+    job = result['job']
+    for timing in sorted(job['course_timings'], key=lambda t: -t['seconds']):
+        status = f"ERROR {timing['error']}" if timing.get('error') else f"{timing['calculated']} grades"
+        click.echo(f"  course {timing['course_id']:>6}  {timing['seconds']:>8.3f}s  {status}")
+    click.echo(
+        f"{job['status']}: {job['rows_calculated']} grades in {job['completed_courses']}/{job['total_courses']} "
+        f"courses with {job['workers']} workers ({job['failed_courses']} failed)"
+    )
+    if job['status'] != 'completed':
+        raise SystemExit(1)
+
+
+@grading_bp.cli.command('run-jobs')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: GRADING_JOB_WORKERS).')
+def run_jobs_command(workers):
+    """Run the semester recalculations queued from the admin dashboard."""
+    jobs = ParallelRecalculationService.run_queued(workers=workers)
+    for job in jobs:
+        click.echo(
+            f"{job['academic_year']} {job['semester']}: {job['status']}, {job['rows_calculated']} grades in "
+            f"{job['completed_courses']}/{job['total_courses']} courses ({job['failed_courses']} failed)"
+        )
+    if not jobs:
+        click.echo("No queued recalculations")
+    if any(job['status'] != 'completed' for job in jobs):
+        raise SystemExit(1)
+
+
+@grading_bp.cli.command('rebuild-gpa')
+def rebuild_gpa_command():
+    """Recompute every student's semester GPA / CGPA summary rows from their grades."""
+    written = GPASummaryService.rebuild()
+    click.echo(f"Wrote {written} GPA summary rows")
+
+
+@grading_bp.cli.command('snapshot-results')
+@click.option('--academic-year', required=True, help='Academic year, e.g. 2024.')
+@click.option('--semester', required=True, help='Semester, e.g. 1 or First.')
+def snapshot_results_command(academic_year, semester):
+    """Write a new version of every student's released result snapshot for a semester."""
+    result = ResultSnapshotService.generate(academic_year, semester)
+    if not result['success']:
+        raise click.ClickException(result['message'])
+    click.echo(result['message'])
+
+
 # Register blueprint in main app
 def register_grading_routes(app):
     """Register grading routes with Flask app"""
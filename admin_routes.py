@@ -16,6 +16,7 @@ from forms import AdminLoginForm, QuizForm, AdminRegisterForm, AssignmentForm, M
 from admissions.forms import CERTIFICATE_PROGRAMMES, DIPLOMA_PROGRAMMES, STUDY_FORMATS
 from services.grading_calculation_engine import GradingCalculationEngine
 from services.semester_grading_service import SemesterGradingService
+from services.gpa_summary_service import GPASummaryService
 from utils.promotion import promote_student
 from utils.backup import generate_quiz_csv_backup, backup_students_to_csv
 from utils.helpers import get_programme_choices, get_level_choices, get_course_choices
@@ -25,6 +26,7 @@ from utils.index_generator import generate_index_number
 from utils.email import send_approval_credentials_email, send_email, send_temporary_password_email, send_password_reset_email
 from utils.notifications import create_assignment_notification, create_fee_notification
 from utils.notification_engine import notify_quiz_created, notify_exam_scheduled, notify_fee_assigned
+from utils.extensions import user_directory
 import uuid, secrets
 from zipfile import ZipFile
 import tempfile
@@ -1368,29 +1370,29 @@ def get_students_by_programme_level(programme, level):
     except ValueError:
         return jsonify({"error": "Invalid level"}), 400
 
-    students = (
-        StudentProfile.query
-        .join(User)
-        .filter(
-            StudentProfile.current_programme == programme,
-            StudentProfile.programme_level == level_int
-        )
-        .order_by(User.first_name, User.last_name)
-        .all()
+    # In-memory directory (utils/user_directory.py); ?q= prefix-searches,
+    # ?limit=&offset= pages through the cohort
+    query = (request.args.get('q') or '').strip() or None
+    limit = request.args.get('limit', type=int)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    students, has_more = user_directory.search(
+        programme=programme, level=level_int, query=query,
+        limit=max(1, min(limit, 200)) if limit is not None else None, offset=offset
     )
 
     return jsonify({
         "students": [
             {
-                "id": s.id,
+                "id": s.profile_id,
                 "user_id": s.user_id,
-                "name": s.user.full_name if hasattr(s, 'user') else f'Student #{s.id}',
+                "name": s.name,
                 "index_number": s.index_number or "N/A",
                 "programme": programme,
                 "level": level_int
             }
             for s in students
-        ]
+        ],
+        "has_more": has_more
     })
 
 import re
@@ -3378,6 +3380,9 @@ def calculate_yearly_gpa(student_id, academic_year):
     ✗ Had broken query
     ✗ Wasn't reliable
     
+    Credit-weighted over both semesters, read from the materialized
+    StudentGPASummary rows (see services/gpa_summary_service.py).
+    
     Args:
         student_id: User ID (string like "STD001")
         academic_year: Academic year (string like "2024")
@@ -3385,43 +3390,7 @@ def calculate_yearly_gpa(student_id, academic_year):
     Returns:
         GPA as float (0.0 to 4.0)
     """
-    
-    # Get all FINALIZED course grades for the year (both semesters).
-    # If the model has `is_finalized`, use it; otherwise treat non-NULL `final_score` as finalized.
-    if hasattr(StudentCourseGrade, 'is_finalized'):
-        grades = StudentCourseGrade.query.filter(
-            StudentCourseGrade.student_id == student_id,
-            StudentCourseGrade.academic_year == academic_year,
-            StudentCourseGrade.is_finalized == True
-        ).all()
-    else:
-        grades = StudentCourseGrade.query.filter(
-            StudentCourseGrade.student_id == student_id,
-            StudentCourseGrade.academic_year == academic_year,
-            StudentCourseGrade.final_score != None
-        ).all()
-    
-    if not grades:
-        return 0.0
-    
-    # Grade point mapping
-    grade_points = {
-        'A': 4.0, 'A-': 3.7,
-        'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-        'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-        'D+': 1.3, 'D': 1.0, 'F': 0.0
-    }
-    
-    total_points = 0
-    total_credits = 0
-    
-    for grade in grades:
-        points = grade_points.get(grade.grade_letter, 0)
-        credit_hours = grade.course.credit_hours if grade.course else 3
-        total_points += points * credit_hours
-        total_credits += credit_hours
-    
-    return round(total_points / total_credits, 2) if total_credits > 0 else 0.0
+    return GPASummaryService.yearly_gpa(academic_year, user_ids=[student_id]).get(student_id, 0.0)
 
 
 def get_promotion_candidates(academic_year, filters=None):
@@ -3454,10 +3423,12 @@ def get_promotion_candidates(academic_year, filters=None):
     
     students = query.all()
     
+    # Yearly GPA for every student in one grouped query
+    yearly_gpas = GPASummaryService.yearly_gpa(academic_year)
+    
     candidates = []
     for student in students:
-        # Calculate yearly GPA
-        gpa = calculate_yearly_gpa(student.user_id, academic_year)
+        gpa = yearly_gpas.get(student.user_id, 0.0)
         
         # Filter by minimum GPA if specified
         if filters.get('min_gpa') and gpa < filters['min_gpa']:
@@ -12,6 +12,7 @@ if sys.platform == "win32":
 # app.py - My LMS — Render-Optimized with Local Support
 
 import os
+import hmac
 import logging
 from datetime import datetime
 from flask import Flask, render_template, redirect, url_for, flash, request, abort, jsonify, send_from_directory, current_app
@@ -21,14 +22,15 @@ from werkzeug.utils import secure_filename
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
-from models import Admin, StudentProfile, User
+from models import Admin, StudentCourseGrade, StudentGPASummary, StudentProfile, User
 
 # ===== Extensions & Config =====
 from flask_login import LoginManager, login_required, logout_user, current_user
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect, CSRFError, generate_csrf
-from utils.extensions import db, mail, socketio
+from utils.extensions import db, mail, socketio, presence, presence_fanout, last_seen_writer, identity_cache, user_directory, grading_scale, grade_recompute, semester_cache
 from config import Config
+from services.gpa_summary_service import GPASummaryService
 
 # ===== Logging =====
 logging.basicConfig(level=logging.INFO)
@@ -41,19 +43,24 @@ app.config.from_object(Config)
 IS_PRODUCTION = bool(
     app.config.get("IS_PRODUCTION")
     or os.environ.get("IS_PRODUCTION") in ("1", "true", "True")
+    or os.environ.get("FLASK_ENV", "").lower() == "production"
     or app.config.get("ENV", "").lower() == "production"
 )
 
-# Ensure eventlet is imported only if installed. Fallback to threading if not.
-try:
-    import eventlet  # pip install eventlet
-    # Only monkey-patch if we intend to use eventlet (avoid unnecessary patching)
-    if IS_PRODUCTION:
-        eventlet.monkey_patch()
-    SOCKETIO_ASYNC_MODE = "eventlet" if IS_PRODUCTION else "threading"
-except Exception:
-    # eventlet not available — use threading which is safe for development
-    SOCKETIO_ASYNC_MODE = "threading"
+# gunicorn.conf.py sets SOCKETIO_ASYNC_MODE to match its worker class
+# (the worker has already monkey-patched the process).
+SOCKETIO_ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE")
+if not SOCKETIO_ASYNC_MODE:
+    # Ensure eventlet is imported only if installed. Fallback to threading if not.
+    try:
+        import eventlet  # pip install eventlet
+        # Only monkey-patch if we intend to use eventlet (avoid unnecessary patching)
+        if IS_PRODUCTION:
+            eventlet.monkey_patch()
+        SOCKETIO_ASYNC_MODE = "eventlet" if IS_PRODUCTION else "threading"
+    except Exception:
+        # eventlet not available — use threading which is safe for development
+        SOCKETIO_ASYNC_MODE = "threading"
 
 # ===== Paths =====
 # Leave SQLALCHEMY_DATABASE_URI to be provided by `Config` (or DATABASE_URL).
@@ -84,8 +91,25 @@ migrate = Migrate(app, db)
 csrf = CSRFProtect(app)
 
 # ===== SocketIO =====
-logger.info("SocketIO async_mode=%s", SOCKETIO_ASYNC_MODE)
-socketio.init_app(app, async_mode=SOCKETIO_ASYNC_MODE, manage_session=False)
+SOCKETIO_MESSAGE_QUEUE = app.config.get("SOCKETIO_MESSAGE_QUEUE")
+logger.info("SocketIO async_mode=%s message_queue=%s", SOCKETIO_ASYNC_MODE,
+            SOCKETIO_MESSAGE_QUEUE.split("@")[-1] if SOCKETIO_MESSAGE_QUEUE else None)
+socketio.init_app(
+    app,
+    async_mode=SOCKETIO_ASYNC_MODE,
+    manage_session=False,
+    message_queue=SOCKETIO_MESSAGE_QUEUE,
+    channel=app.config.get("SOCKETIO_CHANNEL", "flask-socketio"),
+)
+presence.init_app(app)
+presence_fanout.init_app(app)
+last_seen_writer.init_app(app)
+identity_cache.init_app(app)
+user_directory.init_app(app)
+grading_scale.init_app(app)
+grade_recompute.init_app(app)
+semester_cache.init_app(app)
+GPASummaryService.init_app(app)
 
 # ===== Login Manager =====
 login_manager = LoginManager()
@@ -96,12 +120,14 @@ login_manager.login_view = 'student.student_login'
 def load_user(user_id):
     try:
         from models import Admin, User
-        if user_id.startswith("admin:"):
-            uid = user_id.split(":", 1)[1]
-            return Admin.query.filter_by(public_id=uid).first()
-        elif user_id.startswith("user:"):
-            uid = user_id.split(":", 1)[1]
-            return User.query.filter_by(public_id=uid).first()
+        kind, _, uid = user_id.partition(":")
+        model = {"admin": Admin, "user": User}.get(kind)
+        if model is None:
+            return None
+        # Cached public_id -> primary key, then an identity-map aware PK load
+        ident = identity_cache.get(uid)
+        if ident and ident.kind == kind:
+            return db.session.get(model, ident.pk)
     except Exception as e:
         logger.exception("user_loader error: %s", e)
     return None
@@ -115,6 +141,10 @@ def inject_current_app():
 def inject_csrf():
     return dict(csrf_token=generate_csrf)
 
+@app.context_processor
+def inject_socketio_transports():
+    return {'socketio_transports': app.config.get('SOCKETIO_TRANSPORTS', '')}
+
 @app.context_processor
 def inject_now():
     return {'now': datetime.utcnow()}
@@ -206,6 +236,17 @@ def one_time_init():
     db.create_all()
     logger.info("✓ Database tables created/verified")
 
+    from utils.chat_search import ensure_message_search_index
+    with db.engine.begin() as conn:
+        ensure_message_search_index(conn)
+    logger.info("✓ Chat search index verified")
+
+    # GPA summaries for databases built with create_all() (migrations backfill their own)
+    if db.session.query(StudentGPASummary.id).first() is None and \
+            db.session.query(StudentCourseGrade.id).first() is not None:
+        written = GPASummaryService.rebuild()
+        logger.info("✓ GPA summaries backfilled (%d rows)", written)
+
     # 2️⃣ Create SuperAdmin if missing
     if not Admin.query.filter_by(username='SuperAdmin').first():
         admin = Admin(username='SuperAdmin', admin_id='ADM001')
@@ -275,6 +316,29 @@ def health():
     except Exception:
         return jsonify(status='error'), 500
 
+@app.route('/health/metrics')
+def health_metrics():
+    """
+    Internal counters for background workers and caches. Needs an admin
+    login or the METRICS_TOKEN in an X-Metrics-Token header.
+    """
+    token = app.config.get("METRICS_TOKEN")
+    supplied = request.headers.get("X-Metrics-Token", "")
+    token_ok = bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+    admin_ok = current_user.is_authenticated and isinstance(current_user, Admin)
+    if not (token_ok or admin_ok):
+        abort(404)
+
+    return jsonify(
+        presence_fanout=presence_fanout.stats(),
+        last_seen_writer=last_seen_writer.stats(),
+        identity_cache=identity_cache.stats(),
+        user_directory=user_directory.stats(),
+        grading_scale=grading_scale.stats(),
+        grade_recompute=grade_recompute.stats(),
+        semester_cache=semester_cache.stats(),
+    ), 200
+
 # ===== Run =====
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
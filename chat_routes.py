@@ -1,13 +1,36 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import login_required, current_user
 from flask_socketio import emit, join_room
-from utils.extensions import db, socketio
-from models import Conversation, ConversationParticipant, Message, MessageReaction, User, Admin, StudentProfile, TeacherProfile
+from socketio import PubSubManager
+from utils.extensions import db, socketio, presence, presence_fanout, last_seen_writer, identity_cache, user_directory
+from models import Conversation, ConversationParticipant, Message, MessageReaction, ArchivedMessage, User, Admin, StudentProfile, TeacherProfile
+from utils.serializers import serialize_messages
+from utils.chat_search import search_messages, query_terms
+from utils.chat_archive import archive_old_messages, archived_cursor, fetch_archived
+from utils.presence_fanout import direct_contacts
+from utils.chat_membership import add_group_members
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy import and_, or_, func
 from datetime import datetime
 import json
+import click
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/chat')
 
+# Chat history page sizes (GET /conversations/<id>/messages)
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# Members returned per conversation in the conversation list
+PARTICIPANT_PREVIEW_LIMIT = 20
+
+# Message search result page sizes (GET /chat/search)
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
+# Recipient picker pages (GET /chat/users, /chat/students_by_programme)
+MAX_DIRECTORY_PAGE_SIZE = 200
+
 # -------------------------
 # Helper functions
 # -------------------------
@@ -17,21 +40,15 @@ def is_user_or_admin():
     return role in ["teacher", "student", "superadmin", "finance_admin", "academic_admin", "admissions_admin"]
 
 def resolve_person_by_public_id(pub_id):
-    """Return (model_instance, role_string) or (None, None). Checks both User and Admin tables."""
-    if not pub_id:
+    """
+    Return (Identity, role_string) or (None, None). Checks both User and Admin
+    tables through the shared identity cache; Identity is an immutable record
+    (public_id, kind, pk, name, role, avatar, last_seen), not an ORM object.
+    """
+    ident = identity_cache.get(pub_id)
+    if not ident:
         return None, None
-    
-    # Try to find in User table first (students/teachers)
-    person = User.query.filter_by(public_id=pub_id).first()
-    if person:
-        return person, getattr(person, "role", "user")
-    
-    # Try to find in Admin table
-    admin = Admin.query.filter_by(public_id=pub_id).first()
-    if admin:
-        return admin, admin.role  # admin.role is a database column, not a property
-    
-    return None, None
+    return ident, ident.role or "user"
 
 def add_participant_if_not_exists(conv_id, person_or_public_id, role=None):
     """
@@ -63,61 +80,196 @@ def add_participant_if_not_exists(conv_id, person_or_public_id, role=None):
             user_role=user_role
         ))
 
-def conversation_to_dict(conv, current_user_pubid):
-    participants = []
-    for p in conv.participants:
-        person, _ = resolve_person_by_public_id(p.user_public_id)
-        display_name = getattr(
-            person,
-            "full_name",
-            getattr(person, "username", "Unknown")
-        ) if person else "Unknown"
-
-        participants.append({
-            "user_public_id": p.user_public_id,
-            "role": p.user_role,
-            "name": display_name
+def record_new_message(conv, msg):
+    """
+    Maintain a conversation's summary state for a message just added to the
+    session: the last-message pointer and the other participants' unread
+    counters. The caller commits.
+    """
+    db.session.flush()  # assigns msg.id / msg.created_at
+
+    conv.last_message_id = msg.id
+    conv.last_message_at = msg.created_at
+    conv.updated_at = msg.created_at
+
+    ConversationParticipant.query.filter(
+        ConversationParticipant.conversation_id == conv.id,
+        ConversationParticipant.user_public_id != msg.sender_public_id
+    ).update(
+        {ConversationParticipant.unread_count: ConversationParticipant.unread_count + 1},
+        synchronize_session=False
+    )
+
+def conversation_summaries(current_user_pubid, conv_ids=None):
+    """
+    Build conversation list entries for a user from the maintained summary
+    columns: one joined query for conversations + last messages, one windowed
+    query for a capped participant preview, and one batch name lookup.
+    """
+    query = db.session.query(ConversationParticipant, Conversation, Message).join(
+        Conversation, Conversation.id == ConversationParticipant.conversation_id
+    ).outerjoin(
+        Message, Message.id == Conversation.last_message_id
+    ).filter(
+        ConversationParticipant.user_public_id == current_user_pubid
+    )
+    if conv_ids is not None:
+        query = query.filter(Conversation.id.in_(conv_ids))
+
+    rows = query.order_by(Conversation.updated_at.desc()).all()
+    if not rows:
+        return []
+
+    listed_ids = [conv.id for _, conv, _ in rows]
+
+    # Capped participant preview + total member count per conversation
+    ranked = db.session.query(
+        ConversationParticipant.conversation_id,
+        ConversationParticipant.user_public_id,
+        ConversationParticipant.user_role,
+        func.row_number().over(
+            partition_by=ConversationParticipant.conversation_id,
+            order_by=ConversationParticipant.id
+        ).label('rn'),
+        func.count().over(
+            partition_by=ConversationParticipant.conversation_id
+        ).label('total'),
+    ).filter(
+        ConversationParticipant.conversation_id.in_(listed_ids)
+    ).subquery()
+
+    preview = {}
+    counts = {}
+    for r in db.session.query(ranked).filter(ranked.c.rn <= PARTICIPANT_PREVIEW_LIMIT).order_by(ranked.c.conversation_id, ranked.c.rn):
+        preview.setdefault(r.conversation_id, []).append(r)
+        counts[r.conversation_id] = r.total
+
+    metas = {conv.id: conv.get_meta() or {} for _, conv, _ in rows}
+
+    public_ids = {r.user_public_id for parts in preview.values() for r in parts}
+    public_ids.update(m.get("created_by") for m in metas.values())
+    names = Message.sender_names_for(public_ids)
+
+    last_messages = [m for _, _, m in rows if m is not None]
+    last_by_id = {d["id"]: d for d in serialize_messages(last_messages)}
+
+    result = []
+    for me, conv, last_msg in rows:
+        meta = metas[conv.id]
+        created_by_pub = meta.get("created_by")
+        result.append({
+            "id": conv.id,
+            "type": conv.type,
+            "name": meta.get("name"),
+            "created_by": created_by_pub,          # ✅ public id
+            "created_by_name": names.get(created_by_pub) if created_by_pub else None,    # ✅ display name
+            "participants": [
+                {
+                    "user_public_id": r.user_public_id,
+                    "role": r.user_role,
+                    "name": names.get(r.user_public_id, "Unknown"),
+                }
+                for r in preview.get(conv.id, [])
+            ],
+            "participant_count": counts.get(conv.id, 0),
+            "last_message": last_by_id.get(last_msg.id) if last_msg else None,
+            "unread_count": me.unread_count or 0,
+            "updated_at": conv.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
         })
+    return result
 
-    last_message = conv.messages[-1].to_dict() if conv.messages else None
+def conversation_to_dict(conv, current_user_pubid):
+    summaries = conversation_summaries(current_user_pubid, conv_ids=[conv.id])
+    return summaries[0] if summaries else None
+
+def fetch_message_page(conv_id, before_id=None, after_id=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Keyset-paginate a conversation's history on (created_at, id).
 
-    last_read_at = next(
-        (p.last_read_at for p in conv.participants
-         if p.user_public_id == current_user_pubid),
-        None
-    ) or datetime.min
+    - no cursor: the newest `limit` messages
+    - before_id: the `limit` messages immediately older than that message
+    - after_id: the `limit` messages immediately newer than that message
 
-    # Only count messages from OTHER users as unread (not own messages)
-    unread_count = sum(
-        1 for m in conv.messages
-        if (m.created_at or datetime.min) > last_read_at
-        and m.sender_public_id != current_user_pubid
+    Returns (messages_oldest_first, has_more). `has_more` refers to the
+    direction being paged (older for before_id / no cursor, newer for after_id).
+
+    Archived history (utils/chat_archive.py) is merged in when the page can
+    reach it; archived entries are detached Message objects.
+    """
+    limit = max(1, min(int(limit or MESSAGE_PAGE_SIZE), MAX_MESSAGE_PAGE_SIZE))
+
+    query = Message.query.filter(
+        Message.conversation_id == conv_id,
+        Message.is_deleted.isnot(True)
     )
 
-    meta = conv.get_meta() or {}
+    cursor = None
+    cursor_id = after_id or before_id
+    if cursor_id:
+        cursor = db.session.query(Message.created_at, Message.id).filter_by(
+            id=cursor_id, conversation_id=conv_id
+        ).first() or archived_cursor(conv_id, cursor_id)
+        if not cursor:
+            return [], False
+
+        if after_id:
+            query = query.filter(or_(
+                Message.created_at > cursor.created_at,
+                and_(Message.created_at == cursor.created_at, Message.id > cursor.id)
+            ))
+        else:
+            query = query.filter(or_(
+                Message.created_at < cursor.created_at,
+                and_(Message.created_at == cursor.created_at, Message.id < cursor.id)
+            ))
 
-    created_by_pub = meta.get("created_by")
-    created_by_name = None
-    if created_by_pub:
-        creator, _ = resolve_person_by_public_id(created_by_pub)
-        if creator:
-            created_by_name = getattr(
-                creator,
-                "full_name",
-                getattr(creator, "username", "Unknown")
-            )
+    if after_id:
+        rows = query.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit + 1).all()
+    else:
+        rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
 
-    return {
-        "id": conv.id,
-        "type": conv.type,
-        "name": meta.get("name"),
-        "created_by": created_by_pub,          # ✅ public id
-        "created_by_name": created_by_name,    # ✅ display name
-        "participants": participants,
-        "last_message": last_message,
-        "unread_count": unread_count,
-        "updated_at": conv.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
-    }
+    archived_through = db.session.query(Conversation.archived_through).filter_by(id=conv_id).scalar()
+    if archived_through is not None:
+        if after_id:
+            reaches_archive = cursor.created_at <= archived_through
+        else:
+            reaches_archive = len(rows) <= limit or rows[-1].created_at <= archived_through
+        if reaches_archive:
+            archived = fetch_archived(conv_id, cursor=tuple(cursor) if cursor else None,
+                                      newer=bool(after_id), limit=limit + 1)
+            rows = sorted(rows + archived, key=lambda m: (m.created_at, m.id), reverse=not after_id)[:limit + 1]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not after_id:
+        rows.reverse()
+    return rows, has_more
+
+def get_or_create_direct_conversation(person, other_public_id, other_role):
+    """
+    Return (conversation, created) for the direct conversation between
+    `person` and `other_public_id`. Looked up by Conversation.direct_key; a
+    concurrent first message that creates the same pair loses on the unique
+    index and picks up the winner's conversation.
+    """
+    key = Conversation.direct_key_for(person.public_id, other_public_id)
+    conv = Conversation.query.filter_by(direct_key=key).first()
+    if conv:
+        return conv, False
+
+    now = datetime.utcnow()
+    conv = Conversation(type='direct', direct_key=key, created_at=now, updated_at=now)
+    db.session.add(conv)
+    try:
+        db.session.flush()  # raises IntegrityError if another request created the pair
+    except IntegrityError:
+        db.session.rollback()
+        return Conversation.query.filter_by(direct_key=key).one(), False
+
+    add_participant_if_not_exists(conv.id, person)
+    add_participant_if_not_exists(conv.id, other_public_id, role=other_role)
+    db.session.commit()
+    return conv, True
 
 def require_group_admin(conv_id):
     """Check if current user is a group admin for this conversation."""
@@ -128,11 +280,81 @@ def require_group_admin(conv_id):
     ).first()
     return p
 
-# ───────────────
-# Track online users
-# ───────────────
-online_users = set()
-sid_to_pub = {}
+def conversation_room(conv_id):
+    """Socket.IO room every live connection of a conversation's members is in."""
+    return f"conv_{conv_id}"
+
+def sync_conversation_room(conv_id, public_ids, join=True):
+    """
+    Add (or remove) all live connections of the given users to/from a
+    conversation room after a membership change. Connections held by other
+    workers are moved through the message queue.
+    """
+    server = socketio.server
+    if server is None:
+        return
+    manager = server.manager
+    room = conversation_room(conv_id)
+    for pub in public_ids:
+        for sid in presence.sids_for(pub):
+            if not isinstance(manager, PubSubManager) and not manager.is_connected(sid, '/'):
+                continue
+            if join:
+                server.enter_room(sid, room, namespace='/')
+            else:
+                server.leave_room(sid, room, namespace='/')
+
+def directory_page_args():
+    """
+    (q, limit, offset) for the user directory (utils/user_directory.py)
+    from the query string. Without `limit` the whole matching list is returned.
+    """
+    q = (request.args.get('q') or '').strip() or None
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_DIRECTORY_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    return q, limit, offset
+
+def emit_to_conversation(event, payload, conv_id):
+    """Broadcast one serialized payload to everyone in a conversation."""
+    socketio.emit(event, payload, room=conversation_room(conv_id))
+
+def member_selector(data):
+    """
+    Parse a membership selector from a request body: either
+    {"members": [public_id, ...]} or {"programme": ..., "level": ...}.
+    Returns (kwargs for add_group_members, error).
+    """
+    programme = data.get('programme')
+    level = data.get('level')
+    if programme or level:
+        if not programme or not level:
+            return None, 'Missing parameters'
+        try:
+            return {'programme': programme, 'level': int(level)}, None
+        except (TypeError, ValueError):
+            return None, 'Invalid level'
+
+    members = data.get('members') or []
+    if not isinstance(members, list) or not members:
+        return None, 'No members specified'
+    return {'public_ids': [str(m) for m in members]}, None
+
+def announce_new_members(conv_id, added):
+    """Move the new members' connections into the room and emit one members_added event."""
+    if not added:
+        return
+    sync_conversation_room(conv_id, added)
+    identities = identity_cache.get_many(added)
+    emit_to_conversation('members_added', {
+        "conversation_id": conv_id,
+        "added_by": current_user.public_id,
+        "members": [
+            {"user_public_id": pub, "name": identities[pub].name, "role": identities[pub].role}
+            for pub in added if pub in identities
+        ],
+    }, conv_id)
 
 # ─────────────────────────
 # SocketIO events
@@ -147,39 +369,68 @@ def on_join(data):
     if not pub:
         return
 
-    sid = request.sid
-    sid_to_pub[sid] = pub
-
-    online_users.add(pub)
+    came_online = presence.connect(pub, request.sid)
     join_room(f"user_{pub}")
 
-    socketio.emit('presence_update', {'user_public_id': pub, 'status': 'online'})
+    conv_ids = db.session.query(ConversationParticipant.conversation_id).filter_by(
+        user_public_id=current_user.public_id
+    ).all()
+    for (conv_id,) in conv_ids:
+        join_room(conversation_room(conv_id))
 
-@socketio.on('disconnect')
-def on_disconnect():
-    """Handle user disconnect."""
-    sid = request.sid
-    pub = sid_to_pub.pop(sid, None)
+    if came_online:
+        presence_fanout.publish(pub, 'online')  # contacts/watchers only, batched
 
-    if not pub:
-        pub = getattr(current_user, 'public_id', None)
+    # Initial presence of this user's direct contacts; later changes arrive
+    # as presence_batch frames.
+    contacts = direct_contacts([pub]).get(pub, set())
+    return {'online': sorted(presence.online_subset(contacts))}
 
-    if pub and pub in online_users:
-        online_users.remove(pub)
+@socketio.on('presence_watch')
+def on_presence_watch(data=None):
+    """
+    Track the conversation open in this tab, so presence changes of its
+    members reach this connection. Returns the members that are online.
+    """
+    pub = getattr(current_user, 'public_id', None)
+    if not pub or not is_user_or_admin():
+        return
+    conv_id = (data or {}).get('conversation_id')
+    if conv_id is None:
+        presence.watch(request.sid, None)
+        return {'online': []}
+    try:
+        conv_id = int(conv_id)
+    except (TypeError, ValueError):
+        return {'error': 'Invalid conversation_id'}
 
-        person, _ = resolve_person_by_public_id(pub)
-        if person:
-            person.last_seen = datetime.utcnow()
-            db.session.commit()
+    members = [row.user_public_id for row in ConversationParticipant.query.filter_by(
+        conversation_id=conv_id
+    ).with_entities(ConversationParticipant.user_public_id)]
+    if pub not in members:
+        return {'error': 'Not a participant'}
+
+    presence.watch(request.sid, conv_id)
+    return {'online': sorted(presence.online_subset(m for m in members if m != pub))}
+
+@socketio.on('presence_heartbeat')
+def on_presence_heartbeat(data=None):
+    """Keep this connection's presence entry alive (see utils/presence.py)."""
+    if not presence.heartbeat(request.sid):
+        # Expired (e.g. missed heartbeats) - re-register the connection
+        pub = getattr(current_user, 'public_id', None)
+        if pub and is_user_or_admin():
+            on_join({'user_id': pub})
 
-        socketio.emit(
-            'presence_update',
-            {
-                'user_public_id': pub,
-                'status': 'offline',
-                'last_seen': datetime.utcnow().isoformat()
-            }
-        )
+@socketio.on('disconnect')
+def on_disconnect():
+    """Handle user disconnect (the user goes offline when their last connection closes)."""
+    pub, went_offline = presence.disconnect(request.sid)
+
+    if pub and went_offline:
+        now = datetime.utcnow()
+        last_seen_writer.record(pub, now)  # flushed in batches (utils/last_seen.py)
+        presence_fanout.publish(pub, 'offline', last_seen=now)
 
 @socketio.on('send_message')
 def handle_message(data):
@@ -205,13 +456,12 @@ def handle_message(data):
     db.session.add(msg)
     conv = Conversation.query.get(conv_id)
     if conv:
-        conv.updated_at = datetime.utcnow()
+        record_new_message(conv, msg)
     db.session.commit()
 
     if conv:
-        for part in conv.participants:
-            room = f"user_{part.user_public_id}"
-            socketio.emit('new_message', {"conversation_id": conv.id, "message": msg.to_dict()}, room=room)
+        payload = {"conversation_id": conv.id, "message": serialize_messages([msg])[0]}
+        emit_to_conversation('new_message', payload, conv.id)
 
 # ─────────────────────────
 # Routes
@@ -232,12 +482,7 @@ def get_conversations():
     if not is_user_or_admin():
         return jsonify({"error": "Access denied"}), 403
     
-    conv_participants = ConversationParticipant.query.filter_by(
-        user_public_id=current_user.public_id
-    ).all()
-    conversations = [p.conversation for p in conv_participants]
-    result = [conversation_to_dict(conv, current_user.public_id) for conv in conversations]
-    return jsonify(result), 200
+    return jsonify(conversation_summaries(current_user.public_id)), 200
 
 
 @chat_bp.route('/programmes', methods=['GET'])
@@ -270,27 +515,26 @@ def students_by_programme():
     except:
         return jsonify({'error': 'Invalid level'}), 400
 
-    # Join User -> StudentProfile to get users in programme+level
-    students = []
-    from models import User, StudentProfile
-    users = User.query.join(StudentProfile, User.user_id == StudentProfile.user_id) \
-        .filter(StudentProfile.current_programme == programme, StudentProfile.programme_level == lvl_int) \
-        .order_by(User.first_name, User.last_name) \
-        .all()
-
-    for u in users:
-        students.append({'public_id': getattr(u, 'public_id', None), 'name': getattr(u, 'full_name', getattr(u, 'username', 'Unknown'))})
+    q, limit, offset = directory_page_args()
+    entries, has_more = user_directory.search(programme=programme, level=lvl_int, query=q, limit=limit, offset=offset)
+    students = [{'public_id': e.public_id, 'name': e.name} for e in entries]
 
-    return jsonify({'students': students}), 200
+    return jsonify({'students': students, 'has_more': has_more}), 200
 
 @chat_bp.route('/conversations/<int:conv_id>/messages', methods=['GET'])
 @login_required
 def get_messages(conv_id):
-    """Get messages from a conversation (participant access only)."""
+    """
+    Get a page of messages from a conversation (participant access only).
+    Query params:
+      - before_id: return messages older than this message id
+      - after_id: return messages newer than this message id
+      - limit: page size (default 50, max 200)
+    """
     if not is_user_or_admin():
         return jsonify({"error": "Access denied"}), 403
     
-    conv = Conversation.query.get_or_404(conv_id)
+    Conversation.query.get_or_404(conv_id)
     is_participant = ConversationParticipant.query.filter_by(
         conversation_id=conv_id,
         user_public_id=current_user.public_id
@@ -298,15 +542,100 @@ def get_messages(conv_id):
     
     if not is_participant:
         return jsonify({"error": "Access denied"}), 403
-    
-    messages = [m.to_dict() for m in conv.messages if not m.is_deleted]
-    
-    # Add reactions to each message
-    for msg in messages:
-        reactions = MessageReaction.query.filter_by(message_id=msg['id']).all()
-        msg['reactions'] = [r.to_dict() for r in reactions]
-    
-    return jsonify(messages), 200
+
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', MESSAGE_PAGE_SIZE, type=int)
+
+    if before_id and after_id:
+        return jsonify({"error": "Use either before_id or after_id, not both"}), 400
+
+    page, has_more = fetch_message_page(conv_id, before_id=before_id, after_id=after_id, limit=limit)
+    messages = serialize_messages(page, include_reactions=True)
+
+    return jsonify({
+        "messages": messages,
+        "has_more": has_more,
+        "oldest_id": messages[0]['id'] if messages else None,
+        "newest_id": messages[-1]['id'] if messages else None,
+    }), 200
+
+@chat_bp.route('/search', methods=['GET'])
+@login_required
+def search_chat_messages():
+    """
+    Full-text search over messages in the current user's conversations
+    (optionally a single one), ranked, with highlighted snippets.
+    """
+    if not is_user_or_admin():
+        return jsonify({"error": "Access denied"}), 403
+
+    q = (request.args.get('q') or '').strip()
+    if not query_terms(q):
+        return jsonify({"error": "Search query required"}), 400
+
+    conv_id = request.args.get('conversation_id', type=int)
+    limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), MAX_SEARCH_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
+
+    scope = db.session.query(ConversationParticipant.conversation_id).filter_by(
+        user_public_id=current_user.public_id
+    )
+    if conv_id:
+        scope = scope.filter_by(conversation_id=conv_id)
+    conv_ids = [cid for (cid,) in scope.all()]
+    if conv_id and not conv_ids:
+        return jsonify({"error": "Access denied"}), 403
+
+    try:
+        hits = search_messages(db.session, conv_ids, q, limit=limit + 1, offset=offset)
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        current_app.logger.exception("Chat search failed (is the search index installed?)")
+        return jsonify({"error": "Search is temporarily unavailable"}), 503
+
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+
+    messages = Message.query.filter(Message.id.in_([h[0] for h in hits])).all() if hits else []
+    by_id = {m["id"]: m for m in serialize_messages(messages)}
+
+    return jsonify({
+        "results": [
+            {
+                "conversation_id": by_id[msg_id]["conversation_id"],
+                "message": by_id[msg_id],
+                "snippet": snippet,
+                "score": score,
+            }
+            for msg_id, score, snippet in hits if msg_id in by_id
+        ],
+        "has_more": has_more,
+    }), 200
+
+@chat_bp.route('/conversations/<int:conv_id>/participants', methods=['GET'])
+@login_required
+def get_participants(conv_id):
+    """Full member list of a conversation (the conversation list only carries a preview)."""
+    if not is_user_or_admin():
+        return jsonify({"error": "Access denied"}), 403
+
+    participants = ConversationParticipant.query.filter_by(conversation_id=conv_id).order_by(
+        ConversationParticipant.id
+    ).all()
+    if not any(p.user_public_id == current_user.public_id for p in participants):
+        return jsonify({"error": "Access denied"}), 403
+
+    names = Message.sender_names_for(p.user_public_id for p in participants)
+    return jsonify([
+        {
+            "user_public_id": p.user_public_id,
+            "role": p.user_role,
+            "name": names.get(p.user_public_id, "Unknown"),
+            "is_group_admin": p.is_group_admin,
+        }
+        for p in participants
+    ]), 200
 
 @chat_bp.route('/presence/<public_id>')
 @login_required
@@ -315,9 +644,13 @@ def get_presence(public_id):
     if not is_user_or_admin():
         return jsonify({"error": "Access denied"}), 403
     
-    if public_id in online_users:
+    if presence.is_online(public_id):
         return jsonify({"status": "online"})
 
+    buffered = last_seen_writer.pending(public_id)
+    if buffered:
+        return jsonify({"status": "offline", "last_seen": buffered.isoformat()})
+
     person, _ = resolve_person_by_public_id(public_id)
     if person and person.last_seen:
         return jsonify({
@@ -369,19 +702,9 @@ def send_dm():
             "error": "You cannot send a message to yourself."
         }), 400
 
-    conv = Conversation.query.filter(
-        Conversation.type == 'direct',
-        Conversation.participants.any(ConversationParticipant.user_public_id == my_pub),
-        Conversation.participants.any(ConversationParticipant.user_public_id == rec_pub)
-    ).first()
-
-    if not conv:
-        conv = Conversation(type='direct', created_at=datetime.utcnow(), updated_at=datetime.utcnow())
-        db.session.add(conv)
-        db.session.flush()
-        add_participant_if_not_exists(conv.id, current_user)
-        add_participant_if_not_exists(conv.id, receiver, role=receiver_role)
-        db.session.commit()
+    conv, created = get_or_create_direct_conversation(current_user, rec_pub, receiver_role)
+    if created:
+        sync_conversation_room(conv.id, [my_pub, rec_pub])
 
     msg = Message(
         conversation_id=conv.id,
@@ -391,14 +714,13 @@ def send_dm():
         reply_to_message_id=reply_to_message_id
     )
     db.session.add(msg)
-    conv.updated_at = datetime.utcnow()
+    record_new_message(conv, msg)
     db.session.commit()
 
-    for p in conv.participants:
-        room = f"user_{p.user_public_id}"
-        socketio.emit('new_message', {"conversation_id": conv.id, "message": msg.to_dict()}, room=room)
+    message = serialize_messages([msg])[0]
+    emit_to_conversation('new_message', {"conversation_id": conv.id, "message": message}, conv.id)
 
-    return jsonify({"success": True, "conversation_id": conv.id, "message": msg.to_dict()}), 200
+    return jsonify({"success": True, "conversation_id": conv.id, "message": message}), 200
 
 @chat_bp.route('/mark_read', methods=['POST'])
 @login_required
@@ -415,6 +737,7 @@ def mark_read():
     ).first()
     if conv_part:
         conv_part.last_read_at = datetime.utcnow()
+        conv_part.unread_count = 0
         db.session.commit()
     return jsonify({"success": True}), 200
 
@@ -443,6 +766,8 @@ def get_users():
       - role: 'teacher', 'student', or 'admin' (required)
       - programme: filter students by programme name
       - level: filter students by programme level
+      - q: prefix search over names, user IDs and index numbers
+      - limit / offset: page through the matches (default: all)
     """
     if not is_user_or_admin():
         return jsonify({"error": "Access denied"}), 403
@@ -450,62 +775,53 @@ def get_users():
     role = request.args.get('role')
     programme = request.args.get('programme')
     level = request.args.get('level')
+    q, limit, offset = directory_page_args()
 
     # Allow querying teachers, students, and admins
     if role not in ['teacher', 'student', 'admin']:
         return jsonify([])
 
+    # Served from the in-memory directory, excluding the current user
+    search = dict(query=q, limit=limit, offset=offset, exclude=getattr(current_user, 'public_id', None))
+
     if role == 'admin':
-        # Get all admins except current user
-        users = Admin.query.filter(
-            Admin.public_id != current_user.public_id
-        ).order_by(Admin.username).all() if hasattr(current_user, 'public_id') else []
-        
-        # Build response for admins
+        admins, _ = user_directory.search(role='admin', **search)
         return jsonify([
             {
-                "id": u.public_id,
-                "name": f"{u.username} ({u.role.replace('_', ' ').title()})"
+                "id": a.public_id,
+                "name": f"{a.name} ({a.role.replace('_', ' ').title()})"
             }
-            for u in users
+            for a in admins
         ])
 
     elif role == 'teacher':
-        # Get all teachers except current user
-        users = User.query.filter(
-            User.role == 'teacher',
-            User.id != current_user.id
-        ).order_by(User.first_name, User.last_name).all()
+        users, _ = user_directory.search(role='teacher', **search)
     
     else:  # role == 'student'
-        # ✅ FIXED: Query students through StudentProfile
-        # Join User with StudentProfile to filter by programme and level
-        query = db.session.query(User).join(
-            StudentProfile,
-            User.user_id == StudentProfile.user_id
-        ).filter(
-            User.role == 'student',
-            User.id != current_user.id
-        )
-        
-        # Filter by programme if provided
-        if programme:
-            query = query.filter(StudentProfile.current_programme == programme)
-        
-        # Filter by level if provided
+        # Students with a StudentProfile, optionally in a programme and level
+        level_int = None
         if level:
             try:
                 level_int = int(level)
-                query = query.filter(StudentProfile.programme_level == level_int)
             except (ValueError, TypeError):
                 pass
-        
-        users = query.order_by(User.first_name, User.last_name).all()
+
+        if programme:
+            users, _ = user_directory.search(
+                programme=programme, level=level_int,
+                predicate=lambda e: e.role == 'student', **search
+            )
+        else:
+            users, _ = user_directory.search(
+                role='student',
+                predicate=lambda e: e.programme is not None and (level_int is None or e.level == level_int),
+                **search
+            )
 
     return jsonify([
         {
             "id": u.public_id,
-            "name": u.full_name
+            "name": u.name
         }
         for u in users
     ])
@@ -543,14 +859,10 @@ def edit_message(conv_id, msg_id):
     conv.updated_at = datetime.utcnow()
     db.session.commit()
 
-    for p in conv.participants:
-        socketio.emit(
-            'message_edited',
-            {"conversation_id": conv.id, "message": msg.to_dict()},
-            room=f"user_{p.user_public_id}"
-        )
+    message = serialize_messages([msg])[0]
+    emit_to_conversation('message_edited', {"conversation_id": conv.id, "message": message}, conv.id)
 
-    return jsonify({"success": True, "message": msg.to_dict()}), 200
+    return jsonify({"success": True, "message": message}), 200
 
 @chat_bp.route('/conversations/<int:conv_id>/messages/<int:msg_id>/delete', methods=['POST'])
 @login_required
@@ -580,12 +892,7 @@ def delete_message(conv_id, msg_id):
     conv.updated_at = datetime.utcnow()
     db.session.commit()
 
-    for p in conv.participants:
-        socketio.emit(
-            'message_deleted',
-            {"conversation_id": conv.id, "message_id": msg.id},
-            room=f"user_{p.user_public_id}"
-        )
+    emit_to_conversation('message_deleted', {"conversation_id": conv.id, "message_id": msg.id}, conv.id)
 
     return jsonify({"success": True}), 200
 
@@ -649,15 +956,10 @@ def add_reaction(conv_id, msg_id):
     db.session.add(reaction)
     db.session.commit()
 
-    participants = ConversationParticipant.query.filter_by(conversation_id=conv_id).all()
-    for p in participants:
-        socketio.emit(
-            "reaction_added",
-            {"message_id": msg_id, "reaction": reaction.to_dict()},
-            room=f"user_{p.user_public_id}"
-        )
+    reaction_data = reaction.to_dict()
+    emit_to_conversation("reaction_added", {"message_id": msg_id, "reaction": reaction_data}, conv_id)
 
-    return jsonify({"success": True, "reaction": reaction.to_dict()}), 200
+    return jsonify({"success": True, "reaction": reaction_data}), 200
 
 @chat_bp.route('/conversations/<int:conv_id>/messages/<int:msg_id>/react', methods=['DELETE'])
 @login_required
@@ -687,13 +989,11 @@ def remove_reaction(conv_id, msg_id):
     db.session.delete(reaction)
     db.session.commit()
 
-    participants = ConversationParticipant.query.filter_by(conversation_id=conv_id).all()
-    for p in participants:
-        socketio.emit(
-            "reaction_removed",
-            {"message_id": msg_id, "user_public_id": current_user.public_id, "emoji": emoji},
-            room=f"user_{p.user_public_id}"
-        )
+    emit_to_conversation(
+        "reaction_removed",
+        {"message_id": msg_id, "user_public_id": current_user.public_id, "emoji": emoji},
+        conv_id
+    )
 
     return jsonify({"success": True}), 200
 
@@ -745,18 +1045,14 @@ def forward_message(conv_id, msg_id):
     )
 
     db.session.add(new_msg)
-    target_conv.updated_at = datetime.utcnow()
+    record_new_message(target_conv, new_msg)
     db.session.commit()
 
-    for p in target_conv.participants:
-        socketio.emit(
-            'new_message',
-            {
-                "conversation_id": target_conv.id,
-                "message": new_msg.to_dict()
-            },
-            room=f"user_{p.user_public_id}"
-        )
+    payload = {
+        "conversation_id": target_conv.id,
+        "message": serialize_messages([new_msg])[0]
+    }
+    emit_to_conversation('new_message', payload, target_conv.id)
 
     return jsonify({"success": True}), 200
 
@@ -770,9 +1066,9 @@ def create_group():
     
     data = request.get_json() or {}
     name = data.get('name', '').strip()
-    members = data.get('members', [])
+    selector, error = member_selector(data)
 
-    if not name or not members:
+    if not name or error:
         return jsonify({'error': 'Invalid input'}), 400
 
     conv = Conversation(type='group')
@@ -786,14 +1082,14 @@ def create_group():
     db.session.flush()
 
     add_participant_if_not_exists(conv.id, current_user)
-
-    for pub_id in members:
-        person, role = resolve_person_by_public_id(pub_id)
-        if person and role in ["teacher", "student"]:
-            add_participant_if_not_exists(conv.id, person, role)
+    db.session.flush()
+    added = add_group_members(conv.id, **selector)
 
     db.session.commit()
 
+    sync_conversation_room(conv.id, [current_user.public_id])
+    announce_new_members(conv.id, added)
+
     return jsonify(conversation_to_dict(conv, current_user.public_id)), 200
 
 @chat_bp.route('/groups/<int:conv_id>/rename', methods=['POST'])
@@ -842,9 +1138,11 @@ def add_group_member(conv_id):
     if role not in ["teacher", "student"]:
         return jsonify({"error": "Can only add teachers and students"}), 403
 
-    add_participant_if_not_exists(conv_id, person, role)
+    added = add_group_members(conv_id, public_ids=[person.public_id])
     db.session.commit()
 
+    announce_new_members(conv_id, added)
+
     return jsonify({"success": True})
 
 @chat_bp.route('/groups/<int:conv_id>/remove_member', methods=['POST'])
@@ -867,6 +1165,7 @@ def remove_group_member(conv_id):
     ).delete()
 
     db.session.commit()
+    sync_conversation_room(conv_id, [pub_id], join=False)
     return jsonify({"success": True})
 
 @chat_bp.route('/conversations/<int:conv_id>/messages', methods=['POST'])
@@ -910,26 +1209,25 @@ def post_conversation_message(conv_id):
     )
 
     db.session.add(msg)
-    conv.updated_at = datetime.utcnow()
+    record_new_message(conv, msg)
     db.session.commit()
 
-    for p in conv.participants:
-        socketio.emit(
-            'new_message',
-            {"conversation_id": conv.id, "message": msg.to_dict()},
-            room=f"user_{p.user_public_id}"
-        )
+    message = serialize_messages([msg])[0]
+    emit_to_conversation('new_message', {"conversation_id": conv.id, "message": message}, conv.id)
 
     return jsonify({
         "success": True,
         "conversation_id": conv.id,
-        "message": msg.to_dict()
+        "message": message
     }), 200
 
 @chat_bp.route('/conversations/<int:conv_id>/add_members', methods=['POST'])
 @login_required
 def add_members_to_group(conv_id):
-    """Add multiple members to a group conversation."""
+    """
+    Add multiple members to a group conversation. Body: {"members": [public_id, ...]}
+    or a whole cohort with {"programme": ..., "level": ...}.
+    """
     if not is_user_or_admin():
         return jsonify({"success": False, "error": "Access denied"}), 403
     
@@ -937,43 +1235,25 @@ def add_members_to_group(conv_id):
     if conv.type != 'group':
         return jsonify({"success": False, "error": "Not a group conversation"}), 400
 
-    is_participant = any(p.user_public_id == current_user.public_id for p in conv.participants)
+    is_participant = ConversationParticipant.query.filter_by(
+        conversation_id=conv_id,
+        user_public_id=current_user.public_id
+    ).first() is not None
     if not is_participant:
         return jsonify({"success": False, "error": "Access denied"}), 403
 
-    data = request.get_json()
-    member_ids = data.get('members', [])
-    if not member_ids:
-        return jsonify({"success": False, "error": "No members specified"}), 400
-
-    added = []
-    for user_id in member_ids:
-        person, role = resolve_person_by_public_id(str(user_id))
-        if not person:
-            continue
-        
-        if role not in ["teacher", "student"]:
-            continue
-        
-        exists = ConversationParticipant.query.filter_by(
-            conversation_id=conv_id,
-            user_public_id=str(user_id)
-        ).first()
-        if not exists:
-            db.session.add(ConversationParticipant(
-                conversation_id=conv_id,
-                user_public_id=str(user_id),
-                user_role=role
-            ))
-            added.append(str(user_id))
+    data = request.get_json(silent=True) or {}
+    selector, error = member_selector(data)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
 
+    added = add_group_members(conv_id, **selector)
     db.session.commit()
 
-    added_names = []
-    for uid in added:
-        person, _ = resolve_person_by_public_id(uid)
-        if person:
-            added_names.append(getattr(person, 'full_name', getattr(person, 'username', uid)))
+    announce_new_members(conv.id, added)
+
+    added_identities = identity_cache.get_many(added)
+    added_names = [added_identities[uid].name for uid in added if uid in added_identities]
 
     if added_names:
         msg = Message(
@@ -983,14 +1263,14 @@ def add_members_to_group(conv_id):
             content=f"{getattr(current_user, 'full_name', getattr(current_user, 'username', 'Someone'))} added {', '.join(added_names)} to the group"
         )
         db.session.add(msg)
+        record_new_message(conv, msg)
         db.session.commit()
 
-        for p in conv.participants:
-            socketio.emit(
-                'new_message',
-                {"conversation_id": conv.id, "message": msg.to_dict()},
-                room=f"user_{p.user_public_id}"
-            )
+        emit_to_conversation(
+            'new_message',
+            {"conversation_id": conv.id, "message": serialize_messages([msg])[0]},
+            conv.id
+        )
 
     return jsonify({"success": True, "added": added}), 200
 
@@ -1016,6 +1296,10 @@ def mark_conversation_unread(conv_id):
     
     # Set last_read_at to before all messages to mark as unread
     participant.last_read_at = datetime.min
+    participant.unread_count = Message.query.filter(
+        Message.conversation_id == conv_id,
+        Message.sender_public_id != current_user.public_id
+    ).count()
     db.session.commit()
     
     return jsonify({"success": True})
@@ -1038,6 +1322,7 @@ def mark_conversation_read(conv_id):
     
     # Set last_read_at to now
     participant.last_read_at = datetime.utcnow()
+    participant.unread_count = 0
     db.session.commit()
     
     return jsonify({"success": True})
@@ -1259,12 +1544,35 @@ def delete_conversation(conv_id):
         conversation_id=conv_id
     ).count()
     
+    if conv.type == 'direct':
+        # The pair no longer shares this conversation; a new message starts a fresh DM
+        conv.direct_key = None
+
     if remaining_participants == 0:
         # Delete all messages
         Message.query.filter_by(conversation_id=conv_id).delete()
+        ArchivedMessage.query.filter_by(conversation_id=conv_id).delete()
         # Delete conversation
         db.session.delete(conv)
     
     db.session.commit()
+    sync_conversation_room(conv_id, [current_user.public_id], join=False)
     
     return jsonify({"success": True})
+
+
+# ========================================
+# CLI: flask --app app chat archive
+# ========================================
+
+@chat_bp.cli.command('archive')
+@click.option('--older-than-days', type=int, default=None, help='Archive messages older than this (default: CHAT_ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Messages moved per transaction (default: CHAT_ARCHIVE_BATCH_SIZE).')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+def archive_messages_command(older_than_days, batch_size, max_batches):
+    """Move old chat messages into the compressed archive table."""
+    stats = archive_old_messages(older_than_days=older_than_days, batch_size=batch_size, max_batches=max_batches)
+    click.echo(
+        f"Archived {stats['messages']} messages and {stats['reactions']} reactions older than "
+        f"{stats['cutoff']} in {stats['batches']} batches ({stats['seconds']}s)"
+    )
@@ -63,6 +63,59 @@ class Config:
         MAIL_USERNAME
     )
 
+    # ------------------------------------------------------
+    # CHAT PRESENCE (memory | redis)
+    # ------------------------------------------------------
+    REDIS_URL = os.environ.get("REDIS_URL") or None
+    PRESENCE_BACKEND = os.environ.get("PRESENCE_BACKEND", "redis" if REDIS_URL else "memory")
+    PRESENCE_REDIS_URL = os.environ.get("PRESENCE_REDIS_URL") or REDIS_URL
+    PRESENCE_TTL_SECONDS = int(os.environ.get("PRESENCE_TTL_SECONDS", 90))
+    # Presence changes go to contacts/watchers in batches (utils/presence_fanout.py)
+    PRESENCE_FLUSH_SECONDS = float(os.environ.get("PRESENCE_FLUSH_SECONDS", 1))
+    # last_seen is written behind in batches (utils/last_seen.py)
+    LAST_SEEN_FLUSH_SECONDS = float(os.environ.get("LAST_SEEN_FLUSH_SECONDS", 5))
+    LAST_SEEN_BATCH_SIZE = int(os.environ.get("LAST_SEEN_BATCH_SIZE", 500))
+
+    # Process-wide public_id -> identity cache (utils/identity_cache.py)
+    IDENTITY_CACHE_SIZE = int(os.environ.get("IDENTITY_CACHE_SIZE", 4096))
+    IDENTITY_CACHE_TTL_SECONDS = float(os.environ.get("IDENTITY_CACHE_TTL_SECONDS", 300))
+
+    # Recipient picker directory index (utils/user_directory.py)
+    DIRECTORY_TTL_SECONDS = float(os.environ.get("DIRECTORY_TTL_SECONDS", 300))
+
+    # Compiled grading scale cache (utils/grading_scale.py)
+    GRADING_SCALE_TTL_SECONDS = float(os.environ.get("GRADING_SCALE_TTL_SECONDS", 300))
+    # Changed scores are regraded in the background after this window (utils/grade_recompute.py)
+    GRADE_RECOMPUTE_DELAY_SECONDS = float(os.environ.get("GRADE_RECOMPUTE_DELAY_SECONDS", 2))
+    # ... and a course that keeps failing has its marks dropped after this many tries
+    GRADE_RECOMPUTE_MAX_ATTEMPTS = int(os.environ.get("GRADE_RECOMPUTE_MAX_ATTEMPTS", 5))
+    # Semester recalculation job (services/parallel_recalculation.py)
+    GRADING_JOB_WORKERS = int(os.environ.get("GRADING_JOB_WORKERS", 4))
+    GRADING_JOB_STALE_SECONDS = float(os.environ.get("GRADING_JOB_STALE_SECONDS", 900))
+    # Email copies of the "results released" notification (one per student per release)
+    RESULT_RELEASE_EMAILS = os.environ.get("RESULT_RELEASE_EMAILS", "false").lower() in ("1", "true", "yes")
+    # Class results and other semester aggregates (utils/semester_cache.py)
+    SEMESTER_CACHE_TTL_SECONDS = float(os.environ.get("SEMESTER_CACHE_TTL_SECONDS", 300))
+    # /health/metrics: admins, or callers sending this in X-Metrics-Token (unset: admins only)
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+
+    # ------------------------------------------------------
+    # CHAT ARCHIVE (flask --app app chat archive)
+    # ------------------------------------------------------
+    CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get("CHAT_ARCHIVE_AFTER_DAYS", 180))
+    CHAT_ARCHIVE_BATCH_SIZE = int(os.environ.get("CHAT_ARCHIVE_BATCH_SIZE", 1000))
+
+    # ------------------------------------------------------
+    # SOCKET.IO (multi-worker deployments, see gunicorn.conf.py)
+    # ------------------------------------------------------
+    # Shared queue so emits from one worker reach clients on the others:
+    # redis://..., amqp://... (Kombu) or unset for a single worker.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or REDIS_URL
+    SOCKETIO_CHANNEL = os.environ.get("SOCKETIO_CHANNEL", "lms-socketio")
+    # Client transports, e.g. "websocket" to skip long-polling when the
+    # load balancer cannot pin a client to one worker (sticky sessions).
+    SOCKETIO_TRANSPORTS = os.environ.get("SOCKETIO_TRANSPORTS", "")
+
     # ------------------------------------------------------
     # ZOOM (OPTIONAL)
     # ------------------------------------------------------
@@ -0,0 +1,40 @@
+"""
+Gunicorn settings for the production web process (Procfile / render.yaml).
+
+Socket.IO needs an async worker. With more than one worker, emits are
+shared through SOCKETIO_MESSAGE_QUEUE and presence through the Redis
+presence backend, and every client must keep talking to the same worker:
+either a load balancer with sticky sessions, or SOCKETIO_TRANSPORTS=websocket
+so each client holds a single connection. gunicorn's own dispatch is not
+sticky, so WEB_CONCURRENCY > 1 needs websocket-only clients.
+See DEPLOY_RENDER.md ("Scaling chat / Socket.IO").
+
+Environment:
+  PORT                   listen port (default 5000)
+  WEB_CONCURRENCY        number of worker processes (default 1)
+  GUNICORN_WORKER_CLASS  eventlet (default) or gevent-websocket's
+                         geventwebsocket.gunicorn.workers.GeventWebSocketWorker
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "eventlet")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+
+# Tell app.py which async mode the worker has already set up
+os.environ.setdefault("SOCKETIO_ASYNC_MODE", "gevent" if "gevent" in worker_class else "eventlet")
+
+if workers > 1:
+    if not (os.environ.get("SOCKETIO_MESSAGE_QUEUE") or os.environ.get("REDIS_URL")):
+        raise RuntimeError(
+            "WEB_CONCURRENCY > 1 requires SOCKETIO_MESSAGE_QUEUE (or REDIS_URL) "
+            "so Socket.IO emits reach clients connected to other workers"
+        )
+    if os.environ.get("SOCKETIO_TRANSPORTS", "").strip() != "websocket":
+        raise RuntimeError(
+            "WEB_CONCURRENCY > 1 requires SOCKETIO_TRANSPORTS=websocket: gunicorn "
+            "does not pin long-polling clients to one worker"
+        )
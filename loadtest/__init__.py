@@ -0,0 +1,15 @@
+"""
+Chat load and fan-out checks.
+
+These scripts start real app workers (python -m loadtest.worker) against a
+throwaway database and drive them with python-socketio clients. They are
+run by hand or in CI, e.g.:
+
+    python -m loadtest.fanout --workers 2 --clients 40
+    python -m loadtest.presence --clients 200
+    python -m loadtest.chat --clients 200 --rate 20 --duration 30
+
+Extra dependencies (not needed by the app itself): websocket-client for
+the simulated clients, and fakeredis as the local Redis stand-in when no
+--queue URL is given.
+"""
@@ -0,0 +1,235 @@
+"""
+Chat load generator.
+
+Starts instrumented app workers (loadtest/instrument.py) on a seeded
+scratch database and drives them with simulated users: every user joins
+over Socket.IO, random users send group messages at a fixed overall rate,
+and receivers react to and mark read a share of what they get over HTTP.
+
+Reports send->receive latency percentiles, HTTP action latency, frames
+emitted per event, DB queries and handler time per socket event / HTTP
+endpoint, and worker CPU.
+
+    python -m loadtest.chat --clients 200 --group-size 50 --rate 20 --duration 30
+    python -m loadtest.chat --workers 2 --queue redis://localhost:6379/0 --json out.json
+
+Exits non-zero if messages were not delivered to every group member.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from loadtest.common import (
+    WorkerPool, configure_environment, create_chat_tables, mint_session,
+    percentile, seed_group, start_fake_redis,
+)
+from loadtest.fanout import connect_client
+from loadtest.presence import disconnect_all
+
+
+class SimulatedUser:
+    """One user: a Socket.IO client plus an HTTP session sharing its login."""
+
+    def __init__(self, public_id, conv_id, url, cookie, csrf_token):
+        self.public_id = public_id
+        self.conv_id = conv_id
+        self.url = url
+        self.http = requests.Session()
+        self.http.headers.update({"X-CSRFToken": csrf_token, "Cookie": f"session={cookie}"})
+        self.socket = connect_client(url, cookie)
+
+    def post(self, path, payload):
+        return self.http.post(f"{self.url}{path}", json=payload, timeout=30)
+
+
+def summarize(values):
+    if not values:
+        return "n/a"
+    return "p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f} ms".format(
+        *(percentile(values, p) * 1000 for p in (50, 95, 99)), max(values) * 1000)
+
+
+def merge_worker_stats(per_worker):
+    handlers = defaultdict(lambda: {"calls": 0, "queries": 0, "seconds": 0.0})
+    frames = defaultdict(int)
+    for stats in per_worker:
+        for key, h in stats["handlers"].items():
+            for field in ("calls", "queries", "seconds"):
+                handlers[key][field] += h[field]
+        for name, count in stats["frames"].items():
+            frames[name] += count
+    return handlers, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat load generator")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--group-size", type=int, default=25, help="users per group conversation")
+    parser.add_argument("--rate", type=float, default=5.0, help="messages per second, all users together")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    parser.add_argument("--react", type=float, default=0.05, help="chance a receiver reacts to a message")
+    parser.add_argument("--read", type=float, default=0.2, help="chance a receiver marks the conversation read")
+    parser.add_argument("--http-threads", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--queue", help="message queue URL (default: local fakeredis)")
+    parser.add_argument("--database-url", help="scratch database (default: temp SQLite file)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    queue_url = args.queue or start_fake_redis()
+    configure_environment(args.database_url, queue_url, presence_backend="redis" if queue_url.startswith("redis") else None)
+
+    from app import app
+
+    create_chat_tables(app)
+    groups = []
+    for start in range(0, args.clients, args.group_size):
+        size = min(args.group_size, args.clients - start)
+        groups.append(seed_group(app, size, name=f"Load group {len(groups) + 1}"))
+    sessions = {pub: mint_session(app, pub) for pubs, _ in groups for pub in pubs}
+
+    rng = random.Random(args.seed)
+    lock = threading.Lock()
+    sent = {}                        # seq -> (sent_at, expected deliveries)
+    delivered = defaultdict(int)     # seq -> deliveries
+    latencies = []
+    http_latencies = defaultdict(list)
+    http_errors = defaultdict(int)
+    all_delivered = threading.Event()
+    sending_done = threading.Event()
+
+    def http_action(user, kind, path, payload):
+        started = time.time()
+        try:
+            ok = user.post(path, payload).ok
+        except requests.RequestException:
+            ok = False
+        with lock:
+            if ok:
+                http_latencies[kind].append(time.time() - started)
+            else:
+                http_errors[kind] += 1
+
+    with WorkerPool(args.workers, instrument=True) as pool, \
+            ThreadPoolExecutor(max_workers=args.http_threads) as http_pool:
+        users = []
+        for pubs, conv_id in groups:
+            for pub in pubs:
+                cookie, csrf_token = sessions[pub]
+                users.append(SimulatedUser(pub, conv_id, pool.urls[len(users) % args.workers], cookie, csrf_token))
+
+        def on_new_message(data, user):
+            body = data["message"]["content"].split()
+            if len(body) != 3 or body[0] != "lt":
+                return
+            seq = int(body[1])
+            now = time.time()
+            with lock:
+                latencies.append(now - float(body[2]))
+                delivered[seq] += 1
+                if sending_done.is_set() and all(delivered[s] >= n for s, (_, n) in sent.items()):
+                    all_delivered.set()
+                react = rng.random() < args.react
+                read = rng.random() < args.read
+            if data["message"]["sender_public_id"] == user.public_id:
+                return
+            conv_id, msg_id = data["conversation_id"], data["message"]["id"]
+            if react:
+                http_pool.submit(http_action, user, "react",
+                                 f"/chat/conversations/{conv_id}/messages/{msg_id}/react", {"emoji": "👍"})
+            if read:
+                http_pool.submit(http_action, user, "mark_read", "/chat/mark_read", {"conversation_id": conv_id})
+
+        join_started = time.time()
+        for user in users:
+            user.socket.on("new_message", lambda data, user=user: on_new_message(data, user))
+            user.socket.call("join", {"user_id": user.public_id}, timeout=args.timeout)
+        join_seconds = time.time() - join_started
+
+        pool.stats(reset=True)
+        group_sizes = {conv_id: len(pubs) for pubs, conv_id in groups}
+        started = time.time()
+        seq = 0
+        while time.time() - started < args.duration:
+            user = rng.choice(users)
+            with lock:
+                sent[seq] = (time.time(), group_sizes[user.conv_id])
+            user.socket.emit("send_message", {
+                "conversation_id": user.conv_id,
+                "message": f"lt {seq} {time.time():.6f}",
+            })
+            seq += 1
+            time.sleep(max(0.0, started + seq / args.rate - time.time()))
+        send_seconds = time.time() - started
+
+        with lock:
+            sending_done.set()
+            if all(delivered[s] >= n for s, (_, n) in sent.items()):
+                all_delivered.set()
+        all_delivered.wait(args.timeout)
+        http_pool.shutdown(wait=True)
+        time.sleep(0.5)  # let trailing emits land in the worker counters
+        worker_stats = pool.stats()
+
+        disconnect_all([user.socket for user in users])
+
+    expected = sum(n for _, n in sent.values())
+    received = sum(delivered.values())
+    handlers, frames = merge_worker_stats(worker_stats)
+    messages = len(sent)
+
+    print(f"workers={args.workers} clients={args.clients} groups={len(groups)} "
+          f"rate={args.rate}/s duration={args.duration}s queue={queue_url}")
+    print(f"joined {len(users)} clients in {join_seconds:.2f}s")
+    print(f"sent {messages} messages in {send_seconds:.2f}s; delivered {received}/{expected}")
+    print(f"send->receive latency: {summarize(latencies)}")
+    for kind in sorted(set(http_latencies) | set(http_errors)):
+        print(f"{kind}: {len(http_latencies[kind])} ok, {http_errors[kind]} failed; {summarize(http_latencies[kind])}")
+
+    print("\nserver handlers (all workers):")
+    width = max([len(key) for key in handlers] + [7])
+    print(f"  {'handler':<{width}} {'calls':>7} {'queries/call':>13} {'ms/call':>9}")
+    for key, h in sorted(handlers.items(), key=lambda item: -item[1]["calls"]):
+        print(f"  {key:<{width}} {h['calls']:>7} {h['queries'] / h['calls']:>13.2f} {h['seconds'] * 1000 / h['calls']:>9.2f}")
+
+    print("\nframes emitted:")
+    for name, count in sorted(frames.items(), key=lambda item: -item[1]):
+        per_message = f" ({count / messages:.1f} per message)" if messages else ""
+        print(f"  {name:<24} {count:>8}{per_message}")
+
+    print("\nworker CPU:")
+    for i, stats in enumerate(worker_stats):
+        wall = stats["wall_seconds"] or 1
+        print(f"  worker {i}: {stats['cpu_seconds']:.2f}s CPU over {wall:.1f}s "
+              f"({100 * stats['cpu_seconds'] / wall:.0f}%), "
+              f"{stats['queries_outside_handlers']} background queries")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({
+                "args": vars(args),
+                "messages": messages,
+                "deliveries": {"expected": expected, "received": received},
+                "latency_ms": {f"p{p}": percentile(latencies, p) * 1000 for p in (50, 95, 99)} if latencies else None,
+                "http": {k: {"ok": len(v), "failed": http_errors[k]} for k, v in http_latencies.items()},
+                "handlers": handlers,
+                "frames": frames,
+                "workers": worker_stats,
+            }, fh, indent=2)
+
+    ok = received == expected
+    print("\nOK" if ok else "\nFAILED: missing deliveries")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Shared helpers for the load-test scripts: throwaway environment, worker
+processes, database seeding and pre-authenticated client sessions.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOADTEST_SECRET_KEY = "loadtest-secret-key"
+
+# Tables the chat stack touches; created directly so a scratch database
+# does not depend on the rest of the schema.
+CHAT_TABLES = (
+    "admin",
+    "user",
+    "student_profile",
+    "conversation",
+    "conversation_participant",
+    "message",
+    "message_reaction",
+    "message_archive",
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_redis():
+    """Serve a fakeredis instance over TCP in a daemon thread; returns its URL."""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        raise SystemExit("fakeredis is required when no --queue URL is given (pip install fakeredis)")
+
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def configure_environment(database_url=None, queue_url=None, presence_backend=None):
+    """
+    Point the app (this process and spawned workers) at a scratch database
+    and the shared queue. Must run before `app` is imported.
+    """
+    if not database_url:
+        fd, path = tempfile.mkstemp(prefix="lms-loadtest-", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{path}"
+
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["SECRET_KEY"] = LOADTEST_SECRET_KEY
+    if queue_url:
+        os.environ["SOCKETIO_MESSAGE_QUEUE"] = queue_url
+    if presence_backend:
+        os.environ["PRESENCE_BACKEND"] = presence_backend
+        if presence_backend == "redis" and queue_url and queue_url.startswith("redis"):
+            os.environ.setdefault("PRESENCE_REDIS_URL", queue_url)
+    return database_url
+
+
+def create_chat_tables(app):
+    from utils.extensions import db
+
+    with app.app_context():
+        tables = [db.metadata.tables[name] for name in CHAT_TABLES if name in db.metadata.tables]
+        db.metadata.create_all(db.engine, tables=tables)
+
+
+def seed_group(app, n_users, name="Load test group"):
+    """Create n student users and one group conversation containing all of them."""
+    from models import Conversation, ConversationParticipant, User
+    from utils.extensions import db
+
+    tag = uuid.uuid4().hex[:6]
+    with app.app_context():
+        users = []
+        for i in range(n_users):
+            u = User(
+                user_id=f"LT{tag}{i:04d}",
+                username=f"lt_{tag}_{i}",
+                email=f"lt_{tag}_{i}@loadtest.local",
+                first_name="Load",
+                last_name=f"User{i}",
+                role="student",
+            )
+            u.password_hash = "!"
+            users.append(u)
+        db.session.add_all(users)
+        db.session.flush()
+
+        conv = Conversation(type="group")
+        conv.set_meta({"name": name, "created_by": users[0].public_id, "admins": [users[0].public_id]})
+        db.session.add(conv)
+        db.session.flush()
+        db.session.add_all([
+            ConversationParticipant(conversation_id=conv.id, user_public_id=u.public_id, user_role="student")
+            for u in users
+        ])
+        db.session.commit()
+        return [u.public_id for u in users], conv.id
+
+
+def seed_direct_conversations(app, pairs):
+    """Create one direct conversation per (public_id, public_id) pair."""
+    from models import Conversation, ConversationParticipant
+    from utils.extensions import db
+
+    with app.app_context():
+        convs = [Conversation(type="direct", direct_key=Conversation.direct_key_for(*pair)) for pair in pairs]
+        db.session.add_all(convs)
+        db.session.flush()
+        db.session.add_all([
+            ConversationParticipant(conversation_id=conv.id, user_public_id=pub, user_role="student")
+            for conv, pair in zip(convs, pairs)
+            for pub in pair
+        ])
+        db.session.commit()
+        return [conv.id for conv in convs]
+
+
+def mint_session(app, public_id):
+    """
+    Return (session_cookie, csrf_token) for a logged-in user without going
+    through the login form.
+    """
+    from flask import session
+    from flask_login import login_user
+    from flask_wtf.csrf import generate_csrf
+    from models import User
+
+    with app.test_request_context():
+        login_user(User.query.filter_by(public_id=public_id).first())
+        csrf_token = generate_csrf()
+        serializer = app.session_interface.get_signing_serializer(app)
+        return serializer.dumps(dict(session)), csrf_token
+
+
+class WorkerPool:
+    """Start N app workers (python -m loadtest.worker) on free local ports."""
+
+    def __init__(self, count, startup_timeout=60, instrument=False):
+        self.count = count
+        self.startup_timeout = startup_timeout
+        self.instrument = instrument
+        self.ports = []
+        self.procs = []
+
+    def __enter__(self):
+        for _ in range(self.count):
+            port = free_port()
+            self.ports.append(port)
+            cmd = [sys.executable, "-m", "loadtest.worker", "--port", str(port)]
+            if self.instrument:
+                cmd.append("--instrument")
+            self.procs.append(subprocess.Popen(
+                cmd,
+                cwd=ROOT, env=os.environ.copy(),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+        for port, proc in zip(self.ports, self.procs):
+            self._wait_healthy(port, proc)
+        return self
+
+    def __exit__(self, *exc):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    @property
+    def urls(self):
+        return [f"http://127.0.0.1:{port}" for port in self.ports]
+
+    def stats(self, reset=False):
+        """Per-worker counters from instrumented workers (loadtest/instrument.py)."""
+        params = {"reset": 1} if reset else {}
+        return [requests.get(f"{url}/_loadtest/stats", params=params, timeout=10).json() for url in self.urls]
+
+    def _wait_healthy(self, port, proc):
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"worker on port {port} exited with code {proc.returncode}")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"worker on port {port} did not become healthy")
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
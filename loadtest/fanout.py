@@ -0,0 +1,114 @@
+"""
+Cross-worker Socket.IO fan-out check.
+
+Starts several app workers sharing one message queue, connects clients to
+them round-robin and has a few of them send group messages through the
+`send_message` socket event. Every participant must receive every message
+regardless of which worker it is connected to.
+
+    python -m loadtest.fanout --workers 2 --clients 40 --messages 20
+    python -m loadtest.fanout --queue redis://localhost:6379/0
+
+Without --queue a fakeredis TCP server is started as the Redis stand-in.
+Exits non-zero if any delivery is missing.
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+from loadtest.common import (
+    WorkerPool, configure_environment, create_chat_tables, mint_session,
+    percentile, seed_group, start_fake_redis,
+)
+
+
+def connect_client(url, cookie):
+    import socketio
+
+    client = socketio.Client(reconnection=False)
+    client.connect(url, headers={"Cookie": f"session={cookie}"}, transports=["websocket"])
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO cross-worker fan-out check")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--senders", type=int, default=2)
+    parser.add_argument("--messages", type=int, default=10, help="messages per sender")
+    parser.add_argument("--queue", help="message queue URL (default: local fakeredis)")
+    parser.add_argument("--database-url", help="scratch database (default: temp SQLite file)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    queue_url = args.queue or start_fake_redis()
+    configure_environment(args.database_url, queue_url, presence_backend="redis" if queue_url.startswith("redis") else None)
+
+    from app import app
+
+    create_chat_tables(app)
+    public_ids, conv_id = seed_group(app, args.clients, name="Fan-out check")
+    sessions = {pub: mint_session(app, pub)[0] for pub in public_ids}
+
+    expected = args.clients * args.senders * args.messages
+    lock = threading.Lock()
+    received = Counter()          # worker index -> deliveries
+    cross_worker = Counter()      # deliveries where sender and receiver were on different workers
+    latencies = []
+    done = threading.Event()
+
+    with WorkerPool(args.workers) as pool:
+        clients = []
+        for i, pub in enumerate(public_ids):
+            worker = i % args.workers
+            client = connect_client(pool.urls[worker], sessions[pub])
+
+            def on_new_message(data, worker=worker):
+                body = data["message"]["content"].split()
+                if len(body) != 4 or body[0] != "fanout":
+                    return
+                sender_worker, sent_at = int(body[2]), float(body[3])
+                with lock:
+                    received[worker] += 1
+                    if sender_worker != worker:
+                        cross_worker[worker] += 1
+                    latencies.append(time.time() - sent_at)
+                    if sum(received.values()) >= expected:
+                        done.set()
+
+            client.on("new_message", on_new_message)
+            client.call("join", {"user_id": pub}, timeout=args.timeout)  # acked once rooms are joined
+            clients.append((client, worker))
+
+        started = time.time()
+        for seq in range(args.messages):
+            for client, worker in clients[:args.senders]:
+                client.emit("send_message", {
+                    "conversation_id": conv_id,
+                    "message": f"fanout {seq} {worker} {time.time():.6f}",
+                })
+
+        done.wait(args.timeout)
+        elapsed = time.time() - started
+
+        for client, _ in clients:
+            client.disconnect()
+
+    total = sum(received.values())
+    print(f"workers={args.workers} clients={args.clients} queue={queue_url}")
+    print(f"delivered {total}/{expected} in {elapsed:.2f}s")
+    for worker in range(args.workers):
+        print(f"  worker {worker}: {received[worker]} received, {cross_worker[worker]} from other workers")
+    if latencies:
+        print("send->receive latency ms: p50={:.1f} p95={:.1f} p99={:.1f}".format(
+            *(percentile(latencies, p) * 1000 for p in (50, 95, 99))))
+
+    ok = total == expected and (args.workers == 1 or all(cross_worker[w] for w in range(args.workers)))
+    print("OK" if ok else "FAILED: missing deliveries")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Server-side counters for load-test workers (python -m loadtest.worker --instrument).
+
+Wraps the Socket.IO server and the database engine of one worker process
+and serves the totals at GET /_loadtest/stats (?reset=1 zeroes them):
+
+  - per socket event and per HTTP endpoint: calls, DB queries, handler time
+  - frames sent to clients, by event name (acks counted as 'ack')
+  - process CPU time and wall time since the last reset
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+
+_EVENT_NAME_RE = re.compile(r'^\d(?:/[^,]*,)?\d*\["([^"]+)"')
+
+
+class WorkerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.handlers = defaultdict(lambda: {"calls": 0, "queries": 0, "seconds": 0.0})
+            self.frames = defaultdict(int)
+            self.queries_outside_handlers = 0
+            self.cpu_started = time.process_time()
+            self.wall_started = time.time()
+
+    # Query counting is per thread: each socket event / request runs in its own
+    def count_query(self):
+        counter = getattr(self._local, "queries", None)
+        if counter is None:
+            with self._lock:
+                self.queries_outside_handlers += 1
+        else:
+            self._local.queries = counter + 1
+
+    def timed(self, key, fn, *args, **kwargs):
+        outer = getattr(self._local, "queries", None)
+        self._local.queries = 0
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.record(key, self._local.queries, time.perf_counter() - started)
+            self._local.queries = outer
+
+    def begin(self):
+        self._local.queries = 0
+        self._local.started = time.perf_counter()
+
+    def end(self, key):
+        queries = getattr(self._local, "queries", None)
+        if queries is None:
+            return
+        self.record(key, queries, time.perf_counter() - self._local.started)
+        self._local.queries = None
+
+    def record(self, key, queries, seconds):
+        with self._lock:
+            h = self.handlers[key]
+            h["calls"] += 1
+            h["queries"] += queries
+            h["seconds"] += seconds
+
+    def frame(self, name):
+        with self._lock:
+            self.frames[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "handlers": {k: dict(v) for k, v in self.handlers.items()},
+                "frames": dict(self.frames),
+                "queries_outside_handlers": self.queries_outside_handlers,
+                "cpu_seconds": round(time.process_time() - self.cpu_started, 3),
+                "wall_seconds": round(time.time() - self.wall_started, 3),
+            }
+
+
+def install(app, socketio):
+    """Instrument this worker's app and Socket.IO server; returns the WorkerStats."""
+    from flask import jsonify, request
+    from socketio import packet
+    from sqlalchemy import event
+    from utils.extensions import db
+
+    stats = WorkerStats()
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *args: stats.count_query())
+
+    server = socketio.server
+    trigger_event = server._trigger_event
+    send_packet = server._send_packet
+    send_eio_packet = server._send_eio_packet
+
+    def counted_trigger_event(event_name, namespace, *args):
+        return stats.timed(f"socket:{event_name}", trigger_event, event_name, namespace, *args)
+
+    def counted_send_packet(eio_sid, pkt):
+        if pkt.packet_type in (packet.EVENT, packet.BINARY_EVENT) and pkt.data:
+            stats.frame(pkt.data[0])
+        elif pkt.packet_type in (packet.ACK, packet.BINARY_ACK):
+            stats.frame("ack")
+        else:
+            stats.frame("control")
+        return send_packet(eio_sid, pkt)
+
+    def counted_send_eio_packet(eio_sid, eio_pkt):
+        match = _EVENT_NAME_RE.match(eio_pkt.data) if isinstance(eio_pkt.data, str) else None
+        stats.frame(match.group(1) if match else "other")
+        return send_eio_packet(eio_sid, eio_pkt)
+
+    server._trigger_event = counted_trigger_event
+    server._send_packet = counted_send_packet
+    server._send_eio_packet = counted_send_eio_packet
+
+    @app.before_request
+    def _loadtest_begin():
+        stats.begin()
+
+    @app.after_request
+    def _loadtest_end(response):
+        rule = request.url_rule.rule if request.url_rule else request.path
+        if not rule.startswith("/_loadtest"):
+            stats.end(f"http:{request.method} {rule}")
+        return response
+
+    @app.route("/_loadtest/stats")
+    def _loadtest_stats():
+        snapshot = stats.snapshot()
+        if request.args.get("reset"):
+            stats.reset()
+        return jsonify(snapshot)
+
+    return stats
@@ -0,0 +1,154 @@
+"""
+Presence fan-out benchmark.
+
+Simulates a login surge: every client connects (joins) within a short
+window, a share of them open the shared group conversation, then part of
+the class logs off. Each client counts the presence frames it receives
+and checks that it ends up with the correct online/offline state for its
+direct contacts.
+
+The frame count is compared with what the previous global
+`presence_update` broadcast would have produced for the same sequence
+(every change sent to every connected client).
+
+    python -m loadtest.presence --clients 200 --contacts 5 --watchers 20
+    python -m loadtest.presence --workers 2 --queue redis://localhost:6379/0
+
+Exits non-zero if any client ends with a wrong view of its contacts.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from loadtest.common import (
+    WorkerPool, configure_environment, create_chat_tables, mint_session,
+    seed_direct_conversations, seed_group, start_fake_redis,
+)
+from loadtest.fanout import connect_client
+
+
+def contact_graph(public_ids, contacts, seed):
+    """Random undirected graph giving each user about `contacts` DM partners."""
+    rng = random.Random(seed)
+    pairs = set()
+    for pub in public_ids:
+        others = [p for p in public_ids if p != pub]
+        # Each pair is shared by two users, so half the target per user
+        for other in rng.sample(others, min(max(1, contacts // 2), len(others))):
+            pairs.add(tuple(sorted((pub, other))))
+    return sorted(pairs)
+
+
+def disconnect_all(clients):
+    """Disconnect concurrently (each close waits for the server's close frame)."""
+    threads = [threading.Thread(target=client.disconnect) for client in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presence fan-out benchmark")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--contacts", type=int, default=5, help="direct contacts per user (approx.)")
+    parser.add_argument("--watchers", type=int, default=10, help="clients with the group conversation open")
+    parser.add_argument("--leave", type=float, default=0.5, help="share of clients that disconnect")
+    parser.add_argument("--flush-seconds", type=float, default=1.0, help="PRESENCE_FLUSH_SECONDS for the workers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--queue", help="message queue URL (default: local fakeredis)")
+    parser.add_argument("--database-url", help="scratch database (default: temp SQLite file)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    queue_url = args.queue or start_fake_redis()
+    configure_environment(args.database_url, queue_url, presence_backend="redis" if queue_url.startswith("redis") else None)
+    os.environ["PRESENCE_FLUSH_SECONDS"] = str(args.flush_seconds)
+
+    from app import app
+
+    create_chat_tables(app)
+    public_ids, group_id = seed_group(app, args.clients, name="Presence benchmark")
+    pairs = contact_graph(public_ids, args.contacts, args.seed)
+    seed_direct_conversations(app, pairs)
+    sessions = {pub: mint_session(app, pub)[0] for pub in public_ids}
+
+    contacts = {pub: set() for pub in public_ids}
+    for a, b in pairs:
+        contacts[a].add(b)
+        contacts[b].add(a)
+
+    lock = threading.Lock()
+    frames = Counter()    # public_id -> presence frames received
+    updates = Counter()   # public_id -> presence updates received
+    views = {pub: {} for pub in public_ids}  # public_id -> {other: status}
+
+    def on_batch(data, pub):
+        with lock:
+            frames[pub] += 1
+            for update in data.get("updates", []):
+                updates[pub] += 1
+                views[pub][update["user_public_id"]] = update["status"]
+
+    rng = random.Random(args.seed)
+    watchers = set(rng.sample(public_ids, min(args.watchers, len(public_ids))))
+    leavers = set(rng.sample(public_ids, int(len(public_ids) * args.leave)))
+
+    with WorkerPool(args.workers) as pool:
+        clients = {}
+        started = time.time()
+        for i, pub in enumerate(public_ids):
+            client = connect_client(pool.urls[i % args.workers], sessions[pub])
+            client.on("presence_batch", lambda data, pub=pub: on_batch(data, pub))
+            client.on("presence_update", lambda data, pub=pub: on_batch({"updates": [data]}, pub))
+            snapshot = client.call("join", {"user_id": pub}, timeout=args.timeout) or {}
+            with lock:
+                for other in snapshot.get("online", []):
+                    views[pub][other] = "online"
+            if pub in watchers:
+                client.call("presence_watch", {"conversation_id": group_id}, timeout=args.timeout)
+            clients[pub] = client
+        surge_seconds = time.time() - started
+        time.sleep(args.flush_seconds * 3)
+
+        disconnect_all([clients.pop(pub) for pub in leavers])
+        time.sleep(args.flush_seconds * 3)
+
+        with lock:
+            wrong = []
+            for pub in clients:
+                expected = {c: ("online" if c in clients else "offline") for c in contacts[pub]}
+                seen = {c: views[pub].get(c, "offline") for c in contacts[pub]}
+                if seen != expected:
+                    wrong.append(pub)
+            received_frames = sum(frames.values())
+            received_updates = sum(updates.values())
+
+        disconnect_all(clients.values())
+
+    # The global broadcast sent every change to every connected client,
+    # including the one that changed.
+    n, left = len(public_ids), len(leavers)
+    broadcast_frames = n * (n + 1) // 2 + sum(n - k for k in range(1, left + 1))
+
+    print(f"workers={args.workers} clients={n} contact pairs={len(pairs)} "
+          f"watchers={len(watchers)} leavers={left} flush={args.flush_seconds}s")
+    print(f"login surge: {n} joins in {surge_seconds:.2f}s")
+    print(f"presence frames received: {received_frames} ({received_updates} updates)")
+    print(f"global broadcast would send: {broadcast_frames} frames")
+    if received_frames:
+        print(f"reduction: {broadcast_frames / received_frames:.1f}x fewer frames")
+    print(f"clients with a wrong contact view: {len(wrong)}")
+
+    ok = not wrong
+    print("OK" if ok else "FAILED: stale presence")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""Run one app worker for load tests: python -m loadtest.worker --port 5101"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--instrument", action="store_true",
+                        help="count queries, frames and CPU (GET /_loadtest/stats, see loadtest/instrument.py)")
+    args = parser.parse_args()
+
+    from app import app, socketio
+
+    if args.instrument:
+        from loadtest.instrument import install
+        install(app, socketio)
+
+    socketio.run(app, host=args.host, port=args.port, debug=False,
+                 use_reloader=False, log_output=False, allow_unsafe_werkzeug=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Add composite index for paginated chat history
+
+Revision ID: 4a40f12dc1dc
+Revises: 0528bde5114b
+Create Date: 2026-10-17 09:12:44.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a40f12dc1dc'
+down_revision = '0528bde5114b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('idx_message_conv_created_id', ['conversation_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('idx_message_conv_created_id')
@@ -0,0 +1,62 @@
+"""Add student_gpa_summary table (materialized semester GPA / CGPA)
+
+Revision ID: 5b2e8f91c4d7
+Revises: 9d41c7b2e5a3
+Create Date: 2026-10-17 22:31:40.204117
+
+Existing grades are backfilled by upgrade() (the same rebuild as
+    flask --app app grading rebuild-gpa
+which can be re-run at any time).
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8f91c4d7'
+down_revision = '9d41c7b2e5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('student_gpa_summary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('academic_year', sa.String(length=20), nullable=False),
+    sa.Column('semester', sa.String(length=10), nullable=False),
+    sa.Column('courses_count', sa.Integer(), nullable=False),
+    sa.Column('credits_attempted', sa.Integer(), nullable=False),
+    sa.Column('credits_earned', sa.Integer(), nullable=False),
+    sa.Column('grade_points', sa.Float(), nullable=False),
+    sa.Column('quality_points', sa.Float(), nullable=False),
+    sa.Column('semester_gpa', sa.Float(), nullable=False),
+    sa.Column('cumulative_courses', sa.Integer(), nullable=False),
+    sa.Column('cumulative_credits_attempted', sa.Integer(), nullable=False),
+    sa.Column('cumulative_credits_earned', sa.Integer(), nullable=False),
+    sa.Column('cumulative_grade_points', sa.Float(), nullable=False),
+    sa.Column('cumulative_quality_points', sa.Float(), nullable=False),
+    sa.Column('cgpa', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'academic_year', 'semester', name='uq_student_gpa_summary')
+    )
+    with op.batch_alter_table('student_gpa_summary', schema=None) as batch_op:
+        batch_op.create_index('ix_student_gpa_summary_period', ['academic_year', 'semester', 'semester_gpa'], unique=False)
+
+    # Backfill from existing grades. GPAs need the grading scale fallback and
+    # chronological CGPA, so the app's rebuild() does it through its own
+    # session; commit the new table first so that session can see it.
+    if context.is_offline_mode():
+        return
+    with op.get_context().autocommit_block():
+        from services.gpa_summary_service import GPASummaryService
+        GPASummaryService.rebuild()
+
+
+def downgrade():
+    with op.batch_alter_table('student_gpa_summary', schema=None) as batch_op:
+        batch_op.drop_index('ix_student_gpa_summary_period')
+
+    op.drop_table('student_gpa_summary')
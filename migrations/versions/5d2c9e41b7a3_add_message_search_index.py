@@ -0,0 +1,27 @@
+"""Add full-text search index for chat messages
+
+Revision ID: 5d2c9e41b7a3
+Revises: 8bfa7dd9cb23
+Create Date: 2026-10-17 13:41:05.302117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.chat_search import ensure_message_search_index, drop_message_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2c9e41b7a3'
+down_revision = '8bfa7dd9cb23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite: FTS5 table + sync triggers (backfilled); Postgres: GIN index
+    ensure_message_search_index(op.get_bind())
+
+
+def downgrade():
+    drop_message_search_index(op.get_bind())
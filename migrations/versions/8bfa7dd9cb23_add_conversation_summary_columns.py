@@ -0,0 +1,58 @@
+"""Add conversation summary columns and per-participant unread counters
+
+Revision ID: 8bfa7dd9cb23
+Revises: 4a40f12dc1dc
+Create Date: 2026-10-17 10:03:27.551920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8bfa7dd9cb23'
+down_revision = '4a40f12dc1dc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('conversation_participant', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from existing history
+    op.execute("""
+        UPDATE conversation SET
+            last_message_id = (
+                SELECT m.id FROM message m
+                WHERE m.conversation_id = conversation.id
+                ORDER BY m.created_at DESC, m.id DESC
+                LIMIT 1
+            ),
+            last_message_at = (
+                SELECT MAX(m.created_at) FROM message m
+                WHERE m.conversation_id = conversation.id
+            )
+    """)
+    op.execute("""
+        UPDATE conversation_participant SET unread_count = (
+            SELECT COUNT(*) FROM message m
+            WHERE m.conversation_id = conversation_participant.conversation_id
+              AND m.sender_public_id != conversation_participant.user_public_id
+              AND (conversation_participant.last_read_at IS NULL
+                   OR m.created_at > conversation_participant.last_read_at)
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation_participant', schema=None) as batch_op:
+        batch_op.drop_column('unread_count')
+
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('last_message_at')
+        batch_op.drop_column('last_message_id')
@@ -0,0 +1,42 @@
+"""Add grading_job table for background semester recalculation
+
+Revision ID: 9d41c7b2e5a3
+Revises: c3f8a2d61e90
+Create Date: 2026-10-17 21:04:12.518330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41c7b2e5a3'
+down_revision = 'c3f8a2d61e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('grading_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('academic_year', sa.String(length=20), nullable=False),
+    sa.Column('semester', sa.String(length=10), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('started_by', sa.String(length=200), nullable=True),
+    sa.Column('workers', sa.Integer(), nullable=True),
+    sa.Column('total_courses', sa.Integer(), nullable=True),
+    sa.Column('completed_courses', sa.Integer(), nullable=True),
+    sa.Column('failed_courses', sa.Integer(), nullable=True),
+    sa.Column('rows_calculated', sa.Integer(), nullable=True),
+    sa.Column('course_timings', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('academic_year', 'semester', name='uq_grading_job_semester')
+    )
+
+
+def downgrade():
+    op.drop_table('grading_job')
@@ -0,0 +1,26 @@
+"""Add last_seen to admin
+
+Revision ID: b7e0c4d19f62
+Revises: 5d2c9e41b7a3
+Create Date: 2026-10-17 14:22:48.610395
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e0c4d19f62'
+down_revision = '5d2c9e41b7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('admin', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seen', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('admin', schema=None) as batch_op:
+        batch_op.drop_column('last_seen')
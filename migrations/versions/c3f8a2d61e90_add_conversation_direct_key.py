@@ -0,0 +1,108 @@
+"""Add canonical direct_key to conversations and merge duplicate DMs
+
+Revision ID: c3f8a2d61e90
+Revises: e41a6f0c8d27
+Create Date: 2026-10-17 18:22:47.913405
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.chat_search import ensure_message_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2d61e90'
+down_revision = 'e41a6f0c8d27'
+branch_labels = None
+depends_on = None
+
+
+def _merge_into(bind, survivor, duplicate):
+    """Move a duplicate DM's history and unread state into the surviving conversation."""
+    for table in ('message', 'message_archive'):
+        bind.execute(sa.text(
+            f"UPDATE {table} SET conversation_id = :survivor WHERE conversation_id = :duplicate"
+        ), {"survivor": survivor, "duplicate": duplicate})
+
+    dup_parts = bind.execute(sa.text(
+        "SELECT user_public_id, unread_count, last_read_at FROM conversation_participant "
+        "WHERE conversation_id = :duplicate"
+    ), {"duplicate": duplicate}).all()
+    for pub, unread, last_read in dup_parts:
+        bind.execute(sa.text(
+            "UPDATE conversation_participant SET unread_count = unread_count + :unread "
+            "WHERE conversation_id = :survivor AND user_public_id = :pub"
+        ), {"unread": unread or 0, "survivor": survivor, "pub": pub})
+        if last_read is not None:
+            bind.execute(sa.text(
+                "UPDATE conversation_participant SET last_read_at = :last_read "
+                "WHERE conversation_id = :survivor AND user_public_id = :pub "
+                "AND (last_read_at IS NULL OR last_read_at < :last_read)"
+            ), {"last_read": last_read, "survivor": survivor, "pub": pub})
+
+    bind.execute(sa.text(
+        "UPDATE conversation SET archived_through = ("
+        "  SELECT MAX(c.archived_through) FROM conversation c WHERE c.id IN (:survivor, :duplicate)"
+        ") WHERE id = :survivor"
+    ), {"survivor": survivor, "duplicate": duplicate})
+    bind.execute(sa.text("DELETE FROM conversation_participant WHERE conversation_id = :duplicate"),
+                 {"duplicate": duplicate})
+    bind.execute(sa.text("DELETE FROM conversation WHERE id = :duplicate"), {"duplicate": duplicate})
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('direct_key', sa.String(length=80), nullable=True))
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # Re-create the search trigger so moved messages are re-scoped in message_fts
+        bind.execute(sa.text("DROP TRIGGER IF EXISTS message_fts_au"))
+        ensure_message_search_index(bind)
+
+    members = {}
+    for conv_id, pub in bind.execute(sa.text(
+        "SELECT c.id, p.user_public_id FROM conversation c "
+        "JOIN conversation_participant p ON p.conversation_id = c.id "
+        "WHERE c.type = 'direct'"
+    )):
+        members.setdefault(conv_id, set()).add(pub)
+
+    # DMs a participant has left have one member and stay keyless
+    by_key = {}
+    for conv_id, pubs in members.items():
+        if len(pubs) == 2:
+            by_key.setdefault(":".join(sorted(pubs)), []).append(conv_id)
+
+    for key, conv_ids in by_key.items():
+        survivor, *duplicates = sorted(conv_ids)
+        for duplicate in duplicates:
+            _merge_into(bind, survivor, duplicate)
+        if duplicates:
+            bind.execute(sa.text("""
+                UPDATE conversation SET
+                    last_message_id = (
+                        SELECT m.id FROM message m
+                        WHERE m.conversation_id = conversation.id
+                        ORDER BY m.created_at DESC, m.id DESC
+                        LIMIT 1
+                    ),
+                    last_message_at = (
+                        SELECT MAX(m.created_at) FROM message m
+                        WHERE m.conversation_id = conversation.id
+                    )
+                WHERE id = :survivor
+            """), {"survivor": survivor})
+        bind.execute(sa.text("UPDATE conversation SET direct_key = :key WHERE id = :survivor"),
+                     {"key": key, "survivor": survivor})
+
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('uq_conversation_direct_key', ['direct_key'], unique=True)
+
+
+def downgrade():
+    # Merged duplicate DMs are not split back up
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('uq_conversation_direct_key')
+        batch_op.drop_column('direct_key')
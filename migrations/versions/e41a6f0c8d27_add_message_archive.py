@@ -0,0 +1,58 @@
+"""Add message_archive table for old chat history
+
+Revision ID: e41a6f0c8d27
+Revises: b7e0c4d19f62
+Create Date: 2026-10-17 15:06:31.774052
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a6f0c8d27'
+down_revision = 'b7e0c4d19f62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('sender_public_id', sa.String(length=36), nullable=False),
+    sa.Column('sender_role', sa.String(length=20), nullable=False),
+    sa.Column('content_z', sa.LargeBinary(), nullable=False),
+    sa.Column('reactions_z', sa.LargeBinary(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('reply_to_message_id', sa.Integer(), nullable=True),
+    sa.Column('edited_at', sa.DateTime(), nullable=True),
+    sa.Column('edited_by', sa.String(length=36), nullable=True),
+    sa.Column('is_deleted', sa.Boolean(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('deleted_by', sa.String(length=36), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversation.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.create_index('idx_message_archive_conv_created_id', ['conversation_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('idx_message_reply_to', ['reply_to_message_id'], unique=False)
+
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('archived_through', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('archived_through')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('idx_message_reply_to')
+
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_index('idx_message_archive_conv_created_id')
+
+    op.drop_table('message_archive')
@@ -0,0 +1,43 @@
+"""Add result_snapshot table (released semester results as JSON)
+
+Revision ID: e7c3a9d1f052
+Revises: 5b2e8f91c4d7
+Create Date: 2026-10-17 23:48:12.551302
+
+Semesters released before this migration get snapshots with:
+    flask --app app grading snapshot-results --academic-year 2024 --semester 1
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3a9d1f052'
+down_revision = '5b2e8f91c4d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('result_snapshot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('academic_year', sa.String(length=20), nullable=False),
+    sa.Column('semester', sa.String(length=10), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('etag', sa.String(length=64), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'academic_year', 'semester', 'version', name='uq_result_snapshot')
+    )
+    with op.batch_alter_table('result_snapshot', schema=None) as batch_op:
+        batch_op.create_index('ix_result_snapshot_period', ['academic_year', 'semester', 'version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('result_snapshot', schema=None) as batch_op:
+        batch_op.drop_index('ix_result_snapshot_period')
+
+    op.drop_table('result_snapshot')
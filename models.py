@@ -7,7 +7,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.hybrid import hybrid_property
-import secrets, hashlib, json
+import secrets, hashlib, json, zlib
 from sqlalchemy.dialects.postgresql import JSON as PG_JSON 
 from sqlalchemy import Column, Integer, String, Date, Time, Text
 from sqlalchemy import and_, or_
@@ -209,6 +209,9 @@ class Admin(db.Model, UserMixin):
     last_login = db.Column(db.DateTime, nullable=True)
     """When this admin last logged in"""
     
+    last_seen = db.Column(db.DateTime, nullable=True)
+    """When this admin was last connected to chat"""
+    
     date_appointed = db.Column(db.DateTime, nullable=True)
     """When this admin was appointed to their position"""
     
@@ -1427,7 +1430,154 @@ class SemesterResultRelease(db.Model):
     def __repr__(self):
         status = 'Released' if self.is_released else 'Not Released'
         return f"<SemesterResultRelease {self.academic_year} {self.semester}: {status}>"
-    
+
+
+class GradingJob(db.Model):
+    """
+    Background grade recalculation for a semester (services/parallel_recalculation.py).
+    One row per semester; a 'queued' or 'running' row with a recent heartbeat is the lock.
+    """
+    __tablename__ = 'grading_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    academic_year = db.Column(db.String(20), nullable=False)
+    semester = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # queued | running | completed | failed
+    started_by = db.Column(db.String(200), nullable=True)
+    workers = db.Column(db.Integer, nullable=True)
+    total_courses = db.Column(db.Integer, default=0)
+    completed_courses = db.Column(db.Integer, default=0)
+    failed_courses = db.Column(db.Integer, default=0)
+    rows_calculated = db.Column(db.Integer, default=0)
+    # JSON list of {course_id, calculated, errors, seconds[, error]} in completion order
+    course_timings = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('academic_year', 'semester', name='uq_grading_job_semester'),
+    )
+
+    def get_course_timings(self):
+        return json.loads(self.course_timings) if self.course_timings else []
+
+    def to_dict(self):
+        return {
+            'academic_year': self.academic_year,
+            'semester': self.semester,
+            'status': self.status,
+            'started_by': self.started_by,
+            'workers': self.workers,
+            'total_courses': self.total_courses,
+            'completed_courses': self.completed_courses,
+            'failed_courses': self.failed_courses,
+            'rows_calculated': self.rows_calculated,
+            'course_timings': self.get_course_timings(),
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"<GradingJob {self.academic_year} {self.semester}: {self.status}>"
+
+
+class StudentGPASummary(db.Model):
+    """
+    Semester and cumulative GPA per student, materialized from StudentCourseGrade
+    (services/gpa_summary_service.py keeps it in step with grade writes).
+    GPA is credit-weighted; the *_grade_points totals give the unweighted mean.
+    """
+    __tablename__ = 'student_gpa_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    academic_year = db.Column(db.String(20), nullable=False)
+    semester = db.Column(db.String(10), nullable=False)
+
+    # This semester
+    courses_count = db.Column(db.Integer, nullable=False, default=0)
+    credits_attempted = db.Column(db.Integer, nullable=False, default=0)
+    credits_earned = db.Column(db.Integer, nullable=False, default=0)
+    grade_points = db.Column(db.Float, nullable=False, default=0.0)      # sum of grade points
+    quality_points = db.Column(db.Float, nullable=False, default=0.0)    # sum of grade point × credits
+    semester_gpa = db.Column(db.Float, nullable=False, default=0.0)
+
+    # All semesters up to and including this one
+    cumulative_courses = db.Column(db.Integer, nullable=False, default=0)
+    cumulative_credits_attempted = db.Column(db.Integer, nullable=False, default=0)
+    cumulative_credits_earned = db.Column(db.Integer, nullable=False, default=0)
+    cumulative_grade_points = db.Column(db.Float, nullable=False, default=0.0)
+    cumulative_quality_points = db.Column(db.Float, nullable=False, default=0.0)
+    cgpa = db.Column(db.Float, nullable=False, default=0.0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    student = db.relationship('User', backref=db.backref('gpa_summaries', lazy='dynamic'))
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'academic_year', 'semester', name='uq_student_gpa_summary'),
+        db.Index('ix_student_gpa_summary_period', 'academic_year', 'semester', 'semester_gpa'),
+    )
+
+    @property
+    def unweighted_gpa(self):
+        return round(self.grade_points / self.courses_count, 2) if self.courses_count else 0.0
+
+    @property
+    def cumulative_unweighted_gpa(self):
+        return round(self.cumulative_grade_points / self.cumulative_courses, 2) if self.cumulative_courses else 0.0
+
+    def to_dict(self):
+        return {
+            'academic_year': self.academic_year,
+            'semester': self.semester,
+            'courses_count': self.courses_count,
+            'credits_attempted': self.credits_attempted,
+            'credits_earned': self.credits_earned,
+            'semester_gpa': self.semester_gpa,
+            'cumulative_credits_attempted': self.cumulative_credits_attempted,
+            'cumulative_credits_earned': self.cumulative_credits_earned,
+            'cgpa': self.cgpa,
+        }
+
+    def __repr__(self):
+        return f"<StudentGPASummary {self.student_id} {self.academic_year} {self.semester}: {self.semester_gpa}/{self.cgpa}>"
+
+class ResultSnapshot(db.Model):
+    """
+    A student's released semester result (ResultBuilder.semester() output) as
+    JSON, written when the semester is released and never updated: a
+    regeneration inserts a new version and drops the old ones, a recall
+    deletes them (services/result_snapshot_service.py). etag is the SHA-256
+    of payload.
+    """
+    __tablename__ = 'result_snapshot'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    academic_year = db.Column(db.String(20), nullable=False)
+    semester = db.Column(db.String(10), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    etag = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'academic_year', 'semester', 'version', name='uq_result_snapshot'),
+        db.Index('ix_result_snapshot_period', 'academic_year', 'semester', 'version'),
+    )
+
+    @property
+    def data(self):
+        return json.loads(self.payload)
+
+    def __repr__(self):
+        return f"<ResultSnapshot {self.student_id} {self.academic_year} {self.semester} v{self.version}>"
+
 class TimetableEntry(db.Model):
     __tablename__ = 'timetable_entry'
     id = db.Column(db.Integer, primary_key=True)
@@ -1855,9 +2005,29 @@ class Conversation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Maintained by chat write paths (chat_routes.record_new_message) so the
+    # conversation list never has to scan message history.
+    last_message_id = db.Column(db.Integer, nullable=True)  # no FK: avoids a conversation<->message cycle
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    # Newest created_at moved to message_archive (utils/chat_archive.py);
+    # history reads skip the archive for pages newer than this.
+    archived_through = db.Column(db.DateTime, nullable=True)
+    # Direct conversations only: the two participants' public_ids, sorted
+    # (see direct_key_for). Unique, so there is one DM per pair.
+    direct_key = db.Column(db.String(80), nullable=True)
+
     participants = db.relationship("ConversationParticipant", backref="conversation", cascade="all, delete-orphan")
     messages = db.relationship("Message", backref="conversation", cascade="all, delete-orphan", order_by="Message.created_at.asc()")
 
+    __table_args__ = (
+        db.Index('uq_conversation_direct_key', 'direct_key', unique=True),
+    )
+
+    @staticmethod
+    def direct_key_for(public_id_a, public_id_b):
+        """Canonical key of the direct conversation between two people."""
+        return ":".join(sorted((public_id_a, public_id_b)))
+
     def get_meta(self):
         return json.loads(self.meta_json or "{}")
 
@@ -1876,14 +2046,17 @@ class ConversationParticipant(db.Model):
     can_rename_group = db.Column(db.Boolean, default=False, nullable=False)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_read_at = db.Column(db.DateTime, nullable=True)
+    unread_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
 
     __table_args__ = (db.UniqueConstraint("conversation_id", "user_public_id", "user_role", name="uq_conv_user_role_pub"),)
 
     @property
     def participant_obj(self):
-        if self.user_role == 'admin':
-            return Admin.query.filter_by(public_id=self.user_public_id).first()
-        return User.query.filter_by(public_id=self.user_public_id).first()
+        from utils.extensions import identity_cache
+        ident = identity_cache.get(self.user_public_id)
+        if not ident:
+            return None
+        return db.session.get(Admin if ident.kind == 'admin' else User, ident.pk)
 
 class Message(db.Model):
     __tablename__ = "message"
@@ -1902,40 +2075,48 @@ class Message(db.Model):
 
     reply_to = db.relationship("Message", remote_side=[id], backref="replies")
 
-    def to_dict(self):
-        sender_name = None
-        if self.sender_role == "admin":
-            admin = Admin.query.filter_by(public_id=self.sender_public_id).first()
-            if admin:
-                sender_name = admin.username
-        else:
-            user = User.query.filter_by(public_id=self.sender_public_id).first()
-            if user:
-                sender_name = user.full_name
+    __table_args__ = (
+        # Keyset pagination of chat history: (conversation_id, created_at, id)
+        db.Index('idx_message_conv_created_id', 'conversation_id', 'created_at', 'id'),
+        # Archival keeps reply targets hot while a live reply points at them
+        db.Index('idx_message_reply_to', 'reply_to_message_id'),
+    )
 
+    @staticmethod
+    def sender_names_for(public_ids):
+        """
+        Map sender public IDs to display names (User -> full name,
+        Admin -> username) through the shared identity cache.
+        """
+        from utils.extensions import identity_cache
+        return {pid: ident.name for pid, ident in identity_cache.get_many(public_ids).items()}
+
+    def to_dict(self):
+        reply_to = self.reply_to
+        names = Message.sender_names_for([
+            self.sender_public_id,
+            reply_to.sender_public_id if reply_to else None,
+        ])
+        return self.serialize_with(names, reply_to)
+
+    def serialize_with(self, names, reply_to=None):
+        """Build the client dict using pre-resolved sender names (see utils.serializers.serialize_messages)."""
         content = self.content
         if self.is_deleted:
             # show deleted placeholder to clients
             content = "[message deleted]"
 
         reply_to_data = None
-        if self.reply_to and not self.reply_to.is_deleted:
-            reply_sender_name = None
-            if self.reply_to.sender_role == "admin":
-                admin = Admin.query.filter_by(public_id=self.reply_to.sender_public_id).first()
-                if admin:
-                    reply_sender_name = admin.username
-            else:
-                user = User.query.filter_by(public_id=self.reply_to.sender_public_id).first()
-                if user:
-                    reply_sender_name = user.full_name
+        if reply_to and not reply_to.is_deleted:
+            reply_sender_name = names.get(reply_to.sender_public_id)
             reply_to_data = {
-                "id": self.reply_to.id,
-                "sender_name": reply_sender_name or f"{self.reply_to.sender_role.capitalize()} {self.reply_to.sender_public_id}",
-                "content": self.reply_to.content[:100] + "..." if len(self.reply_to.content) > 100 else self.reply_to.content,
-                "created_at": self.reply_to.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "id": reply_to.id,
+                "sender_name": reply_sender_name or f"{reply_to.sender_role.capitalize()} {reply_to.sender_public_id}",
+                "content": reply_to.content[:100] + "..." if len(reply_to.content) > 100 else reply_to.content,
+                "created_at": reply_to.created_at.strftime("%Y-%m-%d %H:%M:%S"),
             }
 
+        sender_name = names.get(self.sender_public_id)
         return {
             "id": self.id,
             "conversation_id": self.conversation_id,
@@ -1971,6 +2152,77 @@ class MessageReaction(db.Model):
             "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
         }
 
+class ArchivedMessage(db.Model):
+    """
+    Cold storage for old chat messages (see utils/chat_archive.py). Rows keep
+    their original message id; content and reactions are zlib-compressed.
+    Archived messages are read-only.
+    """
+    __tablename__ = "message_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # original message.id
+    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=False)
+    sender_public_id = db.Column(db.String(36), nullable=False)
+    sender_role = db.Column(db.String(20), nullable=False)
+    content_z = db.Column(db.LargeBinary, nullable=False)
+    reactions_z = db.Column(db.LargeBinary, nullable=True)  # JSON list of MessageReaction.to_dict()
+    created_at = db.Column(db.DateTime, nullable=False)
+    reply_to_message_id = db.Column(db.Integer, nullable=True)
+    edited_at = db.Column(db.DateTime, nullable=True)
+    edited_by = db.Column(db.String(36), nullable=True)
+    is_deleted = db.Column(db.Boolean, default=False)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    deleted_by = db.Column(db.String(36), nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_message_archive_conv_created_id', 'conversation_id', 'created_at', 'id'),
+    )
+
+    @classmethod
+    def from_message(cls, msg, reactions=()):
+        return cls(
+            id=msg.id,
+            conversation_id=msg.conversation_id,
+            sender_public_id=msg.sender_public_id,
+            sender_role=msg.sender_role,
+            content_z=zlib.compress(msg.content.encode("utf-8")),
+            reactions_z=zlib.compress(json.dumps(list(reactions)).encode("utf-8")) if reactions else None,
+            created_at=msg.created_at,
+            reply_to_message_id=msg.reply_to_message_id,
+            edited_at=msg.edited_at,
+            edited_by=msg.edited_by,
+            is_deleted=msg.is_deleted,
+            deleted_at=msg.deleted_at,
+            deleted_by=msg.deleted_by,
+        )
+
+    @property
+    def content(self):
+        return zlib.decompress(self.content_z).decode("utf-8")
+
+    @property
+    def reactions(self):
+        return json.loads(zlib.decompress(self.reactions_z)) if self.reactions_z else []
+
+    def to_message(self):
+        """Detached Message carrying this row's data, for the shared serializers."""
+        msg = Message(
+            id=self.id,
+            conversation_id=self.conversation_id,
+            sender_public_id=self.sender_public_id,
+            sender_role=self.sender_role,
+            content=self.content,
+            created_at=self.created_at,
+            reply_to_message_id=self.reply_to_message_id,
+            edited_at=self.edited_at,
+            edited_by=self.edited_by,
+            is_deleted=self.is_deleted,
+            deleted_at=self.deleted_at,
+            deleted_by=self.deleted_by,
+        )
+        msg.archived_reactions = self.reactions
+        return msg
+
 class TeacherAssessmentPeriod(db.Model):
     __tablename__ = 'teacher_assessment_period'
     id = db.Column(db.Integer, primary_key=True)
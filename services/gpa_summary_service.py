@@ -0,0 +1,336 @@
+"""
+GPA SUMMARY SERVICE
+===================
+Location: services/gpa_summary_service.py
+
+Maintains StudentGPASummary: one row per (student, academic year, semester)
+with the semester GPA, CGPA and credits attempted / earned. Readers
+(transcripts, result pages, promotion vetting, class rankings) read these
+rows instead of re-aggregating StudentCourseGrade.
+
+A grade change affects its semester and the cumulative figures of every
+later semester, so a student is refreshed as a unit: one query loads their
+counted grades, and their summary rows are upserted (ON CONFLICT on the
+student/semester key, so concurrent refreshes of one student do not
+collide) in the same transaction as the grade write.
+
+  - ORM writes to StudentCourseGrade are picked up by listeners
+    (registered by GPASummaryService.init_app(app)) and the students are
+    refreshed just before the session commits.
+  - The engine's bulk (Core) upserts call refresh_students() directly.
+  - Existing data: flask --app app grading rebuild-gpa
+
+Counting rules, the same everywhere:
+  - a grade counts once it has a final_score (and is_finalized, when the
+    model has that flag)
+  - grade point: the stored grade_point, else the course's grading scale
+  - credits: Course.credit_hours, 3 when unset
+  - earned: credits of grades with pass_fail PASS
+"""
+
+import logging
+import re
+from datetime import datetime
+
+from models import Course, StudentCourseGrade, StudentGPASummary, User, db
+from sqlalchemy import delete, func, insert, select, update
+from utils.extensions import grading_scale, semester_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CREDIT_HOURS = 3
+REFRESH_CHUNK = 500
+
+_DIRTY_KEY = 'gpa_summary_students'
+_KEY_COLUMNS = ('student_id', 'academic_year', 'semester')
+
+_listening = False
+
+_SEMESTER_ORDER = {'first': 1, 'second': 2, 'third': 3}
+
+
+def semester_sort_key(academic_year, semester):
+    """Chronological key for ("2024/2025", "First") / ("2024", "1") periods."""
+    semester = str(semester or '')
+    rank = _SEMESTER_ORDER.get(semester.strip().lower())
+    if rank is None:
+        match = re.match(r'\d+', semester.strip())
+        rank = int(match.group()) if match else 99
+    return (str(academic_year or ''), rank, semester)
+
+
+class GPASummaryService:
+    """Static-method service over the student_gpa_summary table."""
+
+    @staticmethod
+    def init_app(app):
+        """Register the StudentCourseGrade / Session hooks (once per process)."""
+        _listen()
+
+    # ============ READS ============
+
+    @staticmethod
+    def for_student(student_id):
+        """All of a student's summary rows, oldest semester first."""
+        rows = StudentGPASummary.query.filter_by(student_id=student_id).all()
+        if not rows and GPASummaryService._has_counted_grades(student_id):
+            # Not backfilled yet: compute without writing
+            rows = [StudentGPASummary(**values) for values in GPASummaryService._compute([student_id])]
+        return sorted(rows, key=lambda r: semester_sort_key(r.academic_year, r.semester))
+
+    @staticmethod
+    def get(student_id, academic_year, semester):
+        """Summary row for one semester, or None if the student has no counted grades there."""
+        row = StudentGPASummary.query.filter_by(
+            student_id=student_id, academic_year=academic_year, semester=semester
+        ).first()
+        if row is None:
+            row = next((r for r in GPASummaryService.for_student(student_id)
+                        if r.academic_year == academic_year and r.semester == semester), None)
+        return row
+
+    @staticmethod
+    def latest(student_id):
+        """Most recent semester's row (its cgpa is the student's current CGPA), or None."""
+        rows = GPASummaryService.for_student(student_id)
+        return rows[-1] if rows else None
+
+    @staticmethod
+    def for_semester(academic_year, semester, student_ids=None):
+        """{student_id: StudentGPASummary} for a semester, in one query."""
+        query = StudentGPASummary.query.filter_by(academic_year=academic_year, semester=semester)
+        if student_ids is not None:
+            query = query.filter(StudentGPASummary.student_id.in_(student_ids))
+        return {row.student_id: row for row in query}
+
+    @staticmethod
+    def yearly_gpa(academic_year, user_ids=None):
+        """
+        Credit-weighted GPA over all semesters of an academic year, keyed by
+        User.user_id (the "STD001" style id), in one grouped query.
+        """
+        query = (
+            db.session.query(
+                User.user_id,
+                func.sum(StudentGPASummary.quality_points),
+                func.sum(StudentGPASummary.credits_attempted),
+            )
+            .join(User, User.id == StudentGPASummary.student_id)
+            .filter(StudentGPASummary.academic_year == academic_year)
+            .group_by(User.user_id)
+        )
+        if user_ids is not None:
+            query = query.filter(User.user_id.in_(user_ids))
+        return {
+            user_id: round(points / credits, 2) if credits else 0.0
+            for user_id, points, credits in query
+        }
+
+    # ============ MAINTENANCE ============
+
+    @staticmethod
+    def refresh_students(student_ids):
+        """
+        Rewrite the summary rows of these students from their grades, in the
+        caller's transaction (the caller commits). Returns rows written.
+        """
+        student_ids = sorted({sid for sid in student_ids if sid is not None})
+        written = 0
+        for start in range(0, len(student_ids), REFRESH_CHUNK):
+            chunk = student_ids[start:start + REFRESH_CHUNK]
+            rows = GPASummaryService._compute(chunk)
+            existing = {
+                (student_id, year, semester): row_id
+                for row_id, student_id, year, semester in db.session.query(
+                    StudentGPASummary.id, StudentGPASummary.student_id,
+                    StudentGPASummary.academic_year, StudentGPASummary.semester,
+                ).filter(StudentGPASummary.student_id.in_(chunk))
+            }
+            if rows:
+                GPASummaryService._upsert(rows, existing)
+            # Semesters a student no longer has counted grades in
+            kept = {tuple(row[key] for key in _KEY_COLUMNS) for row in rows}
+            stale = [row_id for key, row_id in existing.items() if key not in kept]
+            if stale:
+                db.session.execute(delete(StudentGPASummary).where(StudentGPASummary.id.in_(stale)))
+            # Semesters the students had or now have: their cached class results are stale
+            periods = {(year, semester) for _, year, semester in existing}
+            periods.update((row['academic_year'], row['semester']) for row in rows)
+            semester_cache.touch(periods, db.session())
+            written += len(rows)
+        return written
+
+    @staticmethod
+    def refresh_semester(academic_year, semester):
+        """Refresh every student with a grade in the semester. Returns rows written."""
+        student_ids = [
+            sid for (sid,) in db.session.query(StudentCourseGrade.student_id).filter_by(
+                academic_year=academic_year, semester=semester
+            ).distinct()
+        ]
+        return GPASummaryService.refresh_students(student_ids)
+
+    @staticmethod
+    def rebuild():
+        """Recompute the whole table, committing per chunk of students. Returns rows written."""
+        student_ids = [sid for (sid,) in db.session.query(StudentCourseGrade.student_id).distinct()]
+        written = 0
+        for start in range(0, len(student_ids), REFRESH_CHUNK):
+            written += GPASummaryService.refresh_students(student_ids[start:start + REFRESH_CHUNK])
+            db.session.commit()
+        # Students whose grades were all deleted
+        graded = select(StudentCourseGrade.student_id).distinct()
+        db.session.execute(delete(StudentGPASummary).where(StudentGPASummary.student_id.not_in(graded)))
+        db.session.commit()
+        semester_cache.invalidate()
+        return written
+
+    # ============ INTERNALS ============
+
+    @staticmethod
+    def _upsert(rows, existing):
+        """
+        Write summary rows with INSERT ... ON CONFLICT DO UPDATE where the
+        database supports it; elsewhere UPDATE the existing rows by id and
+        INSERT the rest.
+        """
+        table = StudentGPASummary.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            updates, inserts = [], []
+            for row in rows:
+                row_id = existing.get(tuple(row[key] for key in _KEY_COLUMNS))
+                if row_id is None:
+                    inserts.append(row)
+                else:
+                    updates.append(dict(row, id=row_id))
+            if updates:
+                db.session.execute(update(StudentGPASummary), updates)
+            if inserts:
+                db.session.execute(insert(StudentGPASummary), inserts)
+            return
+
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(_KEY_COLUMNS),
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in table.columns
+                if column.name not in _KEY_COLUMNS and not column.primary_key
+            },
+        )
+        db.session.execute(stmt, rows)
+
+    @staticmethod
+    def _counted(query):
+        query = query.filter(StudentCourseGrade.final_score != None)
+        if hasattr(StudentCourseGrade, 'is_finalized'):
+            query = query.filter(StudentCourseGrade.is_finalized == True)
+        return query
+
+    @staticmethod
+    def _has_counted_grades(student_id):
+        query = db.session.query(StudentCourseGrade.id).filter(StudentCourseGrade.student_id == student_id)
+        return GPASummaryService._counted(query).first() is not None
+
+    @staticmethod
+    def _compute(student_ids):
+        """Summary row values (dicts) for the given students, from one query."""
+        query = db.session.query(
+            StudentCourseGrade.student_id,
+            StudentCourseGrade.academic_year,
+            StudentCourseGrade.semester,
+            StudentCourseGrade.grade_point,
+            StudentCourseGrade.grade_letter,
+            StudentCourseGrade.pass_fail,
+            Course.credit_hours,
+            Course.programme_name,
+            Course.programme_level,
+        ).join(Course, Course.id == StudentCourseGrade.course_id).filter(
+            StudentCourseGrade.student_id.in_(student_ids)
+        )
+
+        periods = {}  # student_id -> {(year, semester): totals}
+        for student_id, year, semester, point, letter, pass_fail, credits, programme, level in \
+                GPASummaryService._counted(query):
+            if point is None:
+                point = grading_scale.point_for_letter(letter, programme, level)
+            credits = credits or DEFAULT_CREDIT_HOURS
+            totals = periods.setdefault(student_id, {}).setdefault((year, semester), [0, 0, 0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += credits
+            totals[2] += credits if pass_fail == 'PASS' else 0
+            totals[3] += point
+            totals[4] += point * credits
+
+        now = datetime.utcnow()
+        rows = []
+        for student_id, by_period in periods.items():
+            running = [0, 0, 0, 0.0, 0.0]
+            for (year, semester) in sorted(by_period, key=lambda p: semester_sort_key(*p)):
+                courses, attempted, earned, points, quality = by_period[(year, semester)]
+                running = [running[0] + courses, running[1] + attempted, running[2] + earned,
+                           running[3] + points, running[4] + quality]
+                rows.append({
+                    'student_id': student_id,
+                    'academic_year': year,
+                    'semester': semester,
+                    'courses_count': courses,
+                    'credits_attempted': attempted,
+                    'credits_earned': earned,
+                    'grade_points': round(points, 4),
+                    'quality_points': round(quality, 4),
+                    'semester_gpa': round(quality / attempted, 2) if attempted else 0.0,
+                    'cumulative_courses': running[0],
+                    'cumulative_credits_attempted': running[1],
+                    'cumulative_credits_earned': running[2],
+                    'cumulative_grade_points': round(running[3], 4),
+                    'cumulative_quality_points': round(running[4], 4),
+                    'cgpa': round(running[4] / running[1], 2) if running[1] else 0.0,
+                    'updated_at': now,
+                })
+        return rows
+
+
+# ============ ORM HOOKS ============
+
+def _listen():
+    """Refresh students whose StudentCourseGrade rows changed through the ORM, before commit."""
+    global _listening
+    if _listening:
+        return
+    _listening = True
+
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import Session, object_session
+
+    def mark(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+        students = session.info.setdefault(_DIRTY_KEY, set())
+        students.add(target.student_id)
+        # A row moved to another student invalidates the old one too
+        students.update(inspect(target).attrs.student_id.history.deleted or ())
+
+    def before_commit(session):
+        if not session.info.get(_DIRTY_KEY) and not any(
+            isinstance(obj, StudentCourseGrade) for obj in (*session.new, *session.dirty, *session.deleted)
+        ):
+            return
+        session.flush()
+        students = session.info.pop(_DIRTY_KEY, None)
+        if students:
+            GPASummaryService.refresh_students(students)
+
+    def after_rollback(session):
+        session.info.pop(_DIRTY_KEY, None)
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(StudentCourseGrade, name, mark)
+    event.listen(Session, 'before_commit', before_commit)
+    event.listen(Session, 'after_rollback', after_rollback)
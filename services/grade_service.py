@@ -3,9 +3,11 @@ Grade Lookup Service
 ====================
 Converts numeric scores to letter grades using the GradingScale model.
 This service provides simple lookups - all calculation logic is in GradingCalculationEngine.
+Score lookups are answered from the compiled scale cache (utils/grading_scale.py).
 """
 
 from models import GradingScale
+from utils.extensions import grading_scale
 
 
 class GradeService:
@@ -15,28 +17,35 @@ class GradeService:
     """
 
     @staticmethod
-    def get_grade(percent):
+    def get_grade(percent, programme=None, level=None):
         """
         Get letter grade object for a percentage score.
         
         Args:
             percent: Score as percentage (0-100)
+            programme: Programme name, for programme-specific scales (optional)
+            level: Programme level, for level-specific scales (optional)
             
         Returns:
-            GradingScale object with grade details, or None if no match
+            GradeBand with the GradingScale grade fields, or None if no match
             
         Example:
-            85.4 → GradingScale(grade_letter='B+', grade_point=3.3, min_score=85, max_score=89)
+            85.4 → GradeBand(grade_letter='B+', grade_point=3.3, min_score=85, max_score=89, ...)
         """
         if percent is None:
             return None
 
-        return (
-            GradingScale.query
-            .filter(GradingScale.min_score <= percent)
-            .filter(GradingScale.max_score >= percent)
-            .first()
-        )
+        return grading_scale.grade_for(percent, programme, level)
+
+    @staticmethod
+    def grades_for(scores, programme=None, level=None):
+        """
+        Grade a batch of scores against one programme/level scale.
+        
+        Returns:
+            List of GradeBand (or None) in the order of `scores`
+        """
+        return grading_scale.grades_for(scores, programme, level)
 
     @staticmethod
     def get_all_grades():
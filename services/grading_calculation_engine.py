@@ -39,13 +39,15 @@ USAGE:
 """
 
 from models import (
-    Quiz, StudentQuizSubmission,
+    Quiz, Question, StudentQuizSubmission,
     Assignment, AssignmentSubmission,
-    Exam, ExamSubmission, CourseAssessmentScheme,
-    GradingScale, Course, StudentCourseGrade, db
+    Exam, ExamQuestion, ExamSubmission, CourseAssessmentScheme,
+    GradingScale, Course, StudentCourseGrade, StudentCourseRegistration, db
 )
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, insert, update
+from utils.extensions import grading_scale
+from services.gpa_summary_service import DEFAULT_CREDIT_HOURS, GPASummaryService
 
 
 class GradingCalculationEngine:
@@ -94,54 +96,20 @@ class GradingCalculationEngine:
                 return None
 
             # 3. Calculate category totals
-            quiz_score, quiz_max = GradingCalculationEngine._get_quiz_totals(
-                student_id, course_id
+            totals = (
+                GradingCalculationEngine._get_quiz_totals(student_id, course_id),
+                GradingCalculationEngine._get_assignment_totals(student_id, course_id),
+                GradingCalculationEngine._get_exam_totals(student_id, course_id),
             )
-            ass_score, ass_max = GradingCalculationEngine._get_assignment_totals(
-                student_id, course_id
-            )
-            exam_score, exam_max = GradingCalculationEngine._get_exam_totals(
-                student_id, course_id
-            )
-
-            # 4. Convert to percentages
-            quiz_pct = (quiz_score / quiz_max * 100) if quiz_max > 0 else 0.0
-            ass_pct = (ass_score / ass_max * 100) if ass_max > 0 else 0.0
-            exam_pct = (exam_score / exam_max * 100) if exam_max > 0 else 0.0
-
-            # 5. Apply weights (STANDARD FORMULA)
-            # weighted = (percentage / 100) × weight_percent
-            quiz_weighted = (quiz_pct / 100) * (scheme.quiz_weight or 0)
-            ass_weighted = (ass_pct / 100) * (scheme.assignment_weight or 0)
-            exam_weighted = (exam_pct / 100) * (scheme.exam_weight or 0)
 
-            final_score = round(quiz_weighted + ass_weighted + exam_weighted, 2)
-
-            # 6. Get letter grade
-            grade_obj = GradeService.get_grade(final_score)
+            # 4-6. Percentages, weights and letter grade
+            scores = GradingCalculationEngine._score_breakdown(scheme, *totals)
+            grade_obj = GradeService.get_grade(
+                scores['final_score'], scheme.programme_name, scheme.programme_level
+            )
 
             # 7. Update grade record
-            grade_record.quiz_raw_score = quiz_score
-            grade_record.quiz_max_score = quiz_max
-            grade_record.quiz_percentage = round(quiz_pct, 2)
-            grade_record.quiz_weighted_score = round(quiz_weighted, 2)
-
-            grade_record.assignment_raw_score = ass_score
-            grade_record.assignment_max_score = ass_max
-            grade_record.assignment_percentage = round(ass_pct, 2)
-            grade_record.assignment_weighted_score = round(ass_weighted, 2)
-
-            grade_record.exam_raw_score = exam_score
-            grade_record.exam_max_score = exam_max
-            grade_record.exam_percentage = round(exam_pct, 2)
-            grade_record.exam_weighted_score = round(exam_weighted, 2)
-
-            grade_record.final_score = final_score
-            grade_record.grade_letter = grade_obj.grade_letter if grade_obj else 'F'
-            grade_record.grade_point = grade_obj.grade_point if grade_obj else 0.0
-            grade_record.pass_fail = grade_obj.pass_fail if grade_obj else 'FAIL'
-            grade_record.is_finalized = False
-            grade_record.calculated_at = datetime.utcnow()
+            GradingCalculationEngine._apply_scores(grade_record, scores, grade_obj)
 
             db.session.commit()
             return grade_record
@@ -150,6 +118,70 @@ class GradingCalculationEngine:
             db.session.rollback()
             raise Exception(f"Error calculating grade for {student_id}: {str(e)}")
 
+    @staticmethod
+    def _score_breakdown(scheme, quiz_totals, assignment_totals, exam_totals):
+        """
+        Apply the standard formula to (score, max) totals per category.
+        Shared by the per-student and bulk paths so both store identical values.
+        """
+        quiz_score, quiz_max = quiz_totals
+        ass_score, ass_max = assignment_totals
+        exam_score, exam_max = exam_totals
+
+        # Convert to percentages
+        quiz_pct = (quiz_score / quiz_max * 100) if quiz_max > 0 else 0.0
+        ass_pct = (ass_score / ass_max * 100) if ass_max > 0 else 0.0
+        exam_pct = (exam_score / exam_max * 100) if exam_max > 0 else 0.0
+
+        # Apply weights (STANDARD FORMULA)
+        # weighted = (percentage / 100) × weight_percent
+        quiz_weighted = (quiz_pct / 100) * (scheme.quiz_weight or 0)
+        ass_weighted = (ass_pct / 100) * (scheme.assignment_weight or 0)
+        exam_weighted = (exam_pct / 100) * (scheme.exam_weight or 0)
+
+        return {
+            'quiz_total_score': quiz_score,
+            'quiz_max_possible': quiz_max,
+            'quiz_percentage': round(quiz_pct, 2),
+            'quiz_weighted_score': round(quiz_weighted, 2),
+            'assignment_total_score': ass_score,
+            'assignment_max_possible': ass_max,
+            'assignment_percentage': round(ass_pct, 2),
+            'assignment_weighted_score': round(ass_weighted, 2),
+            'exam_total_score': exam_score,
+            'exam_max_possible': exam_max,
+            'exam_percentage': round(exam_pct, 2),
+            'exam_weighted_score': round(exam_weighted, 2),
+            'final_score': round(quiz_weighted + ass_weighted + exam_weighted, 2),
+        }
+
+    @staticmethod
+    def _grade_fields(grade_obj):
+        """Letter, point and pass/fail for a grading scale row (F when no band matches)."""
+        return {
+            'grade_letter': grade_obj.grade_letter if grade_obj else 'F',
+            'grade_point': grade_obj.grade_point if grade_obj else 0.0,
+            'pass_fail': grade_obj.pass_fail if grade_obj else 'FAIL',
+        }
+
+    @staticmethod
+    def _apply_scores(grade_record, scores, grade_obj):
+        """Copy a score breakdown and its letter grade onto a StudentCourseGrade."""
+        for key, value in scores.items():
+            setattr(grade_record, key, value)
+        for key, value in GradingCalculationEngine._grade_fields(grade_obj).items():
+            setattr(grade_record, key, value)
+
+        # Aliases read by the admin student breakdown view
+        grade_record.quiz_raw_score = scores['quiz_total_score']
+        grade_record.quiz_max_score = scores['quiz_max_possible']
+        grade_record.assignment_raw_score = scores['assignment_total_score']
+        grade_record.assignment_max_score = scores['assignment_max_possible']
+        grade_record.exam_raw_score = scores['exam_total_score']
+        grade_record.exam_max_score = scores['exam_max_possible']
+        grade_record.is_finalized = False
+        grade_record.calculated_at = datetime.utcnow()
+
     @staticmethod
     def _get_quiz_totals(student_id, course_id):
         """
@@ -265,6 +297,9 @@ class GradingCalculationEngine:
         """
         Recalculate all grades for all students in all courses for a semester.
         Called after grading period ends to finalize grades.
+
+        Uses the set-based path (recalculate_semester): a few GROUP BY
+        queries for the whole semester and one transaction per course.
         
         Args:
             academic_year: Academic year
@@ -273,42 +308,262 @@ class GradingCalculationEngine:
         Returns:
             dict with statistics
         """
-        courses = Course.query.filter_by(
-            academic_year=academic_year,
-            semester=semester
-        ).all()
-        
-        total_success = 0
-        total_errors = 0
-        
-        for course in courses:
-            # Get all students in this course
-            registrations = StudentCourseGrade.query.filter_by(
-                course_id=course.id,
-                academic_year=academic_year,
-                semester=semester
-            ).all()
-            
-            for reg in registrations:
-                try:
-                    GradingCalculationEngine.calculate_course_grade(
-                        reg.student_id, course.id, academic_year, semester
-                    )
-                    total_success += 1
-                except Exception as e:
-                    total_errors += 1
-        
+        result = GradingCalculationEngine.recalculate_semester(academic_year, semester)
         return {
-            'total_calculated': total_success,
-            'total_errors': total_errors,
+            'total_calculated': result['total_calculated'],
+            'total_errors': result['total_errors'],
+            'academic_year': academic_year,
+            'semester': semester,
+            'courses': result['courses'],
+        }
+
+    # ============ SET-BASED (BULK) RECALCULATION ============
+
+    @staticmethod
+    def recalculate_course(course_id, academic_year, semester, student_ids=None):
+        """
+        Recalculate every student's grade in one course with set-based queries.
+        Same values as calculate_course_grade() per student; see recalculate_semester.
+
+        Returns:
+            dict with course_id, calculated, errors and (on failure) error
+        """
+        result = GradingCalculationEngine.recalculate_semester(
+            academic_year, semester, course_ids=[course_id], student_ids=student_ids
+        )
+        if result['courses']:
+            return result['courses'][0]
+        return {'course_id': course_id, 'calculated': 0, 'errors': 0, 'error': 'Course not found'}
+
+    @staticmethod
+    def recalculate_semester(academic_year, semester, course_ids=None, student_ids=None,
+                             include_finalized=True, refresh_gpa=True, commit=True):
+        """
+        Recalculate grades for all students of a semester's courses in bulk.
+
+        Quiz, assignment and exam totals for every (student, course) come from
+        three GROUP BY queries; weights and grade bands are applied in memory
+        and each course's StudentCourseGrade rows are upserted in a single
+        transaction. A course is graded for students with a registration or
+        an existing grade row; courses without an assessment scheme are
+        skipped, as in calculate_course_grade().
+
+        Args:
+            academic_year: Academic year
+            semester: Semester
+            course_ids: Limit to these Course ids (default: all courses of the semester)
+            student_ids: Limit to these User ids
+            include_finalized: Also overwrite rows flagged is_finalized (when the model has the flag)
+            refresh_gpa: Refresh the students' StudentGPASummary rows with each course
+                (callers running courses concurrently refresh once at the end instead)
+            commit: Commit each course separately. When False every course runs in a
+                savepoint of the caller's transaction and the caller commits
+
+        Returns:
+            dict with total_calculated, total_errors, skipped_courses and a
+            per-course list of {course_id, calculated, errors[, error]}
+        """
+        query = Course.query.filter_by(academic_year=academic_year, semester=semester)
+        if course_ids is not None:
+            query = query.filter(Course.id.in_(course_ids))
+        course_ids = [c.id for c in query.order_by(Course.id).all()]
+
+        result = {
             'academic_year': academic_year,
-            'semester': semester
+            'semester': semester,
+            'total_calculated': 0,
+            'total_errors': 0,
+            'skipped_courses': [],
+            'courses': [],
         }
+        if not course_ids:
+            return result
+
+        schemes = {}
+        for scheme in (CourseAssessmentScheme.query
+                       .filter(CourseAssessmentScheme.course_id.in_(course_ids))
+                       .order_by(CourseAssessmentScheme.id)):
+            schemes.setdefault(scheme.course_id, scheme)
+
+        students = GradingCalculationEngine._course_students(course_ids, academic_year, semester, student_ids)
+        quiz = GradingCalculationEngine._bulk_quiz_totals(course_ids, student_ids)
+        assignment = GradingCalculationEngine._bulk_assignment_totals(course_ids, student_ids)
+        exam = GradingCalculationEngine._bulk_exam_totals(course_ids, student_ids)
+
+        for course_id in course_ids:
+            scheme = schemes.get(course_id)
+            if scheme is None:
+                result['skipped_courses'].append(course_id)
+                continue
+
+            course_students = sorted(students.get(course_id, ()))
+            rows = []
+            for student_id in course_students:
+                key = (student_id, course_id)
+                rows.append((student_id, GradingCalculationEngine._score_breakdown(
+                    scheme,
+                    quiz.get(key, (0, 0)),
+                    assignment.get(key, (0, 0)),
+                    exam.get(key, (0, 0)),
+                )))
+            bands = grading_scale.grades_for(
+                (scores['final_score'] for _, scores in rows),
+                scheme.programme_name, scheme.programme_level,
+            )
+            for (_, scores), band in zip(rows, bands):
+                scores.update(GradingCalculationEngine._grade_fields(band))
 
+            savepoint = None if commit else db.session.begin_nested()
+            try:
+                rows = GradingCalculationEngine._upsert_course_grades(
+                    course_id, academic_year, semester, rows, include_finalized
+                )
+                if refresh_gpa:
+                    GPASummaryService.refresh_students(student_id for student_id, _ in rows)
+                if savepoint is None:
+                    db.session.commit()
+                else:
+                    savepoint.commit()
+                result['courses'].append({'course_id': course_id, 'calculated': len(rows), 'errors': 0})
+                result['total_calculated'] += len(rows)
+            except Exception as e:
+                if savepoint is None:
+                    db.session.rollback()
+                else:
+                    savepoint.rollback()
+                result['courses'].append({
+                    'course_id': course_id, 'calculated': 0, 'errors': len(rows), 'error': str(e)
+                })
+                result['total_errors'] += len(rows)
 
+        return result
+
+    @staticmethod
+    def _course_students(course_ids, academic_year, semester, student_ids=None):
+        """{course_id: set(User.id)} from registrations and existing grade rows."""
+        students = {}
+        for model in (StudentCourseRegistration, StudentCourseGrade):
+            query = db.session.query(model.course_id, model.student_id).filter(
+                model.course_id.in_(course_ids),
+                model.academic_year == academic_year,
+                model.semester == semester,
+            )
+            if student_ids is not None:
+                query = query.filter(model.student_id.in_(student_ids))
+            for course_id, student_id in query.distinct():
+                students.setdefault(course_id, set()).add(student_id)
+        return students
 
+    @staticmethod
+    def _totals_by_student_course(query):
+        """Rows of (student_id, course_id, score, max) -> {(student_id, course_id): (score, max)}."""
+        return {
+            (student_id, course_id): (score or 0, max_score or 0)
+            for student_id, course_id, score, max_score in query
+        }
 
+    @staticmethod
+    def _bulk_quiz_totals(course_ids, student_ids=None):
+        """Bulk _get_quiz_totals: each submission counts its quiz's question points."""
+        quiz_max = (
+            db.session.query(Question.quiz_id, func.sum(Question.points).label('max_score'))
+            .group_by(Question.quiz_id)
+            .subquery()
+        )
+        query = (
+            db.session.query(
+                StudentQuizSubmission.student_id,
+                Quiz.course_id,
+                func.sum(StudentQuizSubmission.score),
+                func.sum(quiz_max.c.max_score),
+            )
+            .join(Quiz, Quiz.id == StudentQuizSubmission.quiz_id)
+            .outerjoin(quiz_max, quiz_max.c.quiz_id == Quiz.id)
+            .filter(Quiz.course_id.in_(course_ids))
+            .group_by(StudentQuizSubmission.student_id, Quiz.course_id)
+        )
+        if student_ids is not None:
+            query = query.filter(StudentQuizSubmission.student_id.in_(student_ids))
+        return GradingCalculationEngine._totals_by_student_course(query)
 
+    @staticmethod
+    def _bulk_assignment_totals(course_ids, student_ids=None):
+        """Bulk _get_assignment_totals."""
+        query = (
+            db.session.query(
+                AssignmentSubmission.student_id,
+                Assignment.course_id,
+                func.sum(AssignmentSubmission.score),
+                func.sum(Assignment.max_score),
+            )
+            .join(Assignment, Assignment.id == AssignmentSubmission.assignment_id)
+            .filter(Assignment.course_id.in_(course_ids))
+            .group_by(AssignmentSubmission.student_id, Assignment.course_id)
+        )
+        if student_ids is not None:
+            query = query.filter(AssignmentSubmission.student_id.in_(student_ids))
+        return GradingCalculationEngine._totals_by_student_course(query)
+
+    @staticmethod
+    def _bulk_exam_totals(course_ids, student_ids=None):
+        """Bulk _get_exam_totals: each submission counts its exam's question marks."""
+        exam_max = (
+            db.session.query(ExamQuestion.exam_id, func.sum(ExamQuestion.marks).label('max_score'))
+            .group_by(ExamQuestion.exam_id)
+            .subquery()
+        )
+        query = (
+            db.session.query(
+                ExamSubmission.student_id,
+                Exam.course_id,
+                func.sum(ExamSubmission.score),
+                func.sum(exam_max.c.max_score),
+            )
+            .join(Exam, Exam.id == ExamSubmission.exam_id)
+            .outerjoin(exam_max, exam_max.c.exam_id == Exam.id)
+            .filter(Exam.course_id.in_(course_ids))
+            .group_by(ExamSubmission.student_id, Exam.course_id)
+        )
+        if student_ids is not None:
+            query = query.filter(ExamSubmission.student_id.in_(student_ids))
+        return GradingCalculationEngine._totals_by_student_course(query)
+
+    @staticmethod
+    def _upsert_course_grades(course_id, academic_year, semester, rows, include_finalized=True):
+        """
+        Write (student_id, scores) rows for one course: bulk UPDATE existing,
+        bulk INSERT new. Returns the rows written.
+        """
+        if not rows:
+            return rows
+
+        columns = StudentCourseGrade.__table__.columns
+        query = db.session.query(StudentCourseGrade.student_id, StudentCourseGrade.id).filter_by(
+            course_id=course_id, academic_year=academic_year, semester=semester
+        )
+        existing = dict(query)
+        if not include_finalized and hasattr(StudentCourseGrade, 'is_finalized'):
+            finalized = {
+                student_id for student_id, in
+                query.filter(StudentCourseGrade.is_finalized.is_(True)).with_entities(StudentCourseGrade.student_id)
+            }
+            rows = [(student_id, scores) for student_id, scores in rows if student_id not in finalized]
+        updates, inserts = [], []
+        for student_id, scores in rows:
+            values = {k: v for k, v in scores.items() if k in columns}
+            if student_id in existing:
+                updates.append(dict(values, id=existing[student_id]))
+            else:
+                inserts.append(dict(
+                    values, student_id=student_id, course_id=course_id,
+                    academic_year=academic_year, semester=semester,
+                ))
+
+        if updates:
+            db.session.execute(update(StudentCourseGrade), updates)
+        if inserts:
+            db.session.execute(insert(StudentCourseGrade), inserts)
+        return rows
 
     @staticmethod
     def get_student_grades_for_semester(student_id, academic_year, semester):
@@ -346,67 +601,53 @@ class GradingCalculationEngine:
         """
         Calculate a simple (unweighted) GPA from a list of StudentCourseGrade objects.
         If `grade_point` is available on the grade object it is used; otherwise
-        a mapping from `grade_letter` is used as fallback.
+        the letter's point on the course's grading scale.
         Returns a float rounded to 2 decimals.
+
+        For a student's semester / cumulative GPA read StudentGPASummary
+        (GPASummaryService) instead of loading their grades.
         """
         if not grades:
             return 0.0
 
-        gp_map = {
-            'A': 4.0, 'A-': 3.7,
-            'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-            'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-            'D+': 1.3, 'D': 1.0, 'F': 0.0
-        }
-
-        total = 0.0
-        count = 0
-        for g in grades:
-            gp = getattr(g, 'grade_point', None)
-            if gp is None:
-                gp = gp_map.get(getattr(g, 'grade_letter', None), 0.0)
-            total += (gp or 0.0)
-            count += 1
-
-        return round((total / count) if count > 0 else 0.0, 2)
+        total = sum(GradingCalculationEngine._grade_point(g) for g in grades)
+        return round(total / len(grades), 2)
 
     @staticmethod
     def calculate_weighted_gpa(grades):
         """
         Calculate credit-weighted GPA from a list of StudentCourseGrade objects.
-        Uses `grade_point` if present, otherwise falls back to `grade_letter` mapping.
+        Same grade point rule as calculate_gpa(); credits default to 3 as in
+        StudentGPASummary.
         Returns a float rounded to 2 decimals.
         """
         if not grades:
             return 0.0
 
-        gp_map = {
-            'A': 4.0, 'A-': 3.7,
-            'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-            'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-            'D+': 1.3, 'D': 1.0, 'F': 0.0
-        }
-
         total_points = 0.0
-        total_credits = 0.0
+        total_credits = 0
 
         for g in grades:
-            gp = getattr(g, 'grade_point', None)
-            if gp is None:
-                gp = gp_map.get(getattr(g, 'grade_letter', None), 0.0)
-            # Attempt to read credit hours from related course
-            credits = 0
-            try:
-                credits = (g.course.credit_hours or 0)
-            except Exception:
-                credits = 0
-
-            total_points += (gp or 0.0) * (credits or 0)
-            total_credits += (credits or 0)
+            course = getattr(g, 'course', None)
+            credits = (course.credit_hours if course else None) or DEFAULT_CREDIT_HOURS
+            total_points += GradingCalculationEngine._grade_point(g) * credits
+            total_credits += credits
 
         weighted = (total_points / total_credits) if total_credits > 0 else 0.0
         return round(weighted, 2)
 
+    @staticmethod
+    def _grade_point(grade):
+        gp = getattr(grade, 'grade_point', None)
+        if gp is None:
+            course = getattr(grade, 'course', None)
+            gp = grading_scale.point_for_letter(
+                getattr(grade, 'grade_letter', None),
+                course.programme_name if course else None,
+                course.programme_level if course else None,
+            )
+        return gp or 0.0
+
 
 class GradeService:
     """
@@ -415,28 +656,30 @@ class GradeService:
     """
 
     @staticmethod
-    def get_grade(percent):
+    def get_grade(percent, programme=None, level=None):
         """
         Get letter grade object for a percentage score.
         
         Args:
             percent: Score as percentage (0-100)
+            programme: Programme name, for programme-specific scales (optional)
+            level: Programme level, for level-specific scales (optional)
             
         Returns:
-            GradingScale object with grade details, or None if no match
+            GradeBand with the GradingScale grade fields, or None if no match
             
         Example:
-            85.4 → GradingScale(grade_letter='B+', grade_point=3.3, ...)
+            85.4 → GradeBand(grade_letter='B+', grade_point=3.3, ...)
         """
         if percent is None:
             return None
 
-        return (
-            GradingScale.query
-            .filter(GradingScale.min_score <= percent)
-            .filter(GradingScale.max_score >= percent)
-            .first()
-        )
+        return grading_scale.grade_for(percent, programme, level)
+
+    @staticmethod
+    def grades_for(scores, programme=None, level=None):
+        """Grade a batch of scores against one programme/level scale (list of GradeBand or None)."""
+        return grading_scale.grades_for(scores, programme, level)
 
     @staticmethod
     def get_all_grades():
@@ -516,10 +759,10 @@ COMPLETE GRADING SYSTEM IMPLEMENTATION GUIDE
    gpa = GradingCalculationEngine.calculate_gpa(grades)
    weighted_gpa = GradingCalculationEngine.calculate_weighted_gpa(grades)
    
-   Example 4: Full academic transcript
-   ────────────────────────────────────
-   all_grades = GradingCalculationEngine.get_student_all_grades(student_id=student.id)
-   cumulative_gpa = GradingCalculationEngine.calculate_gpa(all_grades)
+   Example 4: Semester GPA and CGPA (materialized, no grade scan)
+   ──────────────────────────────────────────────────────────────
+   summary = GPASummaryService.get(student.id, "2024", "1")
+   summary.semester_gpa, summary.cgpa, summary.credits_earned
    
    Example 5: Real calculation with numbers
    ──────────────────────────────────────
@@ -587,6 +830,9 @@ COMPLETE GRADING SYSTEM IMPLEMENTATION GUIDE
    • Credit-weighted GPA calculation
    • Multiplies grade_point by course credit hours
 
+   Student GPAs are materialized in StudentGPASummary and refreshed with
+   every grade write (services/gpa_summary_service.py)
+
 5. GRADING SCALE CONFIGURATION
    ────────────────────────────
    The system uses GradingScale model for configurable grades.
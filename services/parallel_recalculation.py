@@ -0,0 +1,351 @@
+"""
+PARALLEL SEMESTER RECALCULATION
+===============================
+Location: services/parallel_recalculation.py
+
+Recalculates every course grade of a semester outside the web process:
+
+- The work is partitioned by course and run in a ProcessPoolExecutor.
+  Each worker process builds its own minimal app, engine and session,
+  and runs GradingCalculationEngine.recalculate_semester() for one course.
+- A GradingJob row per semester is the lock. A second run is refused
+  while one is 'queued' or 'running' with a recent heartbeat, across
+  processes and machines. A crashed run's lock expires after
+  GRADING_JOB_STALE_SECONDS.
+- The admin POST only queues the job (status 'queued'); the pool runs in
+  `flask grading run-jobs`, scheduled as the lms-grading-jobs cron in
+  render.yaml, never inside a web worker.
+- Progress and per-course timings are written to the row as courses
+  finish. get_status() reads them for the admin status endpoint.
+- Student GPA summaries are refreshed once for the whole semester after
+  the last course, not by the workers.
+
+Entry points:
+  flask --app app grading recalculate --academic-year 2024 --semester 1
+  flask --app app grading run-jobs               (runs queued jobs)
+  POST /semester/<year>/<semester>/recalculate   (admin, queues a job)
+  GET  /semester/<year>/<semester>/recalculate/status
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from models import Course, GradingJob, SemesterResultRelease, db
+from services.gpa_summary_service import GPASummaryService
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_STALE_SECONDS = 900
+
+# Config copied into worker processes
+_WORKER_CONFIG_KEYS = ('SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_ENGINE_OPTIONS')
+
+_worker_app = None
+
+
+def _init_worker(config):
+    """Process pool initializer: a bare app with its own engine for this process."""
+    global _worker_app
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config.update(config)
+    db.init_app(app)
+    _worker_app = app
+
+
+def _recalculate_course(course_id, academic_year, semester):
+    """Run in a worker process: recalculate one course, timed."""
+    from services.grading_calculation_engine import GradingCalculationEngine
+
+    started = time.perf_counter()
+    with _worker_app.app_context():
+        result = GradingCalculationEngine.recalculate_semester(
+            academic_year, semester, course_ids=[course_id], refresh_gpa=False
+        )
+    courses = result['courses'] or [{'course_id': course_id, 'calculated': 0, 'errors': 0, 'skipped': True}]
+    return dict(courses[0], seconds=round(time.perf_counter() - started, 3))
+
+
+class ParallelRecalculationService:
+    """
+    Semester-wide grade recalculation across a process pool, guarded by a
+    GradingJob lock row.
+    """
+
+    @staticmethod
+    def start(academic_year, semester, workers=None, started_by=None):
+        """
+        Take the semester lock and recalculate all its courses (CLI).
+
+        Args:
+            academic_year: Academic year (e.g., "2024")
+            semester: Semester (e.g., "First" or "1")
+            workers: Worker processes (default: GRADING_JOB_WORKERS, capped by CPUs and courses)
+            started_by: Name recorded on the job
+
+        Returns:
+            dict with success, message and (when started) the job status
+        """
+        refused = ParallelRecalculationService._refuse(academic_year, semester)
+        if refused:
+            return refused
+
+        course_ids = ParallelRecalculationService._course_ids(academic_year, semester)
+        job = ParallelRecalculationService._acquire(
+            academic_year, semester, started_by, len(course_ids), 'running'
+        )
+        if job is None:
+            return {
+                'success': False,
+                'message': f"A recalculation for {academic_year} {semester} is already queued or running"
+            }
+
+        workers = ParallelRecalculationService._worker_count(workers, len(course_ids))
+        job.workers = workers
+        db.session.commit()
+
+        ParallelRecalculationService._run(job.id, course_ids, workers)
+
+        return {
+            'success': True,
+            'message': f"Recalculated {len(course_ids)} courses for {academic_year} {semester} with {workers} workers",
+            'job': ParallelRecalculationService.get_status(academic_year, semester),
+        }
+
+    @staticmethod
+    def enqueue(academic_year, semester, started_by=None):
+        """
+        Take the semester lock as a 'queued' job for run_queued() to pick up
+        (admin POST). Returns dict with success, message and the job status.
+        """
+        refused = ParallelRecalculationService._refuse(academic_year, semester)
+        if refused:
+            return refused
+
+        course_ids = ParallelRecalculationService._course_ids(academic_year, semester)
+        job = ParallelRecalculationService._acquire(
+            academic_year, semester, started_by, len(course_ids), 'queued'
+        )
+        if job is None:
+            return {
+                'success': False,
+                'message': f"A recalculation for {academic_year} {semester} is already queued or running"
+            }
+
+        return {
+            'success': True,
+            'message': f"Queued recalculation of {len(course_ids)} courses for {academic_year} {semester}",
+            'job': job.to_dict(),
+        }
+
+    @staticmethod
+    def run_queued(workers=None):
+        """
+        Run every queued job, oldest first. A job is claimed with a
+        conditional UPDATE, so concurrent runners never share one.
+        Returns the finished jobs' status dicts.
+        """
+        finished = []
+        queued = GradingJob.query.filter_by(status='queued').order_by(GradingJob.heartbeat_at).all()
+        for job in queued:
+            claimed = GradingJob.query.filter_by(id=job.id, status='queued').update(
+                {'status': 'running', 'started_at': datetime.utcnow(), 'heartbeat_at': datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.session.commit()
+            if not claimed:
+                continue
+            db.session.refresh(job)
+
+            # Released or locked since it was queued
+            refused = ParallelRecalculationService._refuse(job.academic_year, job.semester)
+            if refused:
+                job.status = 'failed'
+                job.error = refused['message']
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                finished.append(job.to_dict())
+                continue
+
+            course_ids = ParallelRecalculationService._course_ids(job.academic_year, job.semester)
+            job.total_courses = len(course_ids)
+            job.workers = ParallelRecalculationService._worker_count(workers, len(course_ids))
+            db.session.commit()
+            finished.append(ParallelRecalculationService._run(job.id, course_ids, job.workers))
+        return finished
+
+    @staticmethod
+    def get_status(academic_year, semester):
+        """Latest job for a semester as a dict, or None if it was never run."""
+        job = GradingJob.query.filter_by(academic_year=academic_year, semester=semester).first()
+        if job is None:
+            return None
+        db.session.refresh(job)
+        return job.to_dict()
+
+    # ============ INTERNALS ============
+
+    @staticmethod
+    def _refuse(academic_year, semester):
+        """Failure dict if the semester may not be recalculated now, else None."""
+        release = SemesterResultRelease.query.filter_by(
+            academic_year=academic_year, semester=semester
+        ).first()
+        if release and release.is_locked:
+            return {
+                'success': False,
+                'message': f"Semester {academic_year} {semester} is locked; unlock it to recalculate"
+            }
+        if release and release.is_released:
+            # Students are served the released snapshots; recall first
+            return {
+                'success': False,
+                'message': f"Results for {academic_year} {semester} are released; recall them to recalculate"
+            }
+        return None
+
+    @staticmethod
+    def _course_ids(academic_year, semester):
+        return [
+            course_id for (course_id,) in db.session.query(Course.id)
+            .filter_by(academic_year=academic_year, semester=semester)
+            .order_by(Course.id)
+        ]
+
+    @staticmethod
+    def _worker_count(workers, course_count):
+        from flask import current_app
+
+        if not workers:
+            workers = int(current_app.config.get('GRADING_JOB_WORKERS') or DEFAULT_WORKERS)
+        return max(1, min(workers, os.cpu_count() or 1, course_count or 1))
+
+    @staticmethod
+    def _acquire(academic_year, semester, started_by, total_courses, status):
+        """
+        Mark the semester's job row 'running' or 'queued'. Returns the
+        GradingJob, or None if another run holds the lock.
+        """
+        from flask import current_app
+
+        stale_seconds = float(current_app.config.get('GRADING_JOB_STALE_SECONDS') or DEFAULT_STALE_SECONDS)
+        now = datetime.utcnow()
+        values = {
+            'status': status,
+            'started_by': started_by,
+            'total_courses': total_courses,
+            'completed_courses': 0,
+            'failed_courses': 0,
+            'rows_calculated': 0,
+            'course_timings': None,
+            'error': None,
+            'started_at': now,
+            'heartbeat_at': now,
+            'finished_at': None,
+        }
+
+        job = GradingJob.query.filter_by(academic_year=academic_year, semester=semester).first()
+        if job is None:
+            db.session.add(GradingJob(academic_year=academic_year, semester=semester, **values))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another process created the row (and took the lock) first
+                db.session.rollback()
+                return None
+        else:
+            # Conditional UPDATE: only one caller can flip a free or stale row
+            taken = GradingJob.query.filter(
+                GradingJob.id == job.id,
+                or_(
+                    GradingJob.status.not_in(('running', 'queued')),
+                    GradingJob.heartbeat_at == None,
+                    GradingJob.heartbeat_at < now - timedelta(seconds=stale_seconds),
+                ),
+            ).update(values, synchronize_session=False)
+            db.session.commit()
+            if not taken:
+                return None
+
+        return GradingJob.query.filter_by(academic_year=academic_year, semester=semester).first()
+
+    @staticmethod
+    def _run(job_id, course_ids, workers):
+        """Recalculate the courses, recording progress on the job row."""
+        from flask import current_app
+
+        job = GradingJob.query.get(job_id)
+        academic_year, semester = job.academic_year, job.semester
+        timings = []
+
+        def record(result):
+            timings.append(result)
+            job.completed_courses = len(timings)
+            job.failed_courses = sum(1 for r in timings if r.get('error'))
+            job.rows_calculated = sum(r.get('calculated', 0) for r in timings)
+            job.course_timings = json.dumps(timings)
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+
+        started = time.perf_counter()
+        try:
+            if workers <= 1:
+                # Small semesters (and SQLite in tests): same work, no pool
+                from services.grading_calculation_engine import GradingCalculationEngine
+
+                for course_id in course_ids:
+                    course_started = time.perf_counter()
+                    result = GradingCalculationEngine.recalculate_semester(
+                        academic_year, semester, course_ids=[course_id], refresh_gpa=False
+                    )
+                    course_result = result['courses'][0] if result['courses'] else {
+                        'course_id': course_id, 'calculated': 0, 'errors': 0, 'skipped': True
+                    }
+                    record(dict(course_result, seconds=round(time.perf_counter() - course_started, 3)))
+            else:
+                config = {key: current_app.config[key] for key in _WORKER_CONFIG_KEYS if key in current_app.config}
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(config,),
+                ) as pool:
+                    futures = {
+                        pool.submit(_recalculate_course, course_id, academic_year, semester): course_id
+                        for course_id in course_ids
+                    }
+                    for future in as_completed(futures):
+                        try:
+                            record(future.result())
+                        except Exception as e:
+                            logger.exception("Recalculation of course %s failed", futures[future])
+                            record({'course_id': futures[future], 'calculated': 0, 'errors': 0, 'error': str(e)})
+
+            # Once, here: workers refreshing a student from two courses at a time would collide
+            GPASummaryService.refresh_semester(academic_year, semester)
+            db.session.commit()
+
+            job.status = 'failed' if job.failed_courses else 'completed'
+        except Exception as e:
+            logger.exception("Recalculation for %s %s failed", academic_year, semester)
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info(
+            f"Recalculated {job.rows_calculated} grades in {job.completed_courses} courses for "
+            f"{academic_year} {semester} ({workers} workers, {time.perf_counter() - started:.1f}s, "
+            f"{job.failed_courses} failed)"
+        )
+        return job.to_dict()
@@ -3,16 +3,19 @@ RESULT BUILDER SERVICE
 ======================
 Location: services/result_builder.py
 
-Builds student results by aggregating grades by semester and calculating GPA.
+Builds student results by aggregating grades by semester. GPA, CGPA and
+credit totals are read from StudentGPASummary (services/gpa_summary_service.py).
 Used by student and admin dashboards.
 """
 
 from models import (
     StudentCourseGrade, StudentCourseRegistration, Course, 
-    StudentProfile, User, SemesterResultRelease, db
+    StudentGPASummary, StudentProfile, User, SemesterResultRelease, db
 )
-from sqlalchemy import func
+from sqlalchemy import and_, case, func, literal
 from datetime import datetime
+from services.gpa_summary_service import GPASummaryService
+from utils.extensions import semester_cache
 
 
 class ResultBuilder:
@@ -30,6 +33,9 @@ class ResultBuilder:
             student_id: Student's database ID (not user_id)
             academic_year: Academic year (optional - uses current if not provided)
             semester: Semester (optional - uses current if not provided)
+
+        Released results come from the student's ResultSnapshot once it has
+        been written (services/result_snapshot_service.py).
             
         Returns:
             dict with:
@@ -38,6 +44,7 @@ class ResultBuilder:
                 - semester: The semester
                 - released: Whether results are released to student
                 - semester_gpa: GPA for this semester
+                - cgpa: Cumulative GPA up to this semester
                 - credit_hours: Total credit hours taken
         """
         
@@ -60,23 +67,6 @@ class ResultBuilder:
             academic_year = release.academic_year
             semester = release.semester
 
-        # Get all grades for this semester. Use `is_finalized` if present; otherwise
-        # treat non-NULL `final_score` as finalized.
-        if hasattr(StudentCourseGrade, 'is_finalized'):
-            grades = StudentCourseGrade.query.filter_by(
-                student_id=student_id,
-                academic_year=academic_year,
-                semester=semester,
-                is_finalized=True
-            ).all()
-        else:
-            grades = StudentCourseGrade.query.filter(
-                StudentCourseGrade.student_id == student_id,
-                StudentCourseGrade.academic_year == academic_year,
-                StudentCourseGrade.semester == semester,
-                StudentCourseGrade.final_score != None
-            ).all()
-
         # Check if released
         is_released = (
             SemesterResultRelease.query.filter_by(
@@ -86,18 +76,60 @@ class ResultBuilder:
             ).first() is not None
         )
 
-        # Build results list
+        # Released results are served from the student's snapshot when it exists
+        if is_released:
+            from services.result_snapshot_service import ResultSnapshotService
+
+            snapshot = ResultSnapshotService.get(student_id, academic_year, semester)
+            if snapshot is not None:
+                return snapshot.data
+
+        return ResultBuilder._build_semesters(
+            academic_year, semester, is_released, [student_id]
+        )[student_id]
+
+    @staticmethod
+    def _build_semesters(academic_year, semester, is_released, student_ids=None):
+        """
+        semester() results for many students at once: {student_id: dict}.
+        Grades, courses, assessment schemes and GPA summaries are loaded in
+        one query each. Without student_ids, every student with a counted
+        grade in the semester is built.
+        """
         from models import CourseAssessmentScheme
-        results = []
-        total_points = 0.0
-        total_credits = 0
-        
-        for grade in grades:
-            course = grade.course
-            # Fetch assessment scheme for this course (to show weights)
-            scheme = CourseAssessmentScheme.query.filter_by(course_id=course.id).first()
-            
-            result_entry = {
+
+        # Get all grades for this semester. Use `is_finalized` if present; otherwise
+        # treat non-NULL `final_score` as finalized.
+        query = (
+            db.session.query(StudentCourseGrade, Course)
+            .join(Course, Course.id == StudentCourseGrade.course_id)
+            .filter(
+                StudentCourseGrade.academic_year == academic_year,
+                StudentCourseGrade.semester == semester
+            )
+        )
+        if hasattr(StudentCourseGrade, 'is_finalized'):
+            query = query.filter(StudentCourseGrade.is_finalized == True)
+        else:
+            query = query.filter(StudentCourseGrade.final_score != None)
+        if student_ids is not None:
+            query = query.filter(StudentCourseGrade.student_id.in_(student_ids))
+        rows = query.order_by(StudentCourseGrade.id).all()
+
+        # First assessment scheme of each course (to show weights)
+        schemes = {}
+        course_ids = {course.id for _, course in rows}
+        if course_ids:
+            for scheme in (CourseAssessmentScheme.query
+                           .filter(CourseAssessmentScheme.course_id.in_(course_ids))
+                           .order_by(CourseAssessmentScheme.id)):
+                schemes.setdefault(scheme.course_id, scheme)
+
+        # Build results lists
+        results = {sid: [] for sid in student_ids} if student_ids is not None else {}
+        for grade, course in rows:
+            scheme = schemes.get(course.id)
+            results.setdefault(grade.student_id, []).append({
                 "course_code": course.code,
                 "course_name": course.name,
                 "credit_hours": course.credit_hours or 3,
@@ -115,25 +147,29 @@ class ResultBuilder:
                 "quiz_weight": scheme.quiz_weight if scheme else 10.0,
                 "assignment_weight": scheme.assignment_weight if scheme else 30.0,
                 "exam_weight": scheme.exam_weight if scheme else 60.0
-            }
-            results.append(result_entry)
-            
-            total_points += (grade.grade_point or 0) * (course.credit_hours or 3)
-            total_credits += course.credit_hours or 3
+            })
 
-        # Calculate semester GPA
-        semester_gpa = (total_points / total_credits) if total_credits > 0 else 0.0
+        summaries = GPASummaryService.for_semester(academic_year, semester, list(results))
 
-        return {
-            "results": results,
-            "academic_year": academic_year,
-            "semester": semester,
-            "released": is_released,
-            "semester_gpa": round(semester_gpa, 2),
-            "credit_hours": total_credits,
-            "total_points": round(total_points, 2),
-            "total_grades": len(grades)
-        }
+        built = {}
+        for student_id, student_results in results.items():
+            summary = summaries.get(student_id)
+            if summary is None and student_results:
+                # Not backfilled yet
+                summary = GPASummaryService.get(student_id, academic_year, semester)
+            built[student_id] = {
+                "results": student_results,
+                "academic_year": academic_year,
+                "semester": semester,
+                "released": is_released,
+                "semester_gpa": summary.semester_gpa if summary else 0.0,
+                "cgpa": summary.cgpa if summary else 0.0,
+                "credit_hours": summary.credits_attempted if summary else 0,
+                "credits_earned": summary.credits_earned if summary else 0,
+                "total_points": round(summary.quality_points, 2) if summary else 0.0,
+                "total_grades": len(student_results)
+            }
+        return built
 
     @staticmethod
     def transcript(student_id):
@@ -179,34 +215,20 @@ class ResultBuilder:
                 "score": grade.final_score,
                 "grade": grade.grade_letter,
                 "grade_point": grade.grade_point,
+                "points": (grade.grade_point or 0) * (course.credit_hours or 3),
                 "academic_year": grade.academic_year,
                 "semester": grade.semester
             })
 
-        # Calculate overall GPA
-        gpa_mapping = {
-            'A': 4.0, 'A-': 3.7,
-            'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-            'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-            'D+': 1.3, 'D': 1.0, 'F': 0.0
-        }
-        
-        total_points = 0.0
-        total_credits = 0
+        # Count grades
         grade_distribution = {}
-        
         for grade in all_grades:
-            gp = gpa_mapping.get(grade.grade_letter, 0)
-            credits = grade.course.credit_hours or 3
-            total_points += gp * credits
-            total_credits += credits
-            
-            # Count grades
             grade_distribution[grade.grade_letter] = (
                 grade_distribution.get(grade.grade_letter, 0) + 1
             )
 
-        overall_gpa = (total_points / total_credits) if total_credits > 0 else 0.0
+        # Overall GPA: CGPA as of the latest semester
+        latest = GPASummaryService.latest(student_id)
 
         # Sort by year/semester (newest first)
         sorted_records = {}
@@ -215,8 +237,13 @@ class ResultBuilder:
 
         return {
             "records": sorted_records,
-            "overall_gpa": round(overall_gpa, 2),
-            "total_credits": total_credits,
+            "overall_gpa": latest.cgpa if latest else 0.0,
+            "total_credits": latest.cumulative_credits_attempted if latest else 0,
+            "credits_earned": latest.cumulative_credits_earned if latest else 0,
+            "semester_gpas": {
+                (row.academic_year, row.semester): row.semester_gpa
+                for row in GPASummaryService.for_student(student_id)
+            },
             "total_grades": len(all_grades),
             "grade_distribution": grade_distribution
         }
@@ -237,37 +264,13 @@ class ResultBuilder:
         student = User.query.get(student_id)
         profile = StudentProfile.query.filter_by(user_id=student.user_id).first()
         
-        # Get latest semester results. Use `is_finalized` when available,
-        # otherwise select grades with non-NULL `final_score`.
-        if hasattr(StudentCourseGrade, 'is_finalized'):
-            latest_grades = (
-                StudentCourseGrade.query
-                .filter_by(student_id=student_id, is_finalized=True)
-                .order_by(StudentCourseGrade.calculated_at.desc())
-                .limit(5)
-                .all()
-            )
-        else:
-            latest_grades = (
-                StudentCourseGrade.query
-                .filter(StudentCourseGrade.student_id == student_id,
-                        StudentCourseGrade.final_score != None)
-                .order_by(StudentCourseGrade.calculated_at.desc())
-                .limit(5)
-                .all()
-            )
-        
-        # Calculate current semester GPA (if available)
-        if latest_grades:
-            latest_year = latest_grades[0].academic_year
-            latest_sem = latest_grades[0].semester
-            latest_result = ResultBuilder.semester(student_id, latest_year, latest_sem)
+        # Latest semester with counted grades; its row also carries the CGPA
+        latest = GPASummaryService.latest(student_id)
+        if latest:
+            latest_result = ResultBuilder.semester(student_id, latest.academic_year, latest.semester)
         else:
             latest_result = None
 
-        # Get all-time transcript
-        transcript = ResultBuilder.transcript(student_id)
-
         return {
             "student_name": f"{student.first_name} {student.last_name}",
             "student_id": student.user_id,
@@ -276,9 +279,9 @@ class ResultBuilder:
             "index_number": profile.index_number if profile else None,
             "admission_date": profile.admission_date if profile else None,
             "latest_semester": latest_result,
-            "overall_gpa": transcript["overall_gpa"],
-            "total_credits": transcript["total_credits"],
-            "total_grades": transcript["total_grades"],
+            "overall_gpa": latest.cgpa if latest else 0.0,
+            "total_credits": latest.cumulative_credits_attempted if latest else 0,
+            "total_grades": latest.cumulative_courses if latest else 0,
             "academic_status": profile.academic_status if profile else "Unknown"
         }
 
@@ -295,17 +298,88 @@ class ResultBuilder:
             
         Returns:
             dict with class-level statistics and individual results
+            (ranked by semester GPA; cached until the semester's grades or
+            release state change)
         """
-        
-        # Get all students in this class
-        students = StudentProfile.query.filter_by(
-            current_programme=programme_name,
-            programme_level=programme_level
-        ).all()
-        
+        return semester_cache.get_or_build(
+            academic_year, semester,
+            ('class_results', programme_name, str(programme_level)),
+            lambda: ResultBuilder._build_class_results(
+                academic_year, semester, programme_name, programme_level
+            )
+        )
+
+    @staticmethod
+    def _build_class_results(academic_year, semester, programme_name, programme_level):
+        """
+        One grouped query over the class: per-student grade counts and
+        semester GPA (StudentGPASummary), with rank (ties share a rank) and
+        position from window functions. Students without grades this
+        semester count towards total_students only.
+        """
+        if hasattr(StudentCourseGrade, 'is_finalized'):
+            finalized_expr = StudentCourseGrade.is_finalized == True
+        else:
+            finalized_expr = StudentCourseGrade.final_score != None
+
+        grades_count = func.count(StudentCourseGrade.id)
+        passed = func.coalesce(func.sum(case((StudentCourseGrade.pass_fail == 'PASS', 1), else_=0)), 0)
+        finalized = func.coalesce(func.sum(case((finalized_expr, 1), else_=0)), 0)
+        if hasattr(StudentCourseGrade, 'is_released'):
+            released = func.coalesce(func.sum(case((StudentCourseGrade.is_released == True, 1), else_=0)), 0)
+        else:
+            released = literal(0)
+        gpa = func.coalesce(func.max(StudentGPASummary.semester_gpa), 0.0)
+        # Students without grades sort (and rank) after everyone else
+        ungraded_last = case((grades_count > 0, 0), else_=1)
+
+        rows = (
+            db.session.query(
+                User.user_id,
+                User.first_name,
+                User.last_name,
+                StudentProfile.index_number,
+                grades_count.label('grades_count'),
+                passed.label('passed'),
+                finalized.label('finalized'),
+                released.label('released'),
+                gpa.label('gpa'),
+                func.rank().over(order_by=(ungraded_last, gpa.desc())).label('rank'),
+                func.row_number().over(
+                    order_by=(ungraded_last, gpa.desc(), User.last_name, User.first_name, User.id)
+                ).label('position'),
+            )
+            .select_from(StudentProfile)
+            .join(User, User.user_id == StudentProfile.user_id)
+            .outerjoin(StudentCourseGrade, and_(
+                StudentCourseGrade.student_id == User.id,
+                StudentCourseGrade.academic_year == academic_year,
+                StudentCourseGrade.semester == semester,
+            ))
+            .outerjoin(StudentGPASummary, and_(
+                StudentGPASummary.student_id == User.id,
+                StudentGPASummary.academic_year == academic_year,
+                StudentGPASummary.semester == semester,
+            ))
+            .filter(
+                StudentProfile.current_programme == programme_name,
+                StudentProfile.programme_level == programme_level,
+            )
+            .group_by(User.id, User.user_id, User.first_name, User.last_name, StudentProfile.index_number)
+            .order_by('position')
+            .all()
+        )
+
+        # Without per-grade release flags, the semester's release applies to every grade
+        semester_released = hasattr(StudentCourseGrade, 'is_released') or (
+            SemesterResultRelease.query.filter_by(
+                academic_year=academic_year, semester=semester, is_released=True
+            ).first() is not None
+        )
+
         student_results = []
         class_stats = {
-            'total_students': len(students),
+            'total_students': len(rows),
             'grades_submitted': 0,
             'grades_finalized': 0,
             'grades_released': 0,
@@ -314,66 +388,40 @@ class ResultBuilder:
             'lowest_gpa': 4.0,
             'pass_rate': 0.0
         }
-        
         total_gpa = 0.0
         passes = 0
-        
-        for student in students:
-            user = User.query.filter_by(user_id=student.user_id).first()
-            if not user:
-                continue
-            
-            # Get all grades for this semester
-            grades = StudentCourseGrade.query.filter_by(
-                student_id=user.id,
-                academic_year=academic_year,
-                semester=semester
-            ).all()
-            
-            if not grades:
+
+        for row in rows:
+            if not row.grades_count:
                 continue
-            
-            # Calculate student GPA for this semester
-            gpa_mapping = {
-                'A': 4.0, 'A-': 3.7,
-                'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-                'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-                'D+': 1.3, 'D': 1.0, 'F': 0.0
-            }
-            
-            total_points = sum(
-                gpa_mapping.get(g.grade_letter, 0) for g in grades
+            is_finalized = row.finalized == row.grades_count
+            is_released = semester_released and (
+                row.released == row.grades_count if hasattr(StudentCourseGrade, 'is_released') else True
             )
-            gpa = total_points / len(grades) if grades else 0.0
-            
-            pass_count = sum(
-                1 for g in grades if g.pass_fail == 'PASS'
-            )
-            
             student_results.append({
-                'student_id': student.user_id,
-                'name': f"{user.first_name} {user.last_name}",
-                'index_number': student.index_number,
-                'gpa': round(gpa, 2),
-                'grades_count': len(grades),
-                'passed': pass_count,
-                'failed': len(grades) - pass_count,
-                'is_finalized': all(getattr(g, 'is_finalized', g.final_score is not None) for g in grades),
-                'is_released': all(getattr(g, 'is_released', False) for g in grades)
+                'student_id': row.user_id,
+                'name': f"{row.first_name} {row.last_name}",
+                'index_number': row.index_number,
+                'gpa': round(row.gpa, 2),
+                'rank': row.rank,
+                'position': row.position,
+                'grades_count': row.grades_count,
+                'passed': row.passed,
+                'failed': row.grades_count - row.passed,
+                'is_finalized': is_finalized,
+                'is_released': is_released
             })
-            
-            total_gpa += gpa
-            class_stats['grades_submitted'] += len(grades)
-            if all(getattr(g, 'is_finalized', g.final_score is not None) for g in grades):
+
+            total_gpa += row.gpa
+            class_stats['grades_submitted'] += row.grades_count
+            if is_finalized:
                 class_stats['grades_finalized'] += 1
-            if all(getattr(g, 'is_released', False) for g in grades):
+            if is_released:
                 class_stats['grades_released'] += 1
-            
-            if pass_count == len(grades):
+            if row.passed == row.grades_count:
                 passes += 1
-            
-            class_stats['highest_gpa'] = max(class_stats['highest_gpa'], gpa)
-            class_stats['lowest_gpa'] = min(class_stats['lowest_gpa'], gpa)
+            class_stats['highest_gpa'] = max(class_stats['highest_gpa'], row.gpa)
+            class_stats['lowest_gpa'] = min(class_stats['lowest_gpa'], row.gpa)
 
         if student_results:
             class_stats['average_gpa'] = round(
@@ -389,10 +437,5 @@ class ResultBuilder:
             'programme': programme_name,
             'level': programme_level,
             'statistics': class_stats,
-            'student_results': sorted(
-                student_results,
-                key=lambda x: x['gpa'],
-                reverse=True
-            )
+            'student_results': student_results
         }
-    
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+RESULT SNAPSHOT SERVICE
+=======================
+Location: services/result_snapshot_service.py
+
+Released semester results are read by every student at once on release
+day but do not change until the semester is recalled, so each student's
+ResultBuilder.semester() output is written once as a JSON ResultSnapshot
+and served from there (with its SHA-256 as the ETag).
+
+  - release_semester_results() queues generate() in a background task;
+    until it commits, results are built live as before
+  - generate() is a bulk job: students are built in chunks with one query
+    per table and the new version is inserted in one transaction, after
+    which older versions are dropped. Rows are never updated.
+  - recall_semester_results() deletes the semester's snapshots in its own
+    transaction (invalidate())
+  - release, recall and generate() all lock the SemesterResultRelease row
+    first, and snapshots are only served while that row is released
+  - re-run by hand: flask --app app grading snapshot-results
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from models import ResultSnapshot, SemesterResultRelease, StudentCourseGrade, db
+from services.result_builder import ResultBuilder
+from sqlalchemy import and_, delete, func, insert
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CHUNK = 500
+
+
+class ResultSnapshotService:
+    """Static-method service over the result_snapshot table."""
+
+    @staticmethod
+    def get(student_id, academic_year, semester):
+        """The student's current snapshot for a semester, or None if it is not released."""
+        return (
+            ResultSnapshot.query
+            .join(SemesterResultRelease, and_(
+                SemesterResultRelease.academic_year == ResultSnapshot.academic_year,
+                SemesterResultRelease.semester == ResultSnapshot.semester,
+            ))
+            .filter(
+                ResultSnapshot.student_id == student_id,
+                ResultSnapshot.academic_year == academic_year,
+                ResultSnapshot.semester == semester,
+                SemesterResultRelease.is_released == True
+            )
+            .order_by(ResultSnapshot.version.desc())
+            .first()
+        )
+
+    @staticmethod
+    def generate(academic_year, semester):
+        """
+        Write a new snapshot version for every student with results in a
+        released semester, in one transaction. Returns a dict with success,
+        message, version and written.
+
+        The semester's release row is locked (SELECT ... FOR UPDATE) for the
+        whole run, so concurrent runs take versions one after the other and
+        a recall waits for the new version and then deletes it.
+        """
+        release = ResultSnapshotService.lock_release(academic_year, semester)
+        if not release or not release.is_released:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f"Results for {academic_year} {semester} are not released"
+            }
+
+        version = (db.session.query(func.max(ResultSnapshot.version)).filter_by(
+            academic_year=academic_year, semester=semester
+        ).scalar() or 0) + 1
+
+        graded = db.session.query(StudentCourseGrade.student_id).filter(
+            StudentCourseGrade.academic_year == academic_year,
+            StudentCourseGrade.semester == semester
+        )
+        if hasattr(StudentCourseGrade, 'is_finalized'):
+            graded = graded.filter(StudentCourseGrade.is_finalized == True)
+        else:
+            graded = graded.filter(StudentCourseGrade.final_score != None)
+        student_ids = sorted(sid for (sid,) in graded.distinct())
+
+        written = 0
+        try:
+            now = datetime.utcnow()
+            for start in range(0, len(student_ids), SNAPSHOT_CHUNK):
+                built = ResultBuilder._build_semesters(
+                    academic_year, semester, True, student_ids[start:start + SNAPSHOT_CHUNK]
+                )
+                rows = []
+                for student_id, data in built.items():
+                    payload = ResultSnapshotService.serialize(data)
+                    rows.append({
+                        'student_id': student_id,
+                        'academic_year': academic_year,
+                        'semester': semester,
+                        'version': version,
+                        'payload': payload,
+                        'etag': hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+                        'created_at': now,
+                    })
+                if rows:
+                    db.session.execute(insert(ResultSnapshot), rows)
+                written += len(rows)
+
+            db.session.execute(delete(ResultSnapshot).where(
+                ResultSnapshot.academic_year == academic_year,
+                ResultSnapshot.semester == semester,
+                ResultSnapshot.version < version
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error writing result snapshots for {academic_year} {semester}")
+            return {
+                'success': False,
+                'message': f"Could not write result snapshots: {e}"
+            }
+
+        logger.info(f"Wrote {written} result snapshots for {academic_year} {semester} (v{version})")
+
+        return {
+            'success': True,
+            'message': f"Wrote {written} result snapshots for {academic_year} {semester} (version {version})",
+            'version': version,
+            'written': written
+        }
+
+    @staticmethod
+    def lock_release(academic_year, semester):
+        """
+        The semester's SemesterResultRelease row, locked until the caller's
+        transaction ends (or None). generate(), release and recall all take
+        this lock first.
+        """
+        return (
+            SemesterResultRelease.query
+            .filter_by(academic_year=academic_year, semester=semester)
+            .populate_existing()
+            .with_for_update()
+            .first()
+        )
+
+    @staticmethod
+    def invalidate(academic_year, semester):
+        """Delete a semester's snapshots in the caller's transaction. Returns rows deleted."""
+        return db.session.execute(delete(ResultSnapshot).where(
+            ResultSnapshot.academic_year == academic_year,
+            ResultSnapshot.semester == semester
+        )).rowcount
+
+    @staticmethod
+    def queue_generate(academic_year, semester):
+        """Run generate() in a background task (call after the release commits)."""
+        from flask import current_app
+        from utils.extensions import socketio
+
+        app = current_app._get_current_object()
+        socketio.start_background_task(
+            ResultSnapshotService._generate_in_app, app, academic_year, semester
+        )
+
+    @staticmethod
+    def serialize(data):
+        """Canonical JSON for a result dict (the same dict always gives the same ETag)."""
+        return json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+
+    # ============ INTERNALS ============
+
+    @staticmethod
+    def _generate_in_app(app, academic_year, semester):
+        with app.app_context():
+            try:
+                result = ResultSnapshotService.generate(academic_year, semester)
+                if not result['success']:
+                    logger.warning(result['message'])
+            finally:
+                db.session.remove()
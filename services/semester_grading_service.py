@@ -13,9 +13,13 @@ Handles semester-level operations:
 from datetime import datetime
 from models import (
     StudentCourseRegistration, Course, SemesterResultRelease, 
-    StudentCourseGrade, StudentProfile, User, db
+    StudentCourseGrade, StudentGPASummary, StudentProfile, User, db
 )
+from services.gpa_summary_service import GPASummaryService
 from services.grading_calculation_engine import GradingCalculationEngine
+from services.result_snapshot_service import ResultSnapshotService
+from sqlalchemy import case, func, literal
+from utils.extensions import semester_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -55,51 +59,17 @@ class SemesterGradingService:
                 'errors': ['Course not found']
             }
 
-        # Get all registrations for this course/semester
-        registrations = StudentCourseRegistration.query.filter_by(
-            course_id=course_id,
-            academic_year=academic_year,
-            semester=semester
-        ).all()
-
-        success_count = 0
-        error_count = 0
-        errors = []
-
-        for registration in registrations:
-            try:
-                student = User.query.get(registration.student_id)
-                if not student:
-                    error_count += 1
-                    errors.append({
-                        'student_id': registration.student_id,
-                        'error': 'Student not found'
-                    })
-                    continue
-
-                GradingCalculationEngine.calculate_course_grade(
-                    student.user_id,
-                    course_id,
-                    academic_year,
-                    semester
-                )
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                errors.append({
-                    'student_id': registration.student_id,
-                    'error': str(e)
-                })
-                logger.exception(f"Error calculating grade for student {registration.student_id}")
+        results = SemesterGradingService._finalize(academic_year, semester, [course_id])
+        course_result = results['courses'][0] if results['courses'] else {}
 
         return {
-            'success_count': success_count,
-            'error_count': error_count,
-            'errors': errors,
+            'success_count': course_result.get('success_count', 0),
+            'error_count': course_result.get('error_count', 0),
+            'errors': course_result.get('errors', []),
             'course': course,
             'academic_year': academic_year,
             'semester': semester,
-            'total_students': len(registrations)
+            'total_students': course_result.get('success_count', 0) + course_result.get('error_count', 0)
         }
 
     @staticmethod
@@ -114,13 +84,30 @@ class SemesterGradingService:
         Returns:
             dict with results for each course
         """
-        # Get all unique courses for this semester
-        courses = (
-            Course.query
-            .filter_by(academic_year=academic_year, semester=semester)
-            .all()
+        results = SemesterGradingService._finalize(academic_year, semester)
+
+        logger.info(
+            f"Finalized {results['total_success']} grades for "
+            f"{academic_year} {semester}"
         )
 
+        return results
+
+    @staticmethod
+    def _finalize(academic_year, semester, course_ids=None):
+        """
+        Calculate and finalize a semester's grades in one transaction.
+
+        Grades come from the engine's set-based recalculation (one savepoint
+        per course, so a failing course does not undo the others), the
+        is_finalized flag is set with one UPDATE, and the students' GPA
+        summaries are refreshed once before the single commit.
+        """
+        courses = Course.query.filter_by(academic_year=academic_year, semester=semester)
+        if course_ids is not None:
+            courses = courses.filter(Course.id.in_(course_ids))
+        courses = {course.id: course for course in courses.order_by(Course.id)}
+
         results = {
             'academic_year': academic_year,
             'semester': semester,
@@ -129,63 +116,74 @@ class SemesterGradingService:
             'total_errors': 0,
             'timestamp': datetime.utcnow().isoformat()
         }
+        if not courses:
+            return results
 
-        for course in courses:
-            course_result = SemesterGradingService.finalize_semester_grades(
-                course.id, academic_year, semester
+        try:
+            outcome = GradingCalculationEngine.recalculate_semester(
+                academic_year, semester, course_ids=list(courses), refresh_gpa=False, commit=False
             )
-            results['courses'].append(course_result)
-            results['total_success'] += course_result['success_count']
-            results['total_errors'] += course_result['error_count']
-
-        logger.info(
-            f"Finalized {results['total_success']} grades for "
-            f"{academic_year} {semester}"
-        )
 
+            graded = SemesterGradingService._semester_grades(academic_year, semester, course_ids).filter(
+                StudentCourseGrade.final_score != None
+            )
+            if hasattr(StudentCourseGrade, 'is_finalized'):
+                SemesterGradingService._bulk_update(graded, {'is_finalized': True})
+            GPASummaryService.refresh_students(
+                sid for (sid,) in graded.with_entities(StudentCourseGrade.student_id).distinct()
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error finalizing {academic_year} {semester}")
+            for course in courses.values():
+                results['courses'].append(SemesterGradingService._course_entry(
+                    course, success_count=0, error_count=0, errors=[str(e)]
+                ))
+            results['total_errors'] = len(courses)
+            return results
+
+        for course_id in outcome['skipped_courses']:
+            results['courses'].append(SemesterGradingService._course_entry(
+                courses[course_id], success_count=0, error_count=0, errors=[], skipped=True
+            ))
+        for entry in outcome['courses']:
+            errors = [entry['error']] if entry.get('error') else []
+            results['courses'].append(SemesterGradingService._course_entry(
+                courses[entry['course_id']],
+                success_count=entry['calculated'], error_count=entry['errors'], errors=errors
+            ))
+            results['total_success'] += entry['calculated']
+            results['total_errors'] += entry['errors']
+        results['courses'].sort(key=lambda c: c['course_id'])
         return results
 
     @staticmethod
-    def release_semester_results(academic_year, semester):
+    def release_semester_results(academic_year, semester, notify=True):
         """
         Release results for a semester to students.
         Marks semester as released so students can view their grades.
+
+        The release flag and the grades are updated in one transaction;
+        once it commits, background tasks write the students' result
+        snapshots and notify them.
         
         Args:
             academic_year: Academic year (e.g., "2024")
             semester: Semester (e.g., "First" or "1")
+            notify: Queue "grade released" notifications for the students
             
         Returns:
-            dict with release information
+            dict with release information and per-course released counts
         """
-        # Check if release record exists
-        release = SemesterResultRelease.query.filter_by(
-            academic_year=academic_year,
-            semester=semester
-        ).first()
-
-        if not release:
-            release = SemesterResultRelease(
-                academic_year=academic_year,
-                semester=semester
-            )
-            db.session.add(release)
-
         # Check if all grades are finalized. Fall back to checking `final_score` when
         # model doesn't have `is_finalized` attribute.
+        grades = SemesterGradingService._semester_grades(academic_year, semester)
         if hasattr(StudentCourseGrade, 'is_finalized'):
-            unfinalized = StudentCourseGrade.query.filter_by(
-                academic_year=academic_year,
-                semester=semester,
-                is_finalized=False
-            ).count()
+            unfinalized = grades.filter(StudentCourseGrade.is_finalized == False).count()
         else:
             # treat a grade as finalized when `final_score` is not NULL
-            unfinalized = StudentCourseGrade.query.filter(
-                StudentCourseGrade.academic_year == academic_year,
-                StudentCourseGrade.semester == semester,
-                StudentCourseGrade.final_score == None
-            ).count()
+            unfinalized = grades.filter(StudentCourseGrade.final_score == None).count()
 
         if unfinalized > 0:
             return {
@@ -193,20 +191,43 @@ class SemesterGradingService:
                 'message': f"Cannot release: {unfinalized} grades not yet finalized"
             }
 
+        # Serializes with snapshot generation (services/result_snapshot_service.py)
+        release = ResultSnapshotService.lock_release(academic_year, semester)
+
+        if not release:
+            release = SemesterResultRelease(
+                academic_year=academic_year,
+                semester=semester
+            )
+            db.session.add(release)
+
+        now = datetime.utcnow()
         release.is_released = True
-        release.released_at = datetime.utcnow()
-        db.session.commit()
+        release.released_at = now
 
         # Mark all grades as released if the model supports those flags.
-        if hasattr(StudentCourseGrade, 'is_finalized') and hasattr(StudentCourseGrade, 'is_released'):
-            StudentCourseGrade.query.filter_by(
-                academic_year=academic_year,
-                semester=semester,
-                is_finalized=True
-            ).update({'is_released': True, 'released_at': datetime.utcnow()})
+        if hasattr(StudentCourseGrade, 'is_released'):
+            grades = grades.filter(StudentCourseGrade.is_released == False)
+        counts = SemesterGradingService._count_by_course(grades)
+        if hasattr(StudentCourseGrade, 'is_released'):
+            SemesterGradingService._bulk_update(grades, {'is_released': True, 'released_at': now})
+
+        try:
             db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error releasing results for {academic_year} {semester}")
+            return {
+                'success': False,
+                'message': f"Could not release results: {e}"
+            }
+
+        ResultSnapshotService.queue_generate(academic_year, semester)
+        if notify:
+            from utils.notification_engine import queue_semester_results_released
+            queue_semester_results_released(academic_year, semester)
 
-        logger.info(f"Released results for {academic_year} {semester}")
+        logger.info(f"Released results for {academic_year} {semester}: {sum(counts.values())} grades")
 
         return {
             'success': True,
@@ -214,7 +235,12 @@ class SemesterGradingService:
             'semester': semester,
             'is_released': True,
             'released_at': release.released_at,
-            'message': f"Results released for {academic_year} Semester {semester}"
+            'courses': SemesterGradingService._course_counts(counts),
+            'total_grades': sum(counts.values()),
+            'message': (
+                f"Results released for {academic_year} Semester {semester} "
+                f"({sum(counts.values())} grades in {len(counts)} courses)"
+            )
         }
 
     @staticmethod
@@ -228,12 +254,10 @@ class SemesterGradingService:
             semester: Semester
             
         Returns:
-            dict with updated release information
+            dict with updated release information and per-course recalled counts
         """
-        release = SemesterResultRelease.query.filter_by(
-            academic_year=academic_year,
-            semester=semester
-        ).first()
+        # Waits for a running snapshot generation, whose version is then deleted below
+        release = ResultSnapshotService.lock_release(academic_year, semester)
 
         if not release:
             return {
@@ -242,25 +266,40 @@ class SemesterGradingService:
             }
 
         release.is_released = False
-        db.session.commit()
 
         # Mark all grades as not released if supported by model
+        grades = SemesterGradingService._semester_grades(academic_year, semester)
         if hasattr(StudentCourseGrade, 'is_released'):
-            StudentCourseGrade.query.filter_by(
-                academic_year=academic_year,
-                semester=semester,
-                is_released=True
-            ).update({'is_released': False, 'released_at': None})
+            grades = grades.filter(StudentCourseGrade.is_released == True)
+        counts = SemesterGradingService._count_by_course(grades)
+        if hasattr(StudentCourseGrade, 'is_released'):
+            SemesterGradingService._bulk_update(grades, {'is_released': False, 'released_at': None})
+        ResultSnapshotService.invalidate(academic_year, semester)
+
+        try:
             db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error recalling results for {academic_year} {semester}")
+            return {
+                'success': False,
+                'error': f"Could not recall results: {e}"
+            }
+        SemesterGradingService._queue_recompute(academic_year, semester)
 
-        logger.info(f"Recalled results for {academic_year} {semester}")
+        logger.info(f"Recalled results for {academic_year} {semester}: {sum(counts.values())} grades")
 
         return {
             'success': True,
             'academic_year': academic_year,
             'semester': semester,
             'is_released': False,
-            'message': f"Results recalled for {academic_year} Semester {semester}"
+            'courses': SemesterGradingService._course_counts(counts),
+            'total_grades': sum(counts.values()),
+            'message': (
+                f"Results recalled for {academic_year} Semester {semester} "
+                f"({sum(counts.values())} grades in {len(counts)} courses)"
+            )
         }
 
     @staticmethod
@@ -345,6 +384,7 @@ class SemesterGradingService:
 
         release.is_locked = False
         db.session.commit()
+        SemesterGradingService._queue_recompute(academic_year, semester)
 
         logger.info(f"Unlocked semester {academic_year} {semester}")
 
@@ -356,6 +396,62 @@ class SemesterGradingService:
             'message': f"Semester {academic_year} {semester} is now unlocked"
         }
 
+    @staticmethod
+    def _queue_recompute(academic_year, semester):
+        """
+        Replay the score changes that were skipped while the semester was
+        locked or released (utils/grade_recompute.py); nothing else is regraded.
+        """
+        from utils.extensions import grade_recompute
+
+        grade_recompute.thaw(academic_year, semester)
+
+    @staticmethod
+    def _semester_grades(academic_year, semester, course_ids=None):
+        query = StudentCourseGrade.query.filter(
+            StudentCourseGrade.academic_year == academic_year,
+            StudentCourseGrade.semester == semester
+        )
+        if course_ids is not None:
+            query = query.filter(StudentCourseGrade.course_id.in_(course_ids))
+        return query
+
+    @staticmethod
+    def _count_by_course(grades):
+        """{course_id: rows} for a StudentCourseGrade query, in one grouped query."""
+        return dict(
+            grades.with_entities(StudentCourseGrade.course_id, func.count(StudentCourseGrade.id))
+            .group_by(StudentCourseGrade.course_id)
+            .all()
+        )
+
+    @staticmethod
+    def _bulk_update(grades, values):
+        """One UPDATE over the rows of a StudentCourseGrade query (no ORM objects loaded)."""
+        return grades.update(values, synchronize_session=False)
+
+    @staticmethod
+    def _course_entry(course, **values):
+        return {
+            'course_id': course.id,
+            'course_code': course.code,
+            'course_name': course.name,
+            'skipped': False,
+            **values
+        }
+
+    @staticmethod
+    def _course_counts(counts):
+        """Per-course affected-row counts as a list of {course_id, course_code, course_name, count}."""
+        if not counts:
+            return []
+        courses = Course.query.filter(Course.id.in_(list(counts))).order_by(Course.id)
+        return [
+            {'course_id': course.id, 'course_code': course.code, 'course_name': course.name,
+             'count': counts[course.id]}
+            for course in courses
+        ]
+
     @staticmethod
     def get_semester_status(academic_year, semester):
         """
@@ -396,74 +492,120 @@ class SemesterGradingService:
     def get_semester_summary(academic_year, semester):
         """
         Get summary statistics for a semester across all courses.
+
+        Built from one grouped query over the semester's grades and cached
+        per semester (utils/semester_cache.py) until its grades are written
+        or it is finalized, released, recalled or (un)locked. The returned
+        dict is shared between requests: do not modify it.
         
         Args:
             academic_year: Academic year (e.g., "2024")
             semester: Semester (e.g., "First" or "1")
             
         Returns:
-            dict with course and grading statistics
+            dict with course and grading statistics; 'courses' holds the
+            per-course counts (course_id, course_code, course_name,
+            total_students, finalized_count, released_count, average_score)
         """
-        # Get all courses for this semester
+        return semester_cache.get_or_build(
+            academic_year, semester, 'semester_summary',
+            lambda: SemesterGradingService._build_semester_summary(academic_year, semester)
+        )
+
+    @staticmethod
+    def _build_semester_summary(academic_year, semester):
         courses = (
-            Course.query
+            db.session.query(Course.id, Course.code, Course.name)
             .filter_by(academic_year=academic_year, semester=semester)
+            .order_by(Course.code)
             .all()
         )
 
-        # Get all grades for this semester
-        all_grades = (
-            StudentCourseGrade.query
-            .filter_by(academic_year=academic_year, semester=semester)
+        # Use the per-grade flags when the model has them; otherwise a grade
+        # is finalized once it has a final_score and released with the semester.
+        if hasattr(StudentCourseGrade, 'is_finalized'):
+            finalized_col = func.sum(case((StudentCourseGrade.is_finalized == True, 1), else_=0))
+        else:
+            finalized_col = func.count(StudentCourseGrade.final_score)
+        if hasattr(StudentCourseGrade, 'is_released'):
+            released_col = func.sum(case((StudentCourseGrade.is_released == True, 1), else_=0))
+        else:
+            released_col = literal(0)
+
+        rows = (
+            db.session.query(
+                StudentCourseGrade.course_id,
+                StudentCourseGrade.grade_letter,
+                func.count(StudentCourseGrade.id),
+                finalized_col,
+                released_col,
+                func.count(StudentCourseGrade.final_score),
+                func.sum(StudentCourseGrade.final_score),
+            )
+            .filter(
+                StudentCourseGrade.academic_year == academic_year,
+                StudentCourseGrade.semester == semester
+            )
+            .group_by(StudentCourseGrade.course_id, StudentCourseGrade.grade_letter)
             .all()
         )
 
-        if not all_grades:
+        if not rows:
             return {
                 'academic_year': academic_year,
                 'semester': semester,
                 'total_courses': len(courses),
                 'total_students': 0,
                 'total_grades': 0,
+                'finalized_count': 0,
+                'released_count': 0,
                 'average_gpa': 0.0,
                 'grade_distribution': {},
+                'courses': [
+                    SemesterGradingService._course_stats(course_id, code, name, [0, 0, 0, 0, 0.0])
+                    for course_id, code, name in courses
+                ],
                 'status': 'No grades'
             }
 
-        # Calculate statistics
-        grade_counts = {}
-        gpa_scale = {
-            'A': 4.0, 'A-': 3.7,
-            'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-            'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-            'D+': 1.3, 'D': 1.0, 'F': 0.0
-        }
-        total_gpa_points = 0
-        count_for_gpa = 0
-
-        for grade in all_grades:
-            letter = grade.grade_letter or 'N/A'
-            grade_counts[letter] = grade_counts.get(letter, 0) + 1
-
-            if letter in gpa_scale:
-                total_gpa_points += gpa_scale[letter]
-                count_for_gpa += 1
-
-        average_gpa = (
-            total_gpa_points / count_for_gpa if count_for_gpa > 0 else 0.0
-        )
-
-        # Get unique students count
-        unique_students = len(set(g.student_id for g in all_grades))
-
-        # Determine status using available model fields. If `is_finalized` isn't
-        # present, consider a grade finalized when `final_score` is not None.
-        finalized = sum(1 for g in all_grades if getattr(g, 'is_finalized', g.final_score is not None))
-        released = sum(1 for g in all_grades if getattr(g, 'is_released', False))
+        release = SemesterResultRelease.query.filter_by(
+            academic_year=academic_year, semester=semester
+        ).first()
+        semester_released = bool(release and release.is_released)
 
-        if released == len(all_grades):
+        grade_counts = {}
+        per_course = {}  # course_id -> [grades, finalized, released, scored, score_sum]
+        for course_id, letter, count, finalized, released, scored, score_sum in rows:
+            letter = letter or 'N/A'
+            grade_counts[letter] = grade_counts.get(letter, 0) + count
+            if not hasattr(StudentCourseGrade, 'is_released'):
+                released = count if semester_released else 0
+            totals = per_course.setdefault(course_id, [0, 0, 0, 0, 0.0])
+            totals[0] += count
+            totals[1] += finalized or 0
+            totals[2] += released or 0
+            totals[3] += scored
+            totals[4] += score_sum or 0.0
+
+        total_grades = sum(t[0] for t in per_course.values())
+        finalized = sum(t[1] for t in per_course.values())
+        released = sum(t[2] for t in per_course.values())
+
+        unique_students = db.session.query(
+            func.count(func.distinct(StudentCourseGrade.student_id))
+        ).filter(
+            StudentCourseGrade.academic_year == academic_year,
+            StudentCourseGrade.semester == semester
+        ).scalar() or 0
+
+        # Mean of the students' semester GPAs (materialized)
+        average_gpa = db.session.query(func.avg(StudentGPASummary.semester_gpa)).filter_by(
+            academic_year=academic_year, semester=semester
+        ).scalar() or 0.0
+
+        if released == total_grades:
             status = 'Released'
-        elif finalized == len(all_grades):
+        elif finalized == total_grades:
             status = 'Finalized'
         else:
             status = 'In Progress'
@@ -473,14 +615,34 @@ class SemesterGradingService:
             'semester': semester,
             'total_courses': len(courses),
             'total_students': unique_students,
-            'total_grades': len(all_grades),
+            'total_grades': total_grades,
             'finalized_count': finalized,
             'released_count': released,
             'average_gpa': round(average_gpa, 2),
             'grade_distribution': grade_counts,
+            'courses': [
+                SemesterGradingService._course_stats(
+                    course_id, code, name, per_course.get(course_id, [0, 0, 0, 0, 0.0])
+                )
+                for course_id, code, name in courses
+            ],
             'status': status
         }
 
+    @staticmethod
+    def _course_stats(course_id, code, name, totals):
+        grades, finalized, released, scored, score_sum = totals
+        return {
+            'course_id': course_id,
+            'course_code': code,
+            'course_name': name,
+            'total_students': grades,
+            'finalized_count': finalized,
+            'released_count': released,
+            # Average only over grades that have a numeric final_score
+            'average_score': round(score_sum / scored, 2) if scored else 0
+        }
+
     @staticmethod
     def get_current_semester():
         """
@@ -9,6 +9,7 @@ from models import (
     StudentCourseGrade, User, Course, SemesterResultRelease, db
 )
 from services.grading_calculation_engine import GradingCalculationEngine
+from services.gpa_summary_service import GPASummaryService, semester_sort_key
 
 
 class TranscriptService:
@@ -47,33 +48,16 @@ class TranscriptService:
             student_id, academic_year, semester
         )
         
-        # Calculate GPA metrics
-        semester_gpa = GradingCalculationEngine.calculate_gpa(grades)
-        semester_weighted_gpa = GradingCalculationEngine.calculate_weighted_gpa(grades)
-        
-        # Calculate total credit hours
-        total_credit_hours = 0
-        for grade in grades:
-            course = Course.query.get(grade.course_id)
-            if course:
-                total_credit_hours += course.credit_hours
+        # GPA metrics (materialized per semester, cumulative as of this semester)
+        summary = GPASummaryService.get(student_id, academic_year, semester)
+        semester_gpa = summary.unweighted_gpa if summary else 0.0
+        semester_weighted_gpa = summary.semester_gpa if summary else 0.0
+        total_credit_hours = summary.credits_attempted if summary else 0
+        cumulative_gpa = summary.cumulative_unweighted_gpa if summary else None
+        cumulative_weighted_gpa = summary.cgpa if summary else None
         
         # Check if results are released
         is_released = TranscriptService._is_semester_released(academic_year, semester)
-        
-        # Compute cumulative GPA across all semesters for this student (if any)
-        try:
-            all_grades = GradingCalculationEngine.get_student_all_grades(student_id)
-            if all_grades:
-                cumulative_gpa = GradingCalculationEngine.calculate_gpa(all_grades)
-                cumulative_weighted_gpa = GradingCalculationEngine.calculate_weighted_gpa(all_grades)
-            else:
-                cumulative_gpa = None
-                cumulative_weighted_gpa = None
-        except Exception:
-            # Safe fallback: don't break if grading engine raises
-            cumulative_gpa = None
-            cumulative_weighted_gpa = None
 
         # Build course details with course names and assessment weights
         from models import CourseAssessmentScheme
@@ -152,52 +136,31 @@ class TranscriptService:
             grouped[key].append(grade)
         
         # Sort by academic year and semester
-        sorted_keys = sorted(grouped.keys(), key=lambda x: (x[0], x[1]))
-        
-        # Build semester summaries
-        semesters_summary = []
-        seen_semesters = set()  # Deduplicate by (academic_year, semester)
-        for academic_year, semester in sorted_keys:
-            semester_key = (academic_year, semester)
-            if semester_key in seen_semesters:
-                continue  # Skip duplicate semesters
-            seen_semesters.add(semester_key)
-            
-            grades = grouped[(academic_year, semester)]
-            semester_gpa = GradingCalculationEngine.calculate_gpa(grades)
-            semester_weighted_gpa = GradingCalculationEngine.calculate_weighted_gpa(grades)
-            
-            total_credits = 0
-            for grade in grades:
-                course = Course.query.get(grade.course_id)
-                if course:
-                    total_credits += course.credit_hours
-            
-            semesters_summary.append({
-                'academic_year': academic_year,
-                'semester': semester,
-                'gpa': semester_gpa,
-                'weighted_gpa': semester_weighted_gpa,
-                'credit_hours': total_credits,
-                'courses_count': len(grades)
-            })
-        
-        # Calculate cumulative GPA
-        cumulative_gpa = GradingCalculationEngine.calculate_gpa(all_grades)
-        cumulative_weighted_gpa = GradingCalculationEngine.calculate_weighted_gpa(all_grades)
-        
-        # Calculate total credit hours
-        total_credit_hours_attempted = 0
-        total_credit_hours_earned = 0  # Only for passing grades
+        sorted_keys = sorted(grouped.keys(), key=lambda x: semester_sort_key(*x))
         
-        passing_grades = {'A', 'B', 'C', 'D'}  # Assuming D and above pass
-        
-        for grade in all_grades:
-            course = Course.query.get(grade.course_id)
-            if course:
-                total_credit_hours_attempted += course.credit_hours
-                if grade.grade_letter in passing_grades:
-                    total_credit_hours_earned += course.credit_hours
+        # Semester and cumulative GPA / credits, one row per semester
+        summaries = {
+            (row.academic_year, row.semester): row
+            for row in GPASummaryService.for_student(student_id)
+        }
+        semesters_summary = [
+            {
+                'academic_year': row.academic_year,
+                'semester': row.semester,
+                'gpa': row.unweighted_gpa,
+                'weighted_gpa': row.semester_gpa,
+                'cgpa': row.cgpa,
+                'credit_hours': row.credits_attempted,
+                'credits_earned': row.credits_earned,
+                'courses_count': row.courses_count
+            }
+            for row in summaries.values()
+        ]
+        latest = list(summaries.values())[-1] if summaries else None
+        cumulative_gpa = latest.cumulative_unweighted_gpa if latest else 0.0
+        cumulative_weighted_gpa = latest.cgpa if latest else 0.0
+        total_credit_hours_attempted = latest.cumulative_credits_attempted if latest else 0
+        total_credit_hours_earned = latest.cumulative_credits_earned if latest else 0
         
         # Build detailed semester data with course information and weights
         from models import CourseAssessmentScheme
@@ -237,7 +200,8 @@ class TranscriptService:
                 'academic_year': academic_year,
                 'semester': semester,
                 'courses': course_details,
-                'gpa': GradingCalculationEngine.calculate_gpa(grades),
+                'gpa': summaries[(academic_year, semester)].unweighted_gpa
+                       if (academic_year, semester) in summaries else 0.0,
                 'is_released': is_released
             }
         
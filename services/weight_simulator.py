@@ -0,0 +1,251 @@
+"""
+ASSESSMENT WEIGHT SIMULATOR
+===========================
+Location: services/weight_simulator.py
+
+"What if" for CourseAssessmentScheme weights: shows how a course's grade
+distribution would shift under candidate weightings and grade boundaries
+before a teacher saves them. Nothing is written.
+
+Per-student quiz / assignment / exam percentages are loaded once with the
+engine's GROUP BY aggregates into an (N × 3) NumPy array. All candidate
+weightings are then scored with one matrix product and graded with a
+vectorized boundary search, using the same formula and rounding as
+GradingCalculationEngine.
+
+    simulator = WeightSimulator.for_course(course)
+    report = simulator.simulate([
+        {'quiz_weight': 20, 'assignment_weight': 20, 'exam_weight': 60},
+        {'boundaries': {'A': 78}},
+    ])
+"""
+
+import math
+
+import numpy as np
+
+from models import CourseAssessmentScheme, StudentProfile, User, db
+from services.grading_calculation_engine import GradingCalculationEngine
+from utils.extensions import grading_scale
+from utils.grading_scale import CompiledScale
+
+MAX_CANDIDATES = 20
+MAX_CHANGES_LISTED = 200
+SCORE_BINS = np.arange(0, 101, 10)
+
+# Model defaults, used when the course has no scheme yet
+DEFAULT_WEIGHTS = (10.0, 30.0, 60.0)
+
+_WEIGHT_KEYS = ('quiz_weight', 'assignment_weight', 'exam_weight')
+
+
+class SimulationError(ValueError):
+    """Invalid candidate (shown to the teacher as a 400)."""
+
+
+class _VectorScale:
+    """CompiledScale as arrays, for grading a whole score vector at once."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.bands = scale.bands
+        self.mins = np.array([b.min_score for b in self.bands], dtype=float)
+        self.maxs = np.array([b.max_score for b in self.bands], dtype=float)
+        self.letters = [b.grade_letter for b in self.bands]
+        self.passes = np.array([b.pass_fail == 'PASS' for b in self.bands], dtype=bool)
+
+    def band_indices(self, scores):
+        """Index into self.bands per score, -1 where no band matches (graded F)."""
+        if not self.bands:
+            return np.full(scores.shape, -1)
+        idx = np.searchsorted(self.mins, scores, side='right') - 1
+        covered = (idx >= 0) & (scores <= self.maxs[np.maximum(idx, 0)])
+        idx = np.where(covered, idx, -1)
+        # Nested/overlapping bands: walk back like CompiledScale.grade_for (rare)
+        for i in np.flatnonzero(~covered & (np.searchsorted(self.mins, scores, side='right') > 1)):
+            band = self.scale.grade_for(float(scores.flat[i]))
+            idx.flat[i] = self.bands.index(band) if band is not None else -1
+        return idx
+
+    def letters_for(self, idx):
+        letters = np.array(self.letters + ['F'], dtype=object)
+        return letters[idx]  # -1 picks the trailing 'F'
+
+    def passed(self, idx):
+        return np.append(self.passes, False)[idx]
+
+    def with_boundaries(self, boundaries):
+        """
+        Copy of the scale with some letters' min_score moved. The band below a
+        moved boundary is stretched to meet it, so no gap opens up.
+        """
+        if not isinstance(boundaries, dict):
+            raise SimulationError("boundaries must map grade letters to minimum scores")
+        unknown = set(boundaries) - set(self.letters)
+        if unknown:
+            raise SimulationError(f"Unknown grade letters: {', '.join(sorted(unknown))}")
+        try:
+            boundaries = {letter: float(score) for letter, score in boundaries.items()}
+        except (TypeError, ValueError):
+            raise SimulationError("Grade boundaries must be numbers")
+        if not all(math.isfinite(score) for score in boundaries.values()):
+            raise SimulationError("Grade boundaries must be finite numbers")
+
+        bands = [b._replace(min_score=boundaries[b.grade_letter]) if b.grade_letter in boundaries else b
+                 for b in self.bands]
+        bands.sort(key=lambda b: (b.min_score, -b.id))
+        for i in range(len(bands) - 1):
+            upper = bands[i + 1]
+            if upper.grade_letter in boundaries:
+                bands[i] = bands[i]._replace(max_score=max(bands[i].max_score, round(upper.min_score - 0.01, 2)))
+        return _VectorScale(CompiledScale(bands))
+
+
+class WeightSimulator:
+    """Holds one course's score matrix; simulate() evaluates candidates against it."""
+
+    def __init__(self, course, scheme, student_ids, percentages, scale):
+        self.course = course
+        self.scheme = scheme
+        self.student_ids = student_ids          # (N,) User.id
+        self.percentages = percentages          # (N, 3) quiz / assignment / exam %
+        self.scale = _VectorScale(scale)
+        if scheme is not None:
+            self.current_weights = tuple(float(getattr(scheme, key) or 0) for key in _WEIGHT_KEYS)
+        else:
+            self.current_weights = DEFAULT_WEIGHTS
+
+    @classmethod
+    def for_course(cls, course):
+        """Load percentages for every student of the course (registered or graded)."""
+        course_ids = [course.id]
+        students = GradingCalculationEngine._course_students(course_ids, course.academic_year, course.semester)
+        student_ids = np.array(sorted(students.get(course.id, ())), dtype=np.int64)
+
+        totals = (
+            GradingCalculationEngine._bulk_quiz_totals(course_ids),
+            GradingCalculationEngine._bulk_assignment_totals(course_ids),
+            GradingCalculationEngine._bulk_exam_totals(course_ids),
+        )
+        scores = np.zeros((len(student_ids), 3))
+        maxima = np.zeros((len(student_ids), 3))
+        for row, student_id in enumerate(student_ids.tolist()):
+            for col, by_student in enumerate(totals):
+                scores[row, col], maxima[row, col] = by_student.get((student_id, course.id), (0, 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percentages = np.where(maxima > 0, scores / maxima * 100, 0.0)
+
+        scheme = (CourseAssessmentScheme.query
+                  .filter_by(course_id=course.id)
+                  .order_by(CourseAssessmentScheme.id)
+                  .first())
+        programme = scheme.programme_name if scheme else course.programme_name
+        level = scheme.programme_level if scheme else course.programme_level
+        return cls(course, scheme, student_ids, percentages, grading_scale.scale_for(programme, level))
+
+    # -------------------------
+    # Simulation
+    # -------------------------
+    def simulate(self, candidates, max_changes=MAX_CHANGES_LISTED):
+        """
+        Evaluate candidate weightings / boundaries against the current scheme.
+
+        Each candidate may set quiz_weight, assignment_weight, exam_weight
+        (defaults: current scheme; must total 100) and boundaries
+        ({letter: new min_score}).
+
+        Returns:
+            dict with the baseline and, per candidate, grade and score
+            histograms, pass rate and the students whose letter grade changes
+        """
+        if not candidates:
+            raise SimulationError("Provide at least one candidate")
+        if len(candidates) > MAX_CANDIDATES:
+            raise SimulationError(f"At most {MAX_CANDIDATES} candidates per request")
+
+        weights = np.array([self.current_weights] + [self._weights(c) for c in candidates])
+        scales = [self.scale] + [
+            self.scale.with_boundaries(c['boundaries']) if c.get('boundaries') else self.scale
+            for c in candidates
+        ]
+
+        # (N × 3) @ (3 × K+1): final score per student per candidate, engine rounding
+        finals = np.round((self.percentages / 100) @ weights.T, 2)
+
+        graded = []
+        for k, scale in enumerate(scales):
+            idx = scale.band_indices(finals[:, k])
+            graded.append((scale.letters_for(idx), scale.passed(idx)))
+
+        base_letters = graded[0][0]
+        report = {
+            'course_id': self.course.id,
+            'students': int(len(self.student_ids)),
+            'baseline': self._summary(self.current_weights, None, finals[:, 0], *graded[0]),
+            'candidates': [],
+        }
+        for k, candidate in enumerate(candidates, start=1):
+            letters, passed = graded[k]
+            summary = self._summary(weights[k], candidate.get('boundaries'), finals[:, k], letters, passed)
+            changed = np.flatnonzero(letters != base_letters)
+            summary['changed_count'] = int(len(changed))
+            summary['changed'] = self._changes(changed[:max_changes], finals[:, 0], finals[:, k], base_letters, letters)
+            report['candidates'].append(summary)
+        return report
+
+    def _weights(self, candidate):
+        try:
+            weights = tuple(
+                float(candidate[key]) if candidate.get(key) is not None else current
+                for key, current in zip(_WEIGHT_KEYS, self.current_weights)
+            )
+        except (TypeError, ValueError):
+            raise SimulationError("Weights must be numbers")
+        if not all(math.isfinite(w) for w in weights):
+            raise SimulationError("Weights must be finite numbers")
+        if any(w < 0 for w in weights):
+            raise SimulationError("Weights cannot be negative")
+        if abs(sum(weights) - 100.0) >= 0.01:
+            raise SimulationError(f"The total weight must equal 100%. Currently: {sum(weights)}%")
+        return weights
+
+    def _summary(self, weights, boundaries, finals, letters, passed):
+        letter_order = list(dict.fromkeys(reversed(self.scale.letters))) + ['F']
+        counts = {letter: 0 for letter in letter_order}
+        values, freq = np.unique(letters, return_counts=True) if len(letters) else ([], [])
+        for letter, count in zip(values, freq):
+            counts[letter] = int(count)
+        hist, _ = np.histogram(finals, bins=SCORE_BINS)
+        n = len(finals)
+        return {
+            'weights': dict(zip(_WEIGHT_KEYS, (float(w) for w in weights))),
+            'boundaries': boundaries or {},
+            'grade_histogram': {k: v for k, v in counts.items() if v or k in self.scale.letters},
+            'score_histogram': {f"{lo}-{lo + 10}": int(c) for lo, c in zip(SCORE_BINS[:-1].tolist(), hist)},
+            'pass_rate': round(float(passed.mean()) * 100, 2) if n else 0.0,
+            'mean_score': round(float(finals.mean()), 2) if n else 0.0,
+            'median_score': round(float(np.median(finals)), 2) if n else 0.0,
+        }
+
+    def _changes(self, rows, base_scores, scores, base_letters, letters):
+        if not len(rows):
+            return []
+        ids = self.student_ids[rows].tolist()
+        people = {
+            user_id: (f"{first} {last}", index_number)
+            for user_id, first, last, index_number in db.session.query(
+                User.id, User.first_name, User.last_name, StudentProfile.index_number
+            ).outerjoin(StudentProfile, StudentProfile.user_id == User.user_id).filter(User.id.in_(ids))
+        }
+        return [
+            {
+                'student_id': student_id,
+                'name': people.get(student_id, (None, None))[0],
+                'index_number': people.get(student_id, (None, None))[1],
+                'from_grade': base_letters[row],
+                'to_grade': letters[row],
+                'from_score': float(base_scores[row]),
+                'to_score': float(scores[row]),
+            }
+            for row, student_id in zip(rows.tolist(), ids)
+        ]
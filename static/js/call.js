@@ -3,7 +3,8 @@
 if (typeof io !== 'function') {
   console.error('Socket.IO not loaded');
 }
-const socket = io();
+const socketTransports = document.querySelector('meta[name="socketio-transports"]')?.content;
+const socket = io(socketTransports ? { transports: socketTransports.split(',') } : {});
 
 // ===== DOM Elements (defensive - use functions to always get fresh references) =====
 function getCallModal() { return document.getElementById('callModal'); }
@@ -16,6 +16,8 @@ const ChatApp = {
     pendingReceiverId: null,
     conversations: [],
     messages: {},
+    hasMoreHistory: {},
+    loadingHistory: false,
     isGroupChat: false,
     selectedDMRole: null,
     replyToMessage: null,
@@ -102,13 +104,24 @@ const ChatApp = {
 
   // ===== SOCKET.IO =====
   setupSocket() {
-    this.socket = io();
+    // Deployments without sticky sessions force websocket-only (see DEPLOY_RENDER.md)
+    const transports = document.querySelector('meta[name="socketio-transports"]')?.content;
+    this.socket = io(transports ? { transports: transports.split(',') } : {});
 
     this.socket.on('connect', () => {
       console.log('✅ Socket connected');
-      this.socket.emit('join', { user_id: this.state.currentUserId });
+      // The ack carries which direct contacts are online right now
+      this.socket.emit('join', { user_id: this.state.currentUserId }, (res) => {
+        (res?.online || []).forEach(pub => this.state.onlineUsers.add(pub));
+        this.watchPresence(this.state.currentConversationId);
+      });
     });
 
+    // Keep our presence entry alive; the server expires connections without heartbeats
+    setInterval(() => {
+      if (this.socket.connected) this.socket.emit('presence_heartbeat');
+    }, 30000);
+
     this.socket.on('new_message', (data) => {
       if (data.conversation_id === this.state.currentConversationId) {
         this.appendMessage(data.message);
@@ -117,11 +130,18 @@ const ChatApp = {
     });
 
     this.socket.on('presence_update', (data) => {
-      if (data.status === 'online') {
-        this.state.onlineUsers.add(data.user_public_id);
-      } else {
-        this.state.onlineUsers.delete(data.user_public_id);
-      }
+      this.applyPresence(data);
+      this.updatePresenceIndicator();
+    });
+
+    // Someone (possibly us) was added to a group
+    this.socket.on('members_added', () => {
+      this.loadConversations();
+    });
+
+    // Batched presence for our contacts and the conversation we have open
+    this.socket.on('presence_batch', (data) => {
+      (data.updates || []).forEach(update => this.applyPresence(update));
       this.updatePresenceIndicator();
     });
 
@@ -200,6 +220,11 @@ const ChatApp = {
       this.dom.backBtn.addEventListener('click', () => this.closeConversation());
     }
 
+    // Load older history when scrolled to the top
+    this.dom.messagesContainer.addEventListener('scroll', () => {
+      if (this.dom.messagesContainer.scrollTop < 80) this.loadOlderMessages();
+    });
+
     // Menu
     this.dom.menuBtn?.addEventListener('click', (e) => {
       e.stopPropagation();
@@ -243,7 +268,7 @@ const ChatApp = {
     document.getElementById('closeMessageSearch')?.addEventListener('click', () => {
       document.getElementById('messageSearchBar').style.display = 'none';
       document.getElementById('messageSearchInput').value = '';
-      this.filterMessages('');
+      this.searchMessages('');
     });
 
     // Group settings modal close
@@ -310,7 +335,7 @@ const ChatApp = {
       avatar.className = 'conv-avatar';
       avatar.style.background = this.util.getUserColor(other?.user_public_id || '');
       if (conv.type === 'group') {
-        avatar.textContent = conv.participants?.length || '0';
+        avatar.textContent = conv.participant_count || '0';
         avatar.style.background = '#0ea5e9';
       } else {
         avatar.textContent = this.util.getInitials(other?.name);
@@ -394,15 +419,10 @@ const ChatApp = {
 
       this.state.currentConversationType = conv.type;
       this.state.isGroupChat = conv.type === 'group';
+      this.watchPresence(convId);
 
-      // Load messages
-      const res = await fetch(`/chat/conversations/${convId}/messages`);
-      if (!res.ok) throw new Error('Failed to load messages');
-      const msgs = await res.json();
-      this.state.messages[convId] = msgs;
-
-      // Render
-      this.renderMessages(msgs);
+      // Load latest page of messages
+      await this.loadMessages();
       
       // Update header with error handling
       try {
@@ -434,6 +454,7 @@ const ChatApp = {
 
   closeConversation() {
     this.state.currentConversationId = null;
+    this.watchPresence(null);
     this.dom.messagesContainer.innerHTML = '';
     this.dom.rightTitle.textContent = 'Select conversation';
     this.dom.rightSub.textContent = 'Open a chat to start';
@@ -447,7 +468,7 @@ const ChatApp = {
     if (conv.type === 'group') {
       this.dom.rightTitle.textContent = '👥 ' + (conv.name || 'Group');
       // show group member metadata only for groups
-      const memberCount = conv.participants?.length || 0;
+      const memberCount = conv.participant_count || 0;
       const meta = document.getElementById('groupMeta');
       const metaCount = document.getElementById('groupMemberCount');
       if (meta && metaCount) {
@@ -490,6 +511,54 @@ const ChatApp = {
   },
 
   // ===== MESSAGES =====
+  async fetchMessagePage(convId, beforeId = null) {
+    const params = new URLSearchParams();
+    if (beforeId) params.set('before_id', beforeId);
+    const res = await fetch(`/chat/conversations/${convId}/messages?${params}`);
+    if (!res.ok) throw new Error('Failed to load messages');
+    return res.json();
+  },
+
+  async loadMessages() {
+    const convId = this.state.currentConversationId;
+    if (!convId) return;
+
+    const page = await this.fetchMessagePage(convId);
+    if (convId !== this.state.currentConversationId) return;
+
+    this.state.messages[convId] = page.messages;
+    this.state.hasMoreHistory[convId] = page.has_more;
+    this.renderMessages(page.messages);
+  },
+
+  async loadOlderMessages() {
+    const convId = this.state.currentConversationId;
+    if (!convId || this.state.loadingHistory || !this.state.hasMoreHistory[convId]) return;
+
+    const loaded = this.state.messages[convId] || [];
+    if (loaded.length === 0) return;
+
+    this.state.loadingHistory = true;
+    try {
+      const page = await this.fetchMessagePage(convId, loaded[0].id);
+      if (convId !== this.state.currentConversationId) return;
+
+      const container = this.dom.messagesContainer;
+      const distanceFromBottom = container.scrollHeight - container.scrollTop;
+
+      this.state.messages[convId] = page.messages.concat(loaded);
+      this.state.hasMoreHistory[convId] = page.has_more;
+      this.renderMessages(this.state.messages[convId]);
+
+      // Keep the viewport anchored on the message the user was reading
+      container.scrollTop = container.scrollHeight - distanceFromBottom;
+    } catch (err) {
+      console.error('❌ loadOlderMessages:', err);
+    } finally {
+      this.state.loadingHistory = false;
+    }
+  },
+
   renderMessages(messages) {
     const container = this.dom.messagesContainer;
     container.innerHTML = '';
@@ -508,7 +577,7 @@ const ChatApp = {
     });
 
     // Render
-    Object.keys(byDay).sort().forEach(day => {
+    Object.keys(byDay).forEach(day => {
       const sep = document.createElement('div');
       sep.className = 'date-separator';
       sep.style.textAlign = 'center';
@@ -658,6 +727,8 @@ const ChatApp = {
 
   appendMessage(msg) {
     if (msg.conversation_id !== this.state.currentConversationId) return;
+    const loaded = this.state.messages[msg.conversation_id];
+    if (loaded) loaded.push(msg);
     const container = this.dom.messagesContainer;
     if (container.querySelector('.no-messages')) container.innerHTML = '';
     const el = this.createMessageElement(msg);
@@ -949,6 +1020,7 @@ const ChatApp = {
 
     this.state.pendingReceiverId = userId;
     this.state.currentConversationId = null;
+    this.watchPresence(null);
     this.closeDMComposer();
     this.dom.messagesContainer.innerHTML = '';
     this.dom.rightTitle.textContent = 'New Message';
@@ -1368,7 +1440,7 @@ const ChatApp = {
                   <div style="flex: 1; min-width: 0;">
                     <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 2px;">
                       <strong style="color: #333;">${this.escapeHtml(displayName)}</strong>
-                      ${isGroup ? `<span style="font-size: 0.8em; color: #999; background: #f0f0f0; padding: 2px 6px; border-radius: 3px; margin-left: 6px;">${c.participants?.length || 0} members</span>` : ''}
+                      ${isGroup ? `<span style="font-size: 0.8em; color: #999; background: #f0f0f0; padding: 2px 6px; border-radius: 3px; margin-left: 6px;">${c.participant_count || 0} members</span>` : ''}
                     </div>
                     <p style="margin: 0; font-size: 0.85em; color: #999; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;">${this.escapeHtml(lastMsg)}</p>
                   </div>
@@ -1531,6 +1603,29 @@ const ChatApp = {
   },
 
   // ===== PRESENCE =====
+  applyPresence(update) {
+    if (update.status === 'online') {
+      this.state.onlineUsers.add(update.user_public_id);
+    } else {
+      this.state.onlineUsers.delete(update.user_public_id);
+    }
+  },
+
+  // Subscribe this tab to presence of the open conversation's members
+  watchPresence(convId) {
+    if (!this.socket?.connected) return;
+    this.socket.emit('presence_watch', { conversation_id: convId ?? null }, (res) => {
+      if (!convId || res?.error || convId !== this.state.currentConversationId) return;
+      const conv = this.state.conversations.find(c => c.id === convId);
+      const online = new Set(res.online || []);
+      (conv?.participants || []).forEach(p => {
+        if (p.user_public_id === this.state.currentUserId) return;
+        this.applyPresence({ user_public_id: p.user_public_id, status: online.has(p.user_public_id) ? 'online' : 'offline' });
+      });
+      this.updatePresenceIndicator();
+    });
+  },
+
   updatePresenceIndicator() {
     if (!this.state.currentConversationId) return;
     const conv = this.state.conversations.find(c => c.id === this.state.currentConversationId);
@@ -1561,38 +1656,79 @@ const ChatApp = {
   setupMessageSearch() {
     const searchInput = document.getElementById('messageSearchInput');
     if (!searchInput) return;
-    
+
+    let debounce = null;
     searchInput.addEventListener('input', (e) => {
-      const query = e.target.value.toLowerCase();
-      this.filterMessages(query);
+      clearTimeout(debounce);
+      const query = e.target.value.trim();
+      debounce = setTimeout(() => this.searchMessages(query), 250);
+    });
+
+    document.getElementById('messageSearchResults')?.addEventListener('click', (e) => {
+      const hit = e.target.closest('[data-message-id]');
+      if (hit) this.jumpToMessage(Number(hit.dataset.conversationId), Number(hit.dataset.messageId));
     });
   },
 
-  filterMessages(query) {
-    const messages = document.querySelectorAll('.msg-item, .msg-own');
-    let foundCount = 0;
+  // Server-side search over the whole history of the open conversation
+  async searchMessages(query) {
+    const resultsEl = document.getElementById('messageSearchResults');
+    if (!resultsEl) return;
 
-    messages.forEach(msg => {
-      const content = msg.textContent.toLowerCase();
-      if (query && content.includes(query)) {
-        msg.style.display = 'block';
-        msg.style.backgroundColor = '#fff3cd';
-        foundCount++;
-      } else if (query) {
-        msg.style.display = 'none';
-      } else {
-        msg.style.display = 'block';
-        msg.style.backgroundColor = 'transparent';
+    if (!query) {
+      resultsEl.innerHTML = '';
+      resultsEl.style.display = 'none';
+      return;
+    }
+
+    const params = new URLSearchParams({ q: query });
+    if (this.state.currentConversationId) params.set('conversation_id', this.state.currentConversationId);
+
+    try {
+      const res = await fetch(`/chat/search?${params}`);
+      if (!res.ok) throw new Error('Search failed');
+      const data = await res.json();
+
+      // Ignore responses for a query the user has already changed
+      if (document.getElementById('messageSearchInput')?.value.trim() !== query) return;
+
+      resultsEl.style.display = 'block';
+      if (data.results.length === 0) {
+        resultsEl.innerHTML = `<div style="padding: 10px; color: #9ca3af;">No messages found for "${this.escapeHtml(query)}"</div>`;
+        return;
       }
-    });
 
-    if (query && foundCount === 0) {
-      this.showError(`No messages found for "${query}"`);
-    } else if (query) {
-      this.showSuccess(`Found ${foundCount} message(s)`);
+      // Snippets arrive HTML-escaped with <mark> highlights
+      resultsEl.innerHTML = data.results.map(r => `
+        <div data-message-id="${r.message.id}" data-conversation-id="${r.conversation_id}" style="padding: 8px 12px; border-bottom: 1px solid #f3f4f6; cursor: pointer;">
+          <div style="font-size: 0.8em; color: #6b7280;">${this.escapeHtml(r.message.sender_name || '')} · ${this.escapeHtml(r.message.created_at || '')}</div>
+          <div style="font-size: 0.9em;">${r.snippet}</div>
+        </div>
+      `).join('');
+    } catch (err) {
+      console.error('❌ searchMessages:', err);
+      this.showError('Search failed');
     }
   },
 
+  async jumpToMessage(convId, messageId) {
+    if (convId !== this.state.currentConversationId) return;
+
+    const selector = `[data-message-id="${messageId}"]`;
+    let el = this.dom.messagesContainer.querySelector(selector);
+
+    // Page back through history until the hit is rendered
+    while (!el && this.state.hasMoreHistory[convId] && convId === this.state.currentConversationId) {
+      await this.loadOlderMessages();
+      el = this.dom.messagesContainer.querySelector(selector);
+    }
+    if (!el) return;
+
+    el.scrollIntoView({ behavior: 'smooth', block: 'center' });
+    el.style.backgroundColor = '#fff3cd';
+    setTimeout(() => { el.style.backgroundColor = ''; }, 2000);
+  },
+
   // ===== GROUP SETTINGS =====
   setupGroupSettings() {
     const groupSettingsBtn = document.getElementById('groupSettingsBtn');
@@ -1607,7 +1743,7 @@ const ChatApp = {
     });
   },
 
-  showGroupSettingsModal() {
+  async showGroupSettingsModal() {
     const modal = document.getElementById('groupSettingsModal');
     const conv = this.state.conversations.find(c => c.id === this.state.currentConversationId);
     
@@ -1617,8 +1753,17 @@ const ChatApp = {
     const memberList = document.getElementById('groupMemberList');
     
     nameInput.value = conv.name || '';
+
+    // The conversation list only carries a member preview; fetch everyone
+    let members = conv.participants;
+    try {
+      const res = await fetch(`/chat/conversations/${conv.id}/participants`);
+      if (res.ok) members = await res.json();
+    } catch (err) {
+      console.warn('Failed to load group members:', err);
+    }
     
-    memberList.innerHTML = conv.participants.map(p => `
+    memberList.innerHTML = members.map(p => `
       <div style="padding: 8px; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
         <span>${p.name}</span>
         <button style="padding: 4px 8px; background: #ff6b6b; color: white; border: none; border-radius: 4px; cursor: pointer;" data-user-id="${p.user_public_id}">Remove</button>
@@ -6,13 +6,18 @@ Location: In routes/student_routes.py or separate results_routes.py
 Endpoints for students to view their grades and transcripts.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, abort, send_file
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, abort, send_file,
+    make_response, request
+)
 from flask_login import login_required, current_user
 from models import (
     StudentProfile, SemesterResultRelease, StudentCourseGrade, User, db
 )
 from services.result_builder import ResultBuilder
+from services.result_snapshot_service import ResultSnapshotService
 from datetime import datetime
+import hashlib
 from io import BytesIO
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -100,6 +105,48 @@ def semester_results(academic_year, semester):
     )
 
 
+@results_bp.route('/api/semester')
+@results_bp.route('/api/semester/<path:academic_year>/<semester>')
+@login_required
+def api_semester_results(academic_year=None, semester=None):
+    """
+    Semester results as JSON (current released semester by default).
+    Released results are served straight from the student's snapshot;
+    an unreleased semester gives only its academic_year / semester and
+    "released": false. Responses carry an ETag and If-None-Match gets a 304.
+    """
+    
+    if current_user.role != 'student':
+        abort(403)
+
+    student_id = current_user.id
+
+    # get() only returns snapshots while the semester is released
+    snapshot = None
+    if academic_year and semester:
+        snapshot = ResultSnapshotService.get(student_id, academic_year, semester)
+
+    if snapshot is not None:
+        body, etag = snapshot.payload, snapshot.etag
+    else:
+        data = ResultBuilder.semester(student_id, academic_year, semester)
+        if not data['released']:
+            # As the HTML pages: nothing about the grades until release
+            data = {
+                'academic_year': data['academic_year'],
+                'semester': data['semester'],
+                'released': False
+            }
+        body = ResultSnapshotService.serialize(data)
+        etag = hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
 @results_bp.route('/semester/<path:academic_year>/<semester>/download-pdf')
 @login_required
 def download_semester_results_pdf(academic_year, semester):
@@ -343,7 +390,6 @@ def download_transcript_pdf():
             ["Course Code", "Course Name", "Credits", "Score", "Grade", "Points"]
         ]
 
-        semester_points = 0
         semester_credits = 0
 
         for course in courses:
@@ -355,11 +401,10 @@ def download_transcript_pdf():
                 course['grade'],
                 str(course['points'])
             ])
-            semester_points += course['points']
             semester_credits += course['credit_hours']
 
         # Semester summary
-        sem_gpa = (semester_points / semester_credits) if semester_credits > 0 else 0
+        sem_gpa = data['semester_gpas'].get((year, semester), 0.0)
         table_data.append([
             "", "", "",
             f"Semester GPA: {sem_gpa:.2f}", "",
@@ -219,6 +219,38 @@ def assessment_scheme(course_id):
 
     return render_template('teacher/assessment_scheme.html', course=course, scheme=scheme)
 
+@teacher_bp.route('/assessment_scheme/<int:course_id>/simulate', methods=['POST'])
+@login_required
+def simulate_assessment_scheme(course_id):
+    """
+    What-if for the assessment scheme: grade distribution under candidate
+    weights / grade boundaries, compared to the current scheme. Read-only.
+
+    Body: {"candidates": [{"quiz_weight": 20, "assignment_weight": 20,
+                           "exam_weight": 60, "boundaries": {"A": 78}}, ...]}
+    """
+    from services.weight_simulator import SimulationError, WeightSimulator
+
+    if current_user.role != 'teacher':
+        abort(403)
+
+    profile = TeacherProfile.query.filter_by(user_id=current_user.user_id).first()
+    course = Course.query.get_or_404(course_id)
+    if not profile or course not in [a.course for a in profile.assignments]:
+        return jsonify({"status": "error", "message": "You are not registered for this course."}), 403
+
+    payload = request.get_json(silent=True) or {}
+    candidates = payload.get('candidates')
+    if not isinstance(candidates, list) or not all(isinstance(c, dict) for c in candidates):
+        return jsonify({"status": "error", "message": "candidates must be a list of objects"}), 400
+
+    try:
+        report = WeightSimulator.for_course(course).simulate(candidates)
+    except SimulationError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return jsonify(dict(report, status="ok"))
+
 @teacher_bp.route('/class/<int:course_id>')
 @login_required
 def view_class(course_id):
@@ -0,0 +1,68 @@
+"""/student/results/api/semester must not expose unreleased grades."""
+import pytest
+from flask import Flask
+from flask_login import LoginManager, login_user
+
+from models import Course, SemesterResultRelease, StudentCourseGrade, User, db
+from utils.extensions import grading_scale, semester_cache
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SECRET_KEY='test', TESTING=True)
+    db.init_app(app)
+    grading_scale.init_app(app)
+    semester_cache.init_app(app)
+
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+
+    from student_results_routes import results_bp
+    app.register_blueprint(results_bp)
+
+    @app.route('/_login/<int:user_id>')
+    def _login(user_id):
+        login_user(db.session.get(User, user_id))
+        return 'ok'
+
+    with app.app_context():
+        tables = [t for name, t in db.metadata.tables.items() if name != 'student_answers']
+        db.metadata.create_all(db.engine, tables=tables)
+        student = User(user_id='STD001', username='std001', first_name='Ama', last_name='Mensah',
+                       role='student', email='std001@example.com', password_hash='!')
+        db.session.add(student)
+        course = Course(name='Anatomy', code='ANA101', programme_name='Nursing', programme_level='100',
+                        semester='1', academic_year='2024', credit_hours=3)
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(StudentCourseGrade(
+            student_id=student.id, course_id=course.id, academic_year='2024', semester='1',
+            final_score=72.5, grade_letter='B', grade_point=3.0, pass_fail='PASS'
+        ))
+        db.session.commit()
+
+        client = app.test_client()
+        client.get(f'/_login/{student.id}')
+        yield client
+
+        db.session.remove()
+
+
+def test_unreleased_semester_returns_no_grades(client):
+    response = client.get('/student/results/api/semester/2024/1')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'academic_year': '2024', 'semester': '1', 'released': False}
+
+
+def test_released_semester_returns_grades(client):
+    db.session.add(SemesterResultRelease(academic_year='2024', semester='1', is_released=True))
+    db.session.commit()
+
+    response = client.get('/student/results/api/semester/2024/1')
+
+    data = response.get_json()
+    assert data['released'] is True
+    assert [(r['course_code'], r['score'], r['grade']) for r in data['results']] == [('ANA101', 72.5, 'B')]
@@ -0,0 +1,38 @@
+"""WeightSimulator input validation (no database needed)."""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services.weight_simulator import SimulationError, WeightSimulator
+from utils.grading_scale import CompiledScale, GradeBand
+
+
+def make_simulator():
+    scale = CompiledScale([
+        GradeBand(1, 50, 100, 'A', 4.0, 'PASS', None, None),
+        GradeBand(2, 0, 49.99, 'F', 0.0, 'FAIL', None, None),
+    ])
+    percentages = np.array([[80.0, 70.0, 60.0], [40.0, 30.0, 20.0]])
+    return WeightSimulator(SimpleNamespace(id=1), None, np.array([1, 2]), percentages, scale)
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', float('nan')])
+def test_rejects_non_finite_weights(value):
+    simulator = make_simulator()
+    with pytest.raises(SimulationError):
+        simulator.simulate([{'quiz_weight': value, 'assignment_weight': 30, 'exam_weight': 60}])
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf'])
+def test_rejects_non_finite_boundaries(value):
+    simulator = make_simulator()
+    with pytest.raises(SimulationError):
+        simulator.simulate([{'boundaries': {'A': value}}])
+
+
+def test_finite_candidate_is_simulated():
+    report = make_simulator().simulate([{'quiz_weight': 20, 'assignment_weight': 20, 'exam_weight': 60}])
+    candidate = report['candidates'][0]
+    assert candidate['weights']['quiz_weight'] == 20.0
+    assert candidate['mean_score'] == 46.0
@@ -0,0 +1,153 @@
+"""
+Chat message archival.
+
+Messages older than CHAT_ARCHIVE_AFTER_DAYS move, in batches, from
+`message` / `message_reaction` into `message_archive` (content and reactions
+zlib-compressed), so the hot tables and their indexes stay small. Paginated
+history (chat_routes.fetch_message_page) reads the archive transparently;
+archived messages are read-only and are not in the search index.
+
+A message stays hot while it is its conversation's last message or while a
+hot reply still points at it; it is picked up by a later run.
+
+Run with `flask --app app chat archive` (scheduled as a Render cron job,
+see render.yaml).
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, exists, or_, update
+from sqlalchemy.orm import aliased
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+DEFAULT_BATCH_SIZE = 1000
+
+
+def archive_candidates(cutoff, batch_size):
+    """Oldest archivable messages created before `cutoff`."""
+    from models import Conversation, Message
+
+    reply = aliased(Message)
+    return Message.query.join(
+        Conversation, Conversation.id == Message.conversation_id
+    ).filter(
+        Message.created_at < cutoff,
+        or_(Conversation.last_message_id.is_(None), Conversation.last_message_id != Message.id),
+        ~exists().where(reply.reply_to_message_id == Message.id),
+    ).order_by(
+        Message.created_at, Message.id
+    ).limit(batch_size).with_for_update(skip_locked=True, of=Message).all()
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """Move one batch into the archive and commit. Returns (messages, reactions) moved."""
+    from models import ArchivedMessage, Conversation, Message, MessageReaction
+    from utils.extensions import db
+
+    messages = archive_candidates(cutoff, batch_size)
+    if not messages:
+        db.session.rollback()
+        return 0, 0
+
+    ids = [m.id for m in messages]
+    reactions = {}
+    for r in MessageReaction.query.filter(MessageReaction.message_id.in_(ids)).order_by(MessageReaction.id):
+        reactions.setdefault(r.message_id, []).append(r.to_dict())
+
+    db.session.add_all([ArchivedMessage.from_message(m, reactions.get(m.id, ())) for m in messages])
+
+    newest = {}
+    for m in messages:
+        if m.conversation_id not in newest or m.created_at > newest[m.conversation_id]:
+            newest[m.conversation_id] = m.created_at
+
+    reaction_count = MessageReaction.query.filter(
+        MessageReaction.message_id.in_(ids)
+    ).delete(synchronize_session=False)
+    Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+
+    for conv_id, through in newest.items():
+        db.session.execute(
+            update(Conversation).where(
+                Conversation.id == conv_id,
+                or_(Conversation.archived_through.is_(None), Conversation.archived_through < through),
+            ).values(archived_through=through, updated_at=Conversation.updated_at)
+        )
+
+    db.session.commit()
+    db.session.expunge_all()
+    return len(ids), reaction_count
+
+
+def archive_old_messages(older_than_days=None, batch_size=None, max_batches=None, now=None):
+    """
+    Archive everything older than the configured age, one committed batch at
+    a time. Returns a stats dict.
+    """
+    from flask import current_app
+
+    if older_than_days is None:
+        older_than_days = current_app.config.get("CHAT_ARCHIVE_AFTER_DAYS") or DEFAULT_ARCHIVE_AFTER_DAYS
+    if batch_size is None:
+        batch_size = current_app.config.get("CHAT_ARCHIVE_BATCH_SIZE") or DEFAULT_BATCH_SIZE
+
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    stats = {"cutoff": cutoff.isoformat(), "batches": 0, "messages": 0, "reactions": 0}
+    started = time.perf_counter()
+
+    while max_batches is None or stats["batches"] < max_batches:
+        moved, reactions = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        stats["batches"] += 1
+        stats["messages"] += moved
+        stats["reactions"] += reactions
+        logger.info("Chat archive batch %d: %d messages, %d reactions", stats["batches"], moved, reactions)
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def fetch_archived(conv_id, cursor=None, newer=False, limit=DEFAULT_BATCH_SIZE):
+    """
+    Keyset page of archived messages as detached Message objects, in the
+    paging direction (newest first unless `newer`). `cursor` is a
+    (created_at, id) pair.
+    """
+    from models import ArchivedMessage
+
+    query = ArchivedMessage.query.filter(
+        ArchivedMessage.conversation_id == conv_id,
+        ArchivedMessage.is_deleted.isnot(True),
+    )
+    if cursor is not None:
+        created_at, msg_id = cursor
+        if newer:
+            query = query.filter(or_(
+                ArchivedMessage.created_at > created_at,
+                and_(ArchivedMessage.created_at == created_at, ArchivedMessage.id > msg_id),
+            ))
+        else:
+            query = query.filter(or_(
+                ArchivedMessage.created_at < created_at,
+                and_(ArchivedMessage.created_at == created_at, ArchivedMessage.id < msg_id),
+            ))
+
+    if newer:
+        query = query.order_by(ArchivedMessage.created_at.asc(), ArchivedMessage.id.asc())
+    else:
+        query = query.order_by(ArchivedMessage.created_at.desc(), ArchivedMessage.id.desc())
+    return [row.to_message() for row in query.limit(limit).all()]
+
+
+def archived_cursor(conv_id, msg_id):
+    """(created_at, id) of an archived message in this conversation, or None."""
+    from models import ArchivedMessage
+    from utils.extensions import db
+
+    return db.session.query(ArchivedMessage.created_at, ArchivedMessage.id).filter_by(
+        id=msg_id, conversation_id=conv_id
+    ).first()
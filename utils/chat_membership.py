@@ -0,0 +1,85 @@
+"""
+Set-based group membership changes.
+
+Adding a whole cohort to a group used to cost a lookup, an existence check
+and an INSERT per member. add_group_members() instead resolves the selector
+(explicit public_ids, or a programme/level cohort) and the "not yet a
+member" anti-join in one SELECT, then writes all new rows with one
+INSERT ... ON CONFLICT DO NOTHING, so concurrent adds of the same person
+are harmless.
+
+Only teachers and students can be added to groups.
+"""
+from sqlalchemy import exists, insert, select
+
+GROUP_MEMBER_ROLES = ("teacher", "student")
+
+# Rows per INSERT statement (keeps large cohorts under bind-parameter limits)
+INSERT_CHUNK_SIZE = 500
+
+
+def member_candidates(conv_id, public_ids=None, programme=None, level=None):
+    """SELECT of (public_id, role) for eligible people not yet in the conversation."""
+    from models import ConversationParticipant, StudentProfile, User
+
+    query = select(User.public_id, User.role).where(
+        User.role.in_(GROUP_MEMBER_ROLES),
+        ~exists().where(
+            ConversationParticipant.conversation_id == conv_id,
+            ConversationParticipant.user_public_id == User.public_id,
+        ),
+    )
+    if public_ids is not None:
+        query = query.where(User.public_id.in_({str(p) for p in public_ids if p}))
+    if programme is not None:
+        query = query.join(StudentProfile, StudentProfile.user_id == User.user_id).where(
+            StudentProfile.current_programme == programme,
+            StudentProfile.programme_level == level,
+        )
+    return query.order_by(User.first_name, User.last_name, User.id)
+
+
+def _insert_ignoring_duplicates(session, rows):
+    from models import ConversationParticipant
+
+    table = ConversationParticipant.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        session.execute(insert(table), rows)
+        return [row["user_public_id"] for row in rows]
+
+    stmt = dialect_insert(table).on_conflict_do_nothing().returning(table.c.user_public_id)
+    inserted = set()
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        inserted.update(pub for (pub,) in session.execute(stmt.values(chunk)))
+    # RETURNING order is not guaranteed; keep the selector's order
+    return [row["user_public_id"] for row in rows if row["user_public_id"] in inserted]
+
+
+def add_group_members(conv_id, public_ids=None, programme=None, level=None):
+    """
+    Add everyone matched by the selector to a conversation (one SELECT, one
+    INSERT). Returns the public_ids actually added, in name order; the
+    caller commits.
+    """
+    from utils.extensions import db
+
+    if public_ids is None and programme is None:
+        raise ValueError("Provide public_ids or a programme/level selector")
+    if public_ids is not None and not public_ids:
+        return []
+
+    candidates = db.session.execute(member_candidates(conv_id, public_ids, programme, level)).all()
+    if not candidates:
+        return []
+
+    rows = [
+        {"conversation_id": conv_id, "user_public_id": pub, "user_role": role}
+        for pub, role in candidates
+    ]
+    return _insert_ignoring_duplicates(db.session, rows)
@@ -0,0 +1,195 @@
+"""
+Full-text search over chat messages.
+
+The index lives in the database and is maintained by the database itself,
+so every code path that creates, edits or soft-deletes a message keeps it
+in sync without application hooks:
+
+  - SQLite:     an external-content FTS5 table (message_fts) fed by triggers
+                on `message`; soft-deleted rows are dropped from the index.
+                conversation_id is indexed too, so the per-user scope is
+                applied inside the index.
+  - PostgreSQL: a partial GIN expression index on to_tsvector(content),
+                covering only rows that are not soft-deleted.
+
+ensure_message_search_index() is idempotent; it runs from the migration and
+from one_time_init() (for databases built with db.create_all()).
+"""
+import html
+import logging
+import re
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Postgres text search configuration used by both the index and queries
+PG_TEXT_CONFIG = "english"
+
+SNIPPET_WORDS = 16
+
+# Above this many conversations the SQLite query scopes by join only
+FTS_SCOPE_MAX_CONVERSATIONS = 500
+
+# Snippet highlight markers: control characters that cannot come from a
+# chat message, swapped for <mark> tags after the snippet is HTML-escaped.
+_HL_START = "\x02"
+_HL_END = "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_SQLITE_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        content, conversation_id,
+        content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message
+    WHEN new.is_deleted IS NOT 1 BEGIN
+        INSERT INTO message_fts(rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message
+    WHEN old.is_deleted IS NOT 1 BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+    END
+    """,
+    # One trigger so the old entry is always removed before the new one is
+    # added (separate triggers fire in reverse creation order).
+    """
+    CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content, is_deleted, conversation_id ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content, conversation_id)
+            SELECT 'delete', old.id, old.content, old.conversation_id WHERE old.is_deleted IS NOT 1;
+        INSERT INTO message_fts(rowid, content, conversation_id)
+            SELECT new.id, new.content, new.conversation_id WHERE new.is_deleted IS NOT 1;
+    END
+    """,
+)
+
+_SQLITE_DROP = (
+    "DROP TRIGGER IF EXISTS message_fts_au",
+    "DROP TRIGGER IF EXISTS message_fts_ad",
+    "DROP TRIGGER IF EXISTS message_fts_ai",
+    "DROP TABLE IF EXISTS message_fts",
+)
+
+_PG_INDEX = "idx_message_content_fts"
+
+
+def ensure_message_search_index(bind):
+    """Create the search index for the bound database if it does not exist yet."""
+    dialect = bind.dialect.name
+
+    if dialect == "sqlite":
+        exists = bind.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'"
+        )).first()
+        for ddl in _SQLITE_DDL:
+            bind.execute(text(ddl))
+        if not exists:
+            # Backfill existing history (triggers only see new writes)
+            bind.execute(text(
+                "INSERT INTO message_fts(rowid, content, conversation_id) "
+                "SELECT id, content, conversation_id FROM message WHERE is_deleted IS NOT 1"
+            ))
+    elif dialect == "postgresql":
+        bind.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {_PG_INDEX} ON message "
+            f"USING gin (to_tsvector('{PG_TEXT_CONFIG}', content)) "
+            f"WHERE is_deleted IS NOT TRUE"
+        ))
+    else:
+        logger.warning("Chat search: no full-text index support for dialect %s", dialect)
+
+
+def drop_message_search_index(bind):
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        for ddl in _SQLITE_DROP:
+            bind.execute(text(ddl))
+    elif dialect == "postgresql":
+        bind.execute(text(f"DROP INDEX IF EXISTS {_PG_INDEX}"))
+
+
+def query_terms(raw):
+    """Split free text into search terms (punctuation and operators are ignored)."""
+    return _TOKEN_RE.findall(raw or "")[:16]
+
+
+def highlight_snippet(snippet):
+    """HTML-escape a snippet and turn the highlight markers into <mark> tags."""
+    return html.escape(snippet or "").replace(_HL_START, "<mark>").replace(_HL_END, "</mark>")
+
+
+def search_messages(session, conversation_ids, raw_query, limit=20, offset=0):
+    """
+    Ranked search over non-deleted messages in the given conversations.
+
+    Every term must match; the last term also matches as a prefix, so
+    results appear while the user is still typing. Returns a list of
+    (message_id, score, snippet_html), best match first.
+    """
+    terms = query_terms(raw_query)
+    if not terms or not conversation_ids:
+        return []
+
+    bind = session.get_bind()
+    dialect = bind.dialect.name
+    conv_ids = sorted({int(c) for c in conversation_ids})
+    conv_params = {f"c{i}": cid for i, cid in enumerate(conv_ids)}
+    conv_in = ", ".join(f":{name}" for name in conv_params)
+    params = dict(conv_params, limit=int(limit), offset=int(offset))
+
+    if dialect == "sqlite":
+        match = " ".join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+        params["q"] = f"content : ({match})"
+        if len(conv_ids) <= FTS_SCOPE_MAX_CONVERSATIONS:
+            # Intersect with the user's conversations inside the index so
+            # cost follows the user's matches, not the whole table's
+            params["q"] += " AND conversation_id : ({})".format(" OR ".join(f'"{c}"' for c in conv_ids))
+        sql = f"""
+            SELECT m.id AS id,
+                   bm25(message_fts, 1.0, 0.0) AS score,
+                   snippet(message_fts, 0, :hl_start, :hl_end, '…', {SNIPPET_WORDS}) AS snippet
+            FROM message_fts
+            JOIN message m ON m.id = message_fts.rowid
+            WHERE message_fts MATCH :q
+              AND m.conversation_id IN ({conv_in})
+            ORDER BY score, m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+        params.update(hl_start=_HL_START, hl_end=_HL_END)
+    elif dialect == "postgresql":
+        params["q"] = " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+        params["headline_opts"] = (
+            f'StartSel="{_HL_START}", StopSel="{_HL_END}", '
+            f"MaxWords={SNIPPET_WORDS}, MinWords=4, MaxFragments=1"
+        )
+        # Ranking and headlines only run on the matched rows of one page
+        sql = f"""
+            WITH q AS (SELECT to_tsquery('{PG_TEXT_CONFIG}', :q) AS query),
+            hits AS (
+                SELECT m.id, m.content,
+                       ts_rank_cd(to_tsvector('{PG_TEXT_CONFIG}', m.content), q.query) AS score
+                FROM message m, q
+                WHERE to_tsvector('{PG_TEXT_CONFIG}', m.content) @@ q.query
+                  AND m.is_deleted IS NOT TRUE
+                  AND m.conversation_id IN ({conv_in})
+                ORDER BY score DESC, m.id DESC
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT hits.id AS id, hits.score AS score,
+                   ts_headline('{PG_TEXT_CONFIG}', hits.content, q.query, :headline_opts) AS snippet
+            FROM hits, q
+            ORDER BY hits.score DESC, hits.id DESC
+        """
+    else:
+        raise RuntimeError(f"Chat search is not supported on {dialect}")
+
+    rows = session.execute(text(sql), params).all()
+    return [(r.id, r.score, highlight_snippet(r.snippet)) for r in rows]
@@ -4,8 +4,24 @@ Flask extensions - instantiated here but configured in app factory
 from flask_sqlalchemy import SQLAlchemy
 from flask_mailman import Mail
 from flask_socketio import SocketIO
+from utils.presence import Presence
+from utils.presence_fanout import PresenceFanout
+from utils.last_seen import LastSeenWriter
+from utils.identity_cache import IdentityCache
+from utils.user_directory import UserDirectory
+from utils.grading_scale import GradingScaleCache
+from utils.grade_recompute import GradeRecomputeQueue
+from utils.semester_cache import SemesterCache
 
 # Create bare instances (no config yet)
 db = SQLAlchemy()
 mail = Mail()
 socketio = SocketIO()  # Initialize WITHOUT parameters - config happens in init_app()
+presence = Presence()  # In-memory until init_app() selects the configured backend
+presence_fanout = PresenceFanout()  # targeted, batched presence_batch frames
+last_seen_writer = LastSeenWriter()
+identity_cache = IdentityCache()  # public_id -> immutable Identity records
+user_directory = UserDirectory()  # in-memory recipient picker index
+grading_scale = GradingScaleCache()  # compiled score -> grade bands
+grade_recompute = GradeRecomputeQueue()  # dirty (student, course) grades, recomputed in the background
+semester_cache = SemesterCache()  # class results and other semester aggregates
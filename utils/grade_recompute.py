@@ -0,0 +1,367 @@
+"""
+Event-driven recomputation of StudentCourseGrade rows.
+
+Committed writes that change a score input mark work instead of waiting
+for a manual or full-semester recalculation:
+
+  - quiz / assignment / exam submissions  -> (student, course)
+  - assessment scheme weights             -> (course)
+  - quiz question points / exam marks     -> (course), they change the max
+
+Marks are collected per session during flush and queued after commit
+(dropped on rollback). A background task wakes every
+GRADE_RECOMPUTE_DELAY_SECONDS, coalesces the queue per course and reruns
+the set-based engine for just the affected students.
+
+Courses in a semester that is locked or released are skipped, and rows
+flagged is_finalized (when the model has the flag) are left as they are.
+Skipped marks are held per semester and replayed once it is unlocked or
+recalled: straight away by thaw() in the process that made the change, and
+by a recheck every HELD_RECHECK_SECONDS in the others.
+Each course commits on its own; a course that fails only re-queues its
+own marks, and they are dropped (counted in marks_dropped) after
+GRADE_RECOMPUTE_MAX_ATTEMPTS tries. Queue depth and lag (commit ->
+recomputed) are reported via stats() (/health/metrics).
+
+The queue is per process and in memory; a crash loses at most one window
+of marks, which a full recalculation repairs.
+"""
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELAY_SECONDS = 2
+DEFAULT_MAX_ATTEMPTS = 5
+HELD_RECHECK_SECONDS = 60
+
+_PENDING_KEY = "grade_recompute_pending"
+
+# Model -> (kind, parent id attribute, student attribute or None, fields that matter)
+_TRACKED = {
+    "StudentQuizSubmission": ("quiz", "quiz_id", "student_id", ("score", "quiz_id", "student_id")),
+    "AssignmentSubmission": ("assignment", "assignment_id", "student_id", ("score", "assignment_id", "student_id")),
+    "ExamSubmission": ("exam", "exam_id", "student_id", ("score", "exam_id", "student_id")),
+    "CourseAssessmentScheme": ("course", "course_id", None, (
+        "quiz_weight", "assignment_weight", "exam_weight",
+        "course_id", "programme_name", "programme_level",
+    )),
+    "Question": ("quiz", "quiz_id", None, ("points", "quiz_id")),
+    "ExamQuestion": ("exam", "exam_id", None, ("marks", "exam_id")),
+}
+
+
+class GradeRecomputeQueue:
+    """Flask extension: coalescing queue of grade invalidations with a background worker."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.delay_seconds = DEFAULT_DELAY_SECONDS
+        self.max_attempts = DEFAULT_MAX_ATTEMPTS
+        self._lock = threading.Lock()
+        self._pending = {}  # (kind, parent_id, student_id|None) -> first enqueued (time.time())
+        self._attempts = {}  # mark -> failed attempts so far
+        self._held = {}     # (academic_year, semester) -> {mark: first enqueued}, skipped while frozen
+        self._held_checked = 0.0
+        self._started = False
+        self._listening = False
+        self._flush_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "courses_recomputed": 0,
+            "rows_recomputed": 0,
+            "courses_skipped_frozen": 0,
+            "courses_failed": 0,
+            "marks_dropped": 0,
+            "last_batch": 0,
+            "last_lag_ms": None,
+            "max_lag_ms": 0.0,
+            "errors": 0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.delay_seconds = float(app.config.get("GRADE_RECOMPUTE_DELAY_SECONDS") or DEFAULT_DELAY_SECONDS)
+        self.max_attempts = int(app.config.get("GRADE_RECOMPUTE_MAX_ATTEMPTS") or DEFAULT_MAX_ATTEMPTS)
+        app.extensions["grade_recompute"] = self
+        self._listen()
+        atexit.register(self.flush)
+
+    # -------------------------
+    # Queue
+    # -------------------------
+    def mark_course(self, course_id):
+        """Queue a whole course (e.g. after a bulk/Core write the listeners cannot see)."""
+        self._enqueue({("course", course_id, None): time.time()})
+
+    def mark_student(self, course_id, student_id):
+        self._enqueue({("course", course_id, student_id): time.time()})
+
+    def _enqueue(self, marks):
+        if not marks:
+            return
+        with self._lock:
+            for key, when in marks.items():
+                if key not in self._pending or when < self._pending[key]:
+                    self._pending[key] = when
+        self._ensure_started()
+
+    def thaw(self, academic_year, semester):
+        """Re-queue the marks skipped while a semester was locked or released."""
+        with self._lock:
+            marks = self._held.pop((academic_year, semester), None)
+        self._enqueue(marks)
+
+    def depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            oldest = min(self._pending.values(), default=None)
+            return dict(
+                self._stats,
+                depth=len(self._pending),
+                held=sum(len(marks) for marks in self._held.values()),
+                oldest_pending_seconds=round(time.time() - oldest, 3) if oldest is not None else None,
+                delay_seconds=self.delay_seconds,
+            )
+
+    # -------------------------
+    # Recomputing
+    # -------------------------
+    def flush(self):
+        """Recompute everything queued so far. Returns the number of rows written."""
+        if self.app is None:
+            return 0
+
+        with self._flush_lock:
+            now = time.time()
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                # Held marks are retried now and then, in case another process thawed their semester
+                held = {}
+                if self._held and now - self._held_checked >= HELD_RECHECK_SECONDS:
+                    for marks in self._held.values():
+                        held.update(marks)
+                    self._held, self._held_checked = {}, now
+            if not batch and not held:
+                return 0
+            marks = dict(held)
+            for key, when in batch.items():
+                if key not in marks or when < marks[key]:
+                    marks[key] = when
+
+            try:
+                with self.app.app_context():
+                    courses, rows, frozen, failed = self._recompute(marks)
+            except Exception:
+                logger.exception("grade recompute failed (%d marks)", len(marks))
+                courses = rows = 0
+                frozen, failed = {}, set(marks)
+                with self._lock:
+                    self._stats["errors"] += 1
+            # Courses skipped because of newly queued marks (not re-checked held ones)
+            skipped = len({course_id for key, (_, course_id) in frozen.items() if key in batch})
+
+            done = [when for key, when in marks.items() if key not in failed and key not in frozen]
+            with self._lock:
+                self._requeue({key: marks[key] for key in failed})
+                for key, (period, _) in frozen.items():
+                    self._held.setdefault(period, {})[key] = marks[key]
+                for key in marks:
+                    if key not in failed:
+                        self._attempts.pop(key, None)
+                self._stats["batches"] += 1
+                self._stats["courses_recomputed"] += courses
+                self._stats["rows_recomputed"] += rows
+                self._stats["courses_skipped_frozen"] += skipped
+                self._stats["last_batch"] = len(marks)
+                if done:
+                    lag_ms = (time.time() - min(done)) * 1000
+                    self._stats["last_lag_ms"] = round(lag_ms, 2)
+                    self._stats["max_lag_ms"] = round(max(self._stats["max_lag_ms"], lag_ms), 2)
+            logger.debug("grade recompute: %d marks, %d courses, %d rows, %d held, %d failed",
+                         len(marks), courses, rows, len(frozen), len(failed))
+            return rows
+
+    def _requeue(self, marks):
+        """Put failed marks back (caller holds self._lock); drop them after max_attempts."""
+        dropped = 0
+        for key, when in marks.items():
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(key, None)
+                dropped += 1
+                continue
+            self._attempts[key] = attempts
+            if key not in self._pending or when < self._pending[key]:
+                self._pending[key] = when
+        if dropped:
+            self._stats["marks_dropped"] += dropped
+            logger.error("grade recompute: dropped %d marks after %d attempts", dropped, self.max_attempts)
+
+    def _recompute(self, batch):
+        """
+        Regrade the courses a batch touches, each in its own transaction.
+        Returns (courses, rows, {frozen mark: (period, course_id)}, failed marks).
+        """
+        from models import Assignment, Course, Exam, Quiz, SemesterResultRelease
+        from services.grading_calculation_engine import GradingCalculationEngine
+        from utils.extensions import db
+
+        # Resolve quiz/assignment/exam ids to courses, one query per kind
+        parents = {"quiz": Quiz, "assignment": Assignment, "exam": Exam}
+        course_of = {}
+        for kind, model in parents.items():
+            ids = {parent_id for (k, parent_id, _) in batch if k == kind}
+            if ids:
+                course_of[kind] = dict(db.session.query(model.id, model.course_id).filter(model.id.in_(ids)))
+
+        # course_id -> set of student ids, or None for the whole course
+        targets = {}
+        course_of_mark = {}
+        for kind, parent_id, student_id in batch:
+            course_id = parent_id if kind == "course" else course_of[kind].get(parent_id)
+            if course_id is None:
+                continue  # parent deleted since
+            course_of_mark[(kind, parent_id, student_id)] = course_id
+            if student_id is None or targets.get(course_id, ()) is None:
+                targets[course_id] = None
+            else:
+                targets.setdefault(course_id, set()).add(student_id)
+        if not targets:
+            return 0, 0, {}, set()
+
+        periods = dict(
+            (cid, (year, sem)) for cid, year, sem in db.session.query(
+                Course.id, Course.academic_year, Course.semester
+            ).filter(Course.id.in_(list(targets)))
+        )
+        frozen = {
+            (r.academic_year, r.semester)
+            for r in SemesterResultRelease.query.filter(
+                db.or_(SemesterResultRelease.is_locked.is_(True), SemesterResultRelease.is_released.is_(True))
+            )
+        }
+
+        courses = rows = 0
+        failed_courses, frozen_courses = set(), set()
+        for course_id, student_ids in sorted(targets.items()):
+            period = periods.get(course_id)
+            if period is None:
+                continue
+            if period in frozen:
+                frozen_courses.add(course_id)
+                continue
+            try:
+                result = GradingCalculationEngine.recalculate_semester(
+                    period[0], period[1],
+                    course_ids=[course_id],
+                    student_ids=sorted(student_ids) if student_ids is not None else None,
+                    include_finalized=False,
+                )
+            except Exception:
+                db.session.rollback()
+                logger.exception("grade recompute failed for course %s", course_id)
+                failed_courses.add(course_id)
+                continue
+            for course_result in result["courses"]:
+                if course_result.get("error"):
+                    logger.error("grade recompute failed for course %s: %s", course_id, course_result["error"])
+                    failed_courses.add(course_id)
+                    continue
+                courses += 1
+                rows += course_result["calculated"]
+
+        if failed_courses:
+            with self._lock:
+                self._stats["courses_failed"] += len(failed_courses)
+        failed = {key for key, course_id in course_of_mark.items() if course_id in failed_courses}
+        held = {
+            key: (periods[course_id], course_id)
+            for key, course_id in course_of_mark.items() if course_id in frozen_courses
+        }
+        return courses, rows, held, failed
+
+    def _ensure_started(self):
+        if self._started or self.app is None:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        from utils.extensions import socketio
+        socketio.start_background_task(self._run)
+        logger.info("grade recompute worker started (every %ss)", self.delay_seconds)
+
+    def _run(self):
+        from utils.extensions import socketio
+
+        while True:
+            socketio.sleep(self.delay_seconds)
+            self.flush()
+
+    # -------------------------
+    # ORM hooks
+    # -------------------------
+    def _listen(self):
+        """Collect marks during flush; queue them once the transaction commits (once per process)."""
+        if self._listening:
+            return
+        self._listening = True
+
+        import models
+        from sqlalchemy import event, inspect
+        from sqlalchemy.orm import Session, object_session
+
+        def marks_for(target, changed_only):
+            kind, parent_attr, student_attr, fields = _TRACKED[type(target).__name__]
+            state = inspect(target)
+            if changed_only and not any(state.attrs[f].history.has_changes() for f in fields):
+                return []
+
+            def values(attr):
+                if attr is None:
+                    return {None}
+                history = state.attrs[attr].history
+                # An update that moves the row also invalidates where it came from
+                return {v for v in (getattr(target, attr), *(history.deleted or ())) if v is not None}
+
+            return [(kind, p, s) for p in values(parent_attr) for s in values(student_attr)]
+
+        def collect(target, changed_only):
+            session = object_session(target)
+            if session is None:
+                return
+            now = time.time()
+            pending = session.info.setdefault(_PENDING_KEY, {})
+            for key in marks_for(target, changed_only):
+                pending.setdefault(key, now)
+
+        def on_insert_or_delete(mapper, connection, target):
+            collect(target, changed_only=False)
+
+        def on_update(mapper, connection, target):
+            collect(target, changed_only=True)
+
+        def after_commit(session):
+            marks = session.info.pop(_PENDING_KEY, None)
+            if marks:
+                self._enqueue(marks)
+
+        def after_rollback(session):
+            session.info.pop(_PENDING_KEY, None)
+
+        for name in _TRACKED:
+            model = getattr(models, name)
+            event.listen(model, "after_insert", on_insert_or_delete)
+            event.listen(model, "after_delete", on_insert_or_delete)
+            event.listen(model, "after_update", on_update)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)
@@ -0,0 +1,231 @@
+"""
+Compiled, in-memory grading scales.
+
+GradeService.get_grade used to run a GradingScale range query for every
+score. The scale is tiny and rarely edited, so it is loaded once and
+compiled per (programme, level):
+
+  - bands sorted by min_score; a score is looked up with bisect
+  - a programme/level uses its own rows when it has any, falling back to
+    (programme, any level), then (any programme, level), then the global
+    rows (programme_name / programme_level NULL), and finally every row
+    (as the old range query did) with a warning
+  - grades_for() grades a batch of scores against one compiled scale
+
+It is reloaded after a GradingScale insert/update/delete through the ORM
+(as in utils/user_directory.py), and after GRADING_SCALE_TTL_SECONDS so
+other worker processes pick changes up too.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 300
+
+_DIRTY_KEY = "grading_scale_dirty"
+
+# Letter -> point used when no grading scale rows exist at all
+LEGACY_GRADE_POINTS = {
+    'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'F': 0.0
+}
+
+
+class GradeBand(NamedTuple):
+    """One GradingScale row; same attribute names as the model."""
+    id: int
+    min_score: float
+    max_score: float
+    grade_letter: str
+    grade_point: float
+    pass_fail: str
+    programme_name: Optional[str]
+    programme_level: Optional[str]
+
+
+class CompiledScale:
+    """Immutable score -> GradeBand lookup for one programme/level."""
+
+    def __init__(self, bands):
+        # Highest min_score wins where bands overlap; ties go to the older row
+        self.bands = sorted(bands, key=lambda b: (b.min_score, -b.id))
+        self.mins = [b.min_score for b in self.bands]
+        self.points = {}
+        for band in sorted(self.bands, key=lambda b: b.id, reverse=True):
+            self.points[band.grade_letter] = band.grade_point
+
+    def grade_for(self, score):
+        """GradeBand containing `score`, or None (no score / gap between bands)."""
+        if score is None:
+            return None
+        i = bisect_right(self.mins, score) - 1
+        while i >= 0:
+            band = self.bands[i]
+            if score <= band.max_score:
+                return band
+            i -= 1
+        return None
+
+    def grades_for(self, scores):
+        grade_for = self.grade_for
+        return [grade_for(score) for score in scores]
+
+    def point_for_letter(self, letter):
+        if not self.bands:
+            return LEGACY_GRADE_POINTS.get(letter, 0.0)
+        return self.points.get(letter, 0.0)
+
+
+def _level_key(level):
+    return None if level in (None, "") else str(level)
+
+
+class GradingScaleCache:
+    """Flask extension: compiled grading scales, reloaded when GradingScale changes."""
+
+    def __init__(self, app=None, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._groups = None     # (programme, level) -> [GradeBand, ...]
+        self._compiled = {}     # (programme, level) -> CompiledScale
+        self._loaded_at = 0.0
+        self._generation = 0    # bumped by invalidate(); a load started earlier is discarded
+        self._listening = False
+        self._stats = {"loads": 0, "lookups": 0, "invalidations": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("GRADING_SCALE_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+        app.extensions["grading_scale"] = self
+        self._listen()
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def scale_for(self, programme=None, level=None):
+        """CompiledScale for a programme/level (most specific rows that exist)."""
+        groups, compiled = self._current()
+        key = (programme or None, _level_key(level))
+        scale = compiled.get(key)
+        if scale is None:
+            for candidate in (key, (key[0], None), (None, key[1]), (None, None)):
+                if candidate in groups:
+                    scale = CompiledScale(groups[candidate])
+                    break
+            else:
+                # Only other programmes' rows exist: match any row, as
+                # GradeService.get_grade's range query used to
+                if groups:
+                    logger.warning(
+                        "No grading scale rows for programme=%r level=%r; using all rows",
+                        key[0], key[1]
+                    )
+                scale = CompiledScale([band for bands in groups.values() for band in bands])
+            with self._lock:
+                if compiled is self._compiled:
+                    compiled[key] = scale
+        return scale
+
+    def grade_for(self, score, programme=None, level=None):
+        with self._lock:
+            self._stats["lookups"] += 1
+        return self.scale_for(programme, level).grade_for(score)
+
+    def grades_for(self, scores, programme=None, level=None):
+        """GradeBand (or None) for each score, in order, against one scale."""
+        scores = list(scores)
+        with self._lock:
+            self._stats["lookups"] += len(scores)
+        return self.scale_for(programme, level).grades_for(scores)
+
+    def point_for_letter(self, letter, programme=None, level=None):
+        return self.scale_for(programme, level).point_for_letter(letter)
+
+    def stats(self):
+        with self._lock:
+            groups = len(self._groups) if self._groups is not None else 0
+            return dict(self._stats, scales=groups, ttl_seconds=self.ttl_seconds)
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    def _current(self):
+        self._listen()
+        now = self._clock()
+        with self._lock:
+            if self._groups is not None and now - self._loaded_at < self.ttl_seconds:
+                return self._groups, self._compiled
+            generation = self._generation
+
+        groups = self._load()
+        compiled = {}
+        with self._lock:
+            if generation == self._generation:
+                self._groups, self._compiled, self._loaded_at = groups, compiled, now
+            self._stats["loads"] += 1
+        return groups, compiled
+
+    def _load(self):
+        from models import GradingScale
+        from utils.extensions import db
+
+        groups = {}
+        rows = db.session.query(
+            GradingScale.id, GradingScale.min_score, GradingScale.max_score,
+            GradingScale.grade_letter, GradingScale.grade_point, GradingScale.pass_fail,
+            GradingScale.programme_name, GradingScale.programme_level,
+        ).all()
+        for row in rows:
+            band = GradeBand(*row)
+            key = (band.programme_name or None, _level_key(band.programme_level))
+            groups.setdefault(key, []).append(band)
+        return groups
+
+    # -------------------------
+    # Invalidation
+    # -------------------------
+    def invalidate(self):
+        with self._lock:
+            if self._groups is not None:
+                self._stats["invalidations"] += 1
+            self._groups = None
+            self._compiled = {}
+            self._generation += 1
+
+    def _listen(self):
+        """Reload after ORM writes to GradingScale (once per process)."""
+        if self._listening:
+            return
+        self._listening = True
+
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session, object_session
+        from models import GradingScale
+
+        def on_change(mapper, connection, target):
+            self.invalidate()
+            session = object_session(target)
+            if session is not None:
+                session.info[_DIRTY_KEY] = True
+
+        def after_commit(session):
+            # A concurrent lookup may have reloaded from pre-commit rows
+            if session.info.pop(_DIRTY_KEY, None):
+                self.invalidate()
+
+        def after_rollback(session):
+            if session.info.pop(_DIRTY_KEY, None):
+                self.invalidate()
+
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(GradingScale, name, on_change)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)
@@ -0,0 +1,187 @@
+"""
+Process-wide cache of public_id -> person identity.
+
+Chat resolves the same few hundred people by public_id over and over
+(participants, message senders, the login loader). This cache keeps small
+immutable Identity records instead of ORM objects, so entries are safe to
+share across requests, threads and greenlets.
+
+  - LRU bound (IDENTITY_CACHE_SIZE) and per-entry TTL (IDENTITY_CACHE_TTL_SECONDS)
+  - invalidated when a User/Admin row is inserted, updated or deleted through
+    the ORM (at flush and again after commit), and explicitly via
+    invalidate() for bulk/Core updates
+  - hit/miss/eviction counters via stats() (/health/metrics)
+
+Invalidation is per process; with several workers other processes pick up
+changes when the TTL expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_TTL_SECONDS = 300
+
+_DIRTY_KEY = "identity_cache_dirty"
+
+
+class Identity(NamedTuple):
+    public_id: str
+    kind: str                  # 'user' | 'admin' (which table)
+    pk: int                    # primary key in that table
+    name: str                  # display name as shown in chat
+    role: str
+    avatar: Optional[str]      # profile_picture filename
+    last_seen: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.public_id, "user", user.id, user.full_name, user.role,
+                   user.profile_picture, user.last_seen)
+
+    @classmethod
+    def from_admin(cls, admin):
+        return cls(admin.public_id, "admin", admin.id, admin.username, admin.role,
+                   admin.profile_picture, admin.last_seen)
+
+
+class IdentityCache:
+    """Flask extension: LRU + TTL cache of Identity records keyed by public_id."""
+
+    def __init__(self, app=None, maxsize=DEFAULT_MAXSIZE, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # public_id -> (expires_at, Identity)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = int(app.config.get("IDENTITY_CACHE_SIZE") or DEFAULT_MAXSIZE)
+        self.ttl_seconds = float(app.config.get("IDENTITY_CACHE_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+        app.extensions["identity_cache"] = self
+        self._listen()
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+    def get(self, public_id):
+        """Identity for a public_id (User first, then Admin), or None."""
+        if not public_id:
+            return None
+        return self.get_many([public_id]).get(public_id)
+
+    def get_many(self, public_ids):
+        """Map public_id -> Identity; misses are loaded with one IN query per table."""
+        wanted = {pid for pid in public_ids if pid}
+        found = {}
+        now = self._clock()
+        with self._lock:
+            for pid in wanted:
+                entry = self._entries.get(pid)
+                if entry and entry[0] > now:
+                    self._entries.move_to_end(pid)
+                    found[pid] = entry[1]
+                elif entry:
+                    del self._entries[pid]
+            self._hits += len(found)
+            self._misses += len(wanted) - len(found)
+
+        missing = wanted - found.keys()
+        if missing:
+            loaded = self._load(missing)
+            found.update(loaded)
+            self._store(loaded.values())
+        return found
+
+    def _load(self, public_ids):
+        from models import Admin, User
+
+        loaded = {
+            a.public_id: Identity.from_admin(a)
+            for a in Admin.query.filter(Admin.public_id.in_(public_ids)).all()
+        }
+        loaded.update({
+            u.public_id: Identity.from_user(u)
+            for u in User.query.filter(User.public_id.in_(public_ids)).all()
+        })
+        return loaded
+
+    def _store(self, identities):
+        expires_at = self._clock() + self.ttl_seconds
+        with self._lock:
+            for ident in identities:
+                self._entries[ident.public_id] = (expires_at, ident)
+                self._entries.move_to_end(ident.public_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    # -------------------------
+    # Invalidation
+    # -------------------------
+    def invalidate(self, *public_ids):
+        with self._lock:
+            for pid in public_ids:
+                if self._entries.pop(pid, None) is not None:
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+    def _listen(self):
+        """Invalidate on ORM writes to User/Admin (once per process)."""
+        if self._listening:
+            return
+        self._listening = True
+
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session, object_session
+        from models import Admin, User
+
+        def on_write(mapper, connection, target):
+            pid = getattr(target, "public_id", None)
+            if not pid:
+                return
+            self.invalidate(pid)
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault(_DIRTY_KEY, set()).add(pid)
+
+        def after_commit(session):
+            # A concurrent reader may have re-cached the pre-commit row
+            dirty = session.info.pop(_DIRTY_KEY, None)
+            if dirty:
+                self.invalidate(*dirty)
+
+        def after_rollback(session):
+            session.info.pop(_DIRTY_KEY, None)
+
+        for model in (User, Admin):
+            for name in ("after_insert", "after_update", "after_delete"):
+                event.listen(model, name, on_write)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)
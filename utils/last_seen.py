@@ -0,0 +1,161 @@
+"""
+Write-behind buffer for chat presence `last_seen` timestamps.
+
+Socket disconnects record a timestamp in memory instead of committing a
+row each. A background task flushes the buffer every few seconds as one
+bulk UPDATE per table (user, admin), and once more at interpreter exit, so
+a burst of disconnects at the end of a lecture costs a couple of
+statements instead of hundreds of single-row commits on the hub.
+
+Configuration (config.py):
+  LAST_SEEN_FLUSH_SECONDS  flush interval
+  LAST_SEEN_BATCH_SIZE     max rows per UPDATE statement
+"""
+import atexit
+import logging
+import threading
+import time
+
+from sqlalchemy import case, update
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 5
+DEFAULT_BATCH_SIZE = 500
+
+
+class LastSeenWriter:
+    """Flask extension buffering last_seen updates keyed by public_id."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_seconds = DEFAULT_FLUSH_SECONDS
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self._lock = threading.Lock()
+        self._pending = {}  # public_id -> datetime
+        self._started = False
+        self._flush_lock = threading.Lock()
+        self._stats = {
+            "flushes": 0,
+            "rows_written": 0,
+            "last_flush_ms": None,
+            "max_flush_ms": 0.0,
+            "last_batch": 0,
+            "errors": 0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_seconds = float(app.config.get("LAST_SEEN_FLUSH_SECONDS") or DEFAULT_FLUSH_SECONDS)
+        self.batch_size = int(app.config.get("LAST_SEEN_BATCH_SIZE") or DEFAULT_BATCH_SIZE)
+        app.extensions["last_seen_writer"] = self
+        atexit.register(self.flush)
+
+    # -------------------------
+    # Buffer
+    # -------------------------
+    def record(self, public_id, when):
+        """Buffer a last-seen timestamp (later timestamps win)."""
+        if not public_id:
+            return
+        with self._lock:
+            current = self._pending.get(public_id)
+            if current is None or when > current:
+                self._pending[public_id] = when
+        self._ensure_started()
+
+    def pending(self, public_id):
+        """Buffered (not yet written) last-seen for a user, if any."""
+        with self._lock:
+            return self._pending.get(public_id)
+
+    def depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, depth=len(self._pending), flush_seconds=self.flush_seconds)
+
+    # -------------------------
+    # Flushing
+    # -------------------------
+    def flush(self):
+        """Write everything buffered so far. Returns the number of users flushed."""
+        if self.app is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    written = self._write(batch)
+            except Exception:
+                logger.exception("last_seen flush failed (%d users); re-queued", len(batch))
+                with self._lock:
+                    for pub, when in batch.items():
+                        if pub not in self._pending or self._pending[pub] < when:
+                            self._pending[pub] = when
+                    self._stats["errors"] += 1
+                return 0
+
+            # Core UPDATEs bypass the identity cache's ORM invalidation hooks
+            from utils.extensions import identity_cache
+            identity_cache.invalidate(*batch)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["rows_written"] += written
+                self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+                self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+                self._stats["last_batch"] = len(batch)
+            logger.debug("last_seen flush: %d users, %d rows, %.1f ms", len(batch), written, elapsed_ms)
+            return len(batch)
+
+    def _write(self, batch):
+        from models import Admin, User
+        from utils.extensions import db
+
+        items = sorted(batch.items())
+        written = 0
+        for start in range(0, len(items), self.batch_size):
+            chunk = dict(items[start:start + self.batch_size])
+            # A public_id lives in exactly one of the tables; each UPDATE only
+            # touches its own rows.
+            for model in (User, Admin):
+                values = {"last_seen": case(chunk, value=model.public_id, else_=model.last_seen)}
+                if "updated_at" in model.__table__.c:
+                    values["updated_at"] = model.updated_at  # presence is not an account update
+                result = db.session.execute(
+                    update(model).where(model.public_id.in_(list(chunk))).values(**values)
+                )
+                written += result.rowcount or 0
+        db.session.commit()
+        return written
+
+    def _ensure_started(self):
+        if self._started or self.app is None:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        from utils.extensions import socketio
+        socketio.start_background_task(self._run)
+        logger.info("last_seen writer started (every %ss)", self.flush_seconds)
+
+    def _run(self):
+        from utils.extensions import socketio
+
+        while True:
+            socketio.sleep(self.flush_seconds)
+            self.flush()
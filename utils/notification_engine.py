@@ -105,7 +105,7 @@ def create_notification(
         if sender:
             sender_id = getattr(sender, 'user_id', None) or getattr(sender, 'admin_id', None)
             sender_type = 'admin' if hasattr(sender, 'admin_id') else 'user'
-        elif current_user.is_authenticated:
+        elif current_user and current_user.is_authenticated:
             sender_id = getattr(current_user, 'user_id', None) or getattr(current_user, 'admin_id', None)
             sender_type = 'admin' if hasattr(current_user, 'admin_id') else 'user'
         
@@ -181,6 +181,8 @@ def _get_notification_link(notification):
         return f"/vclass/view-assignment/{notification.related_id}"
     elif notification.related_type == 'exam' and notification.related_id:
         return f"/vclass/exam/{notification.related_id}"
+    elif notification.related_type == 'semester_release':
+        return "/student/results/semester"
     return "/student/notifications"
 
 # =============================================================================
@@ -489,6 +491,104 @@ Click the link to view your grade, score breakdown, and any feedback.
         priority='high'
     )
 
+def notify_semester_results_released(academic_year, semester, sender=None, send_email=False):
+    """
+    Notify students when a semester's results are released: one notification
+    for the semester, addressed to every student graded in it. Students
+    already notified for this release (an earlier release before a recall)
+    are skipped. Returns the number of students notified.
+    """
+    from models import SemesterResultRelease
+
+    release = SemesterResultRelease.query.filter_by(
+        academic_year=academic_year, semester=semester
+    ).first()
+    if not release or not release.is_released:
+        return 0
+
+    already_notified = (
+        db.session.query(NotificationRecipient.user_id)
+        .join(Notification, Notification.id == NotificationRecipient.notification_id)
+        .filter(
+            Notification.related_type == 'semester_release',
+            Notification.related_id == release.id
+        )
+    )
+    students = (
+        User.query
+        .join(StudentCourseGrade, StudentCourseGrade.student_id == User.id)
+        .filter(
+            StudentCourseGrade.academic_year == academic_year,
+            StudentCourseGrade.semester == semester,
+            StudentCourseGrade.final_score != None,
+            User.user_id.not_in(already_notified)
+        )
+        .distinct()
+        .all()
+    )
+    if not students:
+        return 0
+
+    message = f"""
+Your results for {academic_year} Semester {semester} have been released!
+
+Click the link to view your grades, score breakdown, and GPA.
+    """
+
+    notification = create_notification(
+        notification_type='grade_released',
+        title=f"Results Released: {academic_year} Semester {semester}",
+        message=message,
+        recipients=students,
+        sender=sender,
+        related_type='semester_release',
+        related_id=release.id,
+        send_email_copy=send_email,
+        priority='high'
+    )
+    return len(students) if notification is not None else 0
+
+def queue_semester_results_released(academic_year, semester, sender=None, send_email=None):
+    """
+    Run notify_semester_results_released() in a background task so the
+    release request returns without waiting on notification inserts and
+    emails. Call after the release has been committed. Email copies follow
+    RESULT_RELEASE_EMAILS unless send_email is given.
+    """
+    from flask import current_app
+    from utils.extensions import socketio
+
+    if send_email is None:
+        send_email = bool(current_app.config.get('RESULT_RELEASE_EMAILS', False))
+    if sender is None and current_user and current_user.is_authenticated:
+        sender = current_user
+    sender_key = None
+    if sender is not None:
+        sender_key = (getattr(sender, 'admin_id', None), getattr(sender, 'user_id', None))
+
+    app = current_app._get_current_object()
+    socketio.start_background_task(
+        _notify_semester_results_released_in_app, app, academic_year, semester, sender_key, send_email
+    )
+
+def _notify_semester_results_released_in_app(app, academic_year, semester, sender_key, send_email):
+    with app.app_context():
+        try:
+            sender = None
+            if sender_key:
+                admin_id, user_id = sender_key
+                if admin_id:
+                    sender = Admin.query.filter_by(admin_id=admin_id).first()
+                elif user_id:
+                    sender = User.query.filter_by(user_id=user_id).first()
+            created = notify_semester_results_released(academic_year, semester, sender, send_email)
+            logger.info(f"Notified {created} students of the {academic_year} {semester} release")
+        except Exception as e:
+            logger.error(f"Error notifying release of {academic_year} {semester}: {e}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
 # =============================================================================
 # FEE NOTIFICATIONS
 # =============================================================================
@@ -0,0 +1,385 @@
+"""
+Chat presence tracking shared by all Socket.IO workers.
+
+Presence is tracked per connection (socket sid) rather than per user, so a
+user with two tabs stays online until the last tab closes. Every connection
+carries a TTL that the client refreshes with heartbeats; connections from a
+worker that died without a clean disconnect simply expire.
+
+Each connection may also be "watching" one conversation (the one open in
+that tab), which targeted presence fan-out uses to find who needs to hear
+about a group member (see utils/presence_fanout.py).
+
+Backends:
+  - InMemoryPresenceStore: single-process (development, one worker)
+  - RedisPresenceStore: any Redis-protocol server, shared by all workers
+
+Configuration (config.py):
+  PRESENCE_BACKEND      'memory' or 'redis' (default when REDIS_URL is set)
+  PRESENCE_REDIS_URL    redis://... (required for the redis backend)
+  PRESENCE_TTL_SECONDS  connection lifetime without a heartbeat
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 90
+
+
+class PresenceStore:
+    """Interface implemented by presence backends."""
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    def connect(self, public_id, sid):
+        """Register a connection. Returns True if the user just came online."""
+        raise NotImplementedError
+
+    def disconnect(self, sid):
+        """Drop a connection. Returns (public_id, went_offline); public_id is None for unknown sids."""
+        raise NotImplementedError
+
+    def heartbeat(self, sid):
+        """Extend a connection's TTL. Returns False if the connection is unknown or expired."""
+        raise NotImplementedError
+
+    def connection_count(self, public_id):
+        """Number of live connections for a user."""
+        raise NotImplementedError
+
+    def sids_for(self, public_id):
+        """Live connection sids for a user, on any worker."""
+        raise NotImplementedError
+
+    def watch(self, sid, conversation_id):
+        """Record the conversation a connection has open (None clears it)."""
+        raise NotImplementedError
+
+    def viewers(self, conversation_ids):
+        """Map conversation_id -> set of public_ids with a live connection watching it."""
+        raise NotImplementedError
+
+    def online_subset(self, public_ids):
+        """The given users that have at least one live connection."""
+        return {pid for pid in public_ids if self.is_online(pid)}
+
+    def is_online(self, public_id):
+        return self.connection_count(public_id) > 0
+
+
+class InMemoryPresenceStore(PresenceStore):
+    """Process-local presence; only correct with a single worker."""
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.time):
+        super().__init__(ttl_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sid_to_pub = {}
+        self._connections = {}  # public_id -> {sid: expires_at}
+        self._watching = {}     # sid -> conversation_id
+        self._viewers = {}      # conversation_id -> {sid}
+
+    def _prune(self, public_id, now):
+        conns = self._connections.get(public_id)
+        if not conns:
+            return {}
+        for sid, expires_at in list(conns.items()):
+            if expires_at <= now:
+                del conns[sid]
+                self._sid_to_pub.pop(sid, None)
+                self._unwatch(sid)
+        if not conns:
+            del self._connections[public_id]
+        return conns
+
+    def connect(self, public_id, sid):
+        now = self._clock()
+        with self._lock:
+            was_online = bool(self._prune(public_id, now))
+            self._sid_to_pub[sid] = public_id
+            self._connections.setdefault(public_id, {})[sid] = now + self.ttl_seconds
+        return not was_online
+
+    def disconnect(self, sid):
+        now = self._clock()
+        with self._lock:
+            public_id = self._sid_to_pub.pop(sid, None)
+            self._unwatch(sid)
+            if not public_id:
+                return None, False
+            self._connections.get(public_id, {}).pop(sid, None)
+            return public_id, not self._prune(public_id, now)
+
+    def heartbeat(self, sid):
+        now = self._clock()
+        with self._lock:
+            public_id = self._sid_to_pub.get(sid)
+            if not public_id or sid not in self._prune(public_id, now):
+                return False
+            self._connections[public_id][sid] = now + self.ttl_seconds
+            return True
+
+    def connection_count(self, public_id):
+        with self._lock:
+            return len(self._prune(public_id, self._clock()))
+
+    def sids_for(self, public_id):
+        with self._lock:
+            return list(self._prune(public_id, self._clock()))
+
+    def _unwatch(self, sid):
+        conv_id = self._watching.pop(sid, None)
+        if conv_id is not None:
+            sids = self._viewers.get(conv_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._viewers[conv_id]
+
+    def watch(self, sid, conversation_id):
+        with self._lock:
+            self._unwatch(sid)
+            if conversation_id is not None and sid in self._sid_to_pub:
+                self._watching[sid] = conversation_id
+                self._viewers.setdefault(conversation_id, set()).add(sid)
+
+    def viewers(self, conversation_ids):
+        now = self._clock()
+        result = {}
+        with self._lock:
+            for conv_id in conversation_ids:
+                for sid in list(self._viewers.get(conv_id, ())):
+                    pub = self._sid_to_pub.get(sid)
+                    if pub and sid in self._prune(pub, now):
+                        result.setdefault(conv_id, set()).add(pub)
+        return result
+
+    def online_subset(self, public_ids):
+        now = self._clock()
+        with self._lock:
+            return {pid for pid in public_ids if self._prune(pid, now)}
+
+
+class RedisPresenceStore(PresenceStore):
+    """
+    Presence in a Redis-protocol server.
+
+    Keys:
+      presence:sid:<sid>      -> public_id (expires with the connection)
+      presence:user:<pub_id>  -> sorted set of sids scored by expiry time
+      presence:watch:<sid>    -> conversation_id the connection has open
+      presence:viewers:<conv> -> hash of sid -> public_id watching it
+    """
+
+    KEY_PREFIX = "presence"
+
+    def __init__(self, client, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.time):
+        super().__init__(ttl_seconds)
+        self.client = client
+        self._clock = clock
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis  # optional dependency, only needed for this backend
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _sid_key(self, sid):
+        return f"{self.KEY_PREFIX}:sid:{sid}"
+
+    def _user_key(self, public_id):
+        return f"{self.KEY_PREFIX}:user:{public_id}"
+
+    def _watch_key(self, sid):
+        return f"{self.KEY_PREFIX}:watch:{sid}"
+
+    def _viewers_key(self, conversation_id):
+        return f"{self.KEY_PREFIX}:viewers:{conversation_id}"
+
+    def connect(self, public_id, sid):
+        now = self._clock()
+        user_key = self._user_key(public_id)
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(user_key, "-inf", now)
+        pipe.zcard(user_key)
+        pipe.zadd(user_key, {sid: now + self.ttl_seconds})
+        pipe.expire(user_key, self.ttl_seconds)
+        pipe.set(self._sid_key(sid), public_id, ex=self.ttl_seconds)
+        _, live_before, *_ = pipe.execute()
+        return live_before == 0
+
+    def disconnect(self, sid):
+        public_id = self.client.get(self._sid_key(sid))
+        if isinstance(public_id, bytes):
+            public_id = public_id.decode()
+        if not public_id:
+            return None, False
+
+        self.watch(sid, None)
+        user_key = self._user_key(public_id)
+        pipe = self.client.pipeline()
+        pipe.delete(self._sid_key(sid))
+        pipe.zrem(user_key, sid)
+        pipe.zremrangebyscore(user_key, "-inf", self._clock())
+        pipe.zcard(user_key)
+        *_, remaining = pipe.execute()
+        return public_id, remaining == 0
+
+    def heartbeat(self, sid):
+        public_id = self.client.get(self._sid_key(sid))
+        if isinstance(public_id, bytes):
+            public_id = public_id.decode()
+        if not public_id:
+            return False
+
+        now = self._clock()
+        user_key = self._user_key(public_id)
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(user_key, "-inf", now)
+        pipe.zscore(user_key, sid)
+        if pipe.execute()[1] is None:
+            return False
+
+        pipe = self.client.pipeline()
+        pipe.zadd(user_key, {sid: now + self.ttl_seconds}, xx=True)
+        pipe.expire(user_key, self.ttl_seconds)
+        pipe.expire(self._sid_key(sid), self.ttl_seconds)
+        pipe.expire(self._watch_key(sid), self.ttl_seconds)
+        pipe.execute()
+        return True
+
+    def connection_count(self, public_id):
+        user_key = self._user_key(public_id)
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(user_key, "-inf", self._clock())
+        pipe.zcard(user_key)
+        return pipe.execute()[1]
+
+    def sids_for(self, public_id):
+        sids = self.client.zrangebyscore(self._user_key(public_id), f"({self._clock()}", "+inf")
+        return [s.decode() if isinstance(s, bytes) else s for s in sids]
+
+    def watch(self, sid, conversation_id):
+        previous = self.client.get(self._watch_key(sid))
+        if isinstance(previous, bytes):
+            previous = previous.decode()
+        pipe = self.client.pipeline()
+        if previous:
+            pipe.hdel(self._viewers_key(previous), sid)
+        if conversation_id is None:
+            pipe.delete(self._watch_key(sid))
+            pipe.execute()
+            return
+
+        public_id = self.client.get(self._sid_key(sid))
+        if isinstance(public_id, bytes):
+            public_id = public_id.decode()
+        if not public_id:
+            pipe.execute()
+            return
+        viewers_key = self._viewers_key(conversation_id)
+        pipe.set(self._watch_key(sid), conversation_id, ex=self.ttl_seconds)
+        pipe.hset(viewers_key, sid, public_id)
+        pipe.expire(viewers_key, self.ttl_seconds)
+        pipe.execute()
+
+    def viewers(self, conversation_ids):
+        conversation_ids = list(conversation_ids)
+        if not conversation_ids:
+            return {}
+        pipe = self.client.pipeline()
+        for conv_id in conversation_ids:
+            pipe.hgetall(self._viewers_key(conv_id))
+        watching = [(conv_id, sid, pub)
+                    for conv_id, entries in zip(conversation_ids, pipe.execute())
+                    for sid, pub in entries.items()]
+        if not watching:
+            return {}
+
+        # Entries of connections that died without a disconnect linger in the
+        # hash until it expires; only count sids that are still live.
+        pipe = self.client.pipeline()
+        for conv_id, sid, _ in watching:
+            pipe.get(self._watch_key(sid))
+        result = {}
+        stale = []
+        for (conv_id, sid, pub), current in zip(watching, pipe.execute()):
+            if isinstance(current, bytes):
+                current = current.decode()
+            if isinstance(sid, bytes):
+                sid, pub = sid.decode(), pub.decode()
+            if current == str(conv_id):
+                result.setdefault(conv_id, set()).add(pub)
+            else:
+                stale.append((conv_id, sid))
+        if stale:
+            pipe = self.client.pipeline()
+            for conv_id, sid in stale:
+                pipe.hdel(self._viewers_key(conv_id), sid)
+            pipe.execute()
+        return result
+
+    def online_subset(self, public_ids):
+        public_ids = list(public_ids)
+        if not public_ids:
+            return set()
+        now = self._clock()
+        pipe = self.client.pipeline()
+        for pid in public_ids:
+            pipe.zcount(self._user_key(pid), f"({now}", "+inf")
+        return {pid for pid, live in zip(public_ids, pipe.execute()) if live}
+
+
+class Presence:
+    """
+    Flask extension wrapper selecting the presence backend from app config.
+    Defaults to the in-memory backend until init_app() is called.
+    """
+
+    def __init__(self, app=None):
+        self.store = InMemoryPresenceStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = (app.config.get("PRESENCE_BACKEND") or "memory").lower()
+        ttl = int(app.config.get("PRESENCE_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+
+        if backend == "redis":
+            url = app.config.get("PRESENCE_REDIS_URL")
+            if not url:
+                raise RuntimeError("PRESENCE_BACKEND=redis requires PRESENCE_REDIS_URL")
+            self.store = RedisPresenceStore.from_url(url, ttl_seconds=ttl)
+        elif backend == "memory":
+            self.store = InMemoryPresenceStore(ttl_seconds=ttl)
+        else:
+            raise RuntimeError(f"Unknown PRESENCE_BACKEND: {backend}")
+
+        app.extensions["presence"] = self
+        logger.info("Presence backend=%s ttl=%ss", backend, ttl)
+
+    def connect(self, public_id, sid):
+        return self.store.connect(public_id, sid)
+
+    def disconnect(self, sid):
+        return self.store.disconnect(sid)
+
+    def heartbeat(self, sid):
+        return self.store.heartbeat(sid)
+
+    def sids_for(self, public_id):
+        return self.store.sids_for(public_id)
+
+    def watch(self, sid, conversation_id):
+        return self.store.watch(sid, conversation_id)
+
+    def viewers(self, conversation_ids):
+        return self.store.viewers(conversation_ids)
+
+    def online_subset(self, public_ids):
+        return self.store.online_subset(public_ids)
+
+    def is_online(self, public_id):
+        return self.store.is_online(public_id)
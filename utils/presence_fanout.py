@@ -0,0 +1,204 @@
+"""
+Targeted, batched presence fan-out.
+
+Instead of broadcasting every online/offline change to every connected
+client, presence changes are buffered and sent every few seconds as one
+`presence_batch` frame per interested user:
+
+  - contacts: the other participant of each direct conversation
+  - watchers: users with a group conversation open that the person is in
+              (Presence.watch, set by the `presence_watch` socket event)
+
+Only users that are online receive a frame, and a user who comes online and
+goes offline again within one interval is reported once, with the latest
+status. During a login surge this turns O(online²) single-update frames into
+at most one frame per online user per interval.
+
+Configuration (config.py):
+  PRESENCE_FLUSH_SECONDS  batching interval
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import and_
+from sqlalchemy.orm import aliased
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 1.0
+
+
+def direct_contacts(public_ids):
+    """Map public_id -> set of public_ids they share a direct conversation with."""
+    from models import Conversation, ConversationParticipant
+    from utils.extensions import db
+
+    public_ids = list(public_ids)
+    if not public_ids:
+        return {}
+    me = aliased(ConversationParticipant)
+    other = aliased(ConversationParticipant)
+    rows = db.session.query(me.user_public_id, other.user_public_id).join(
+        Conversation, and_(Conversation.id == me.conversation_id, Conversation.type == "direct")
+    ).join(
+        other, and_(other.conversation_id == me.conversation_id, other.user_public_id != me.user_public_id)
+    ).filter(me.user_public_id.in_(public_ids)).all()
+
+    contacts = {}
+    for pub, contact in rows:
+        contacts.setdefault(pub, set()).add(contact)
+    return contacts
+
+
+def group_memberships(public_ids):
+    """Map group conversation_id -> set of the given public_ids that are members."""
+    from models import Conversation, ConversationParticipant
+    from utils.extensions import db
+
+    public_ids = list(public_ids)
+    if not public_ids:
+        return {}
+    rows = db.session.query(ConversationParticipant.conversation_id, ConversationParticipant.user_public_id).join(
+        Conversation, Conversation.id == ConversationParticipant.conversation_id
+    ).filter(
+        Conversation.type == "group",
+        ConversationParticipant.user_public_id.in_(public_ids),
+    ).all()
+
+    members = {}
+    for conv_id, pub in rows:
+        members.setdefault(conv_id, set()).add(pub)
+    return members
+
+
+class PresenceFanout:
+    """Flask extension buffering presence changes and emitting targeted batches."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_seconds = DEFAULT_FLUSH_SECONDS
+        self._lock = threading.Lock()
+        self._pending = {}  # public_id -> latest update dict
+        self._started = False
+        self._flush_lock = threading.Lock()
+        self._stats = {
+            "flushes": 0,
+            "updates": 0,
+            "coalesced": 0,
+            "frames": 0,
+            "deliveries": 0,
+            "last_flush_ms": None,
+            "max_flush_ms": 0.0,
+            "errors": 0,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_seconds = float(app.config.get("PRESENCE_FLUSH_SECONDS") or DEFAULT_FLUSH_SECONDS)
+        app.extensions["presence_fanout"] = self
+
+    # -------------------------
+    # Buffer
+    # -------------------------
+    def publish(self, public_id, status, last_seen=None):
+        """Queue a presence change; a later change for the same user replaces it."""
+        if not public_id:
+            return
+        update = {"user_public_id": public_id, "status": status}
+        if last_seen is not None:
+            update["last_seen"] = last_seen.isoformat()
+        with self._lock:
+            if public_id in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[public_id] = update
+        self._ensure_started()
+
+    def depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, depth=len(self._pending), flush_seconds=self.flush_seconds)
+
+    # -------------------------
+    # Flushing
+    # -------------------------
+    def audience(self, public_ids):
+        """Map changed public_id -> set of online public_ids that should hear about it."""
+        from utils.extensions import presence
+
+        audience = {pub: set(contacts) for pub, contacts in direct_contacts(public_ids).items()}
+
+        members = group_memberships(public_ids)
+        for conv_id, watchers in presence.viewers(members).items():
+            for pub in members[conv_id]:
+                audience.setdefault(pub, set()).update(watchers)
+
+        for pub, recipients in audience.items():
+            recipients.discard(pub)
+        online = presence.online_subset({r for recipients in audience.values() for r in recipients})
+        return {pub: recipients & online for pub, recipients in audience.items() if recipients & online}
+
+    def flush(self):
+        """Emit everything buffered so far. Returns the number of frames sent."""
+        if self.app is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    audience = self.audience(batch)
+            except Exception:
+                logger.exception("presence fan-out failed (%d updates); dropped", len(batch))
+                with self._lock:
+                    self._stats["errors"] += 1
+                return 0
+
+            frames = {}
+            for pub, recipients in audience.items():
+                for recipient in recipients:
+                    frames.setdefault(recipient, []).append(batch[pub])
+
+            from utils.extensions import socketio
+            for recipient, updates in frames.items():
+                socketio.emit("presence_batch", {"updates": updates}, room=f"user_{recipient}")
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["updates"] += len(batch)
+                self._stats["frames"] += len(frames)
+                self._stats["deliveries"] += sum(len(u) for u in frames.values())
+                self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+                self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+            logger.debug("presence flush: %d updates, %d frames, %.1f ms", len(batch), len(frames), elapsed_ms)
+            return len(frames)
+
+    def _ensure_started(self):
+        if self._started or self.app is None:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        from utils.extensions import socketio
+        socketio.start_background_task(self._run)
+        logger.info("presence fan-out started (every %ss)", self.flush_seconds)
+
+    def _run(self):
+        from utils.extensions import socketio
+
+        while True:
+            socketio.sleep(self.flush_seconds)
+            self.flush()
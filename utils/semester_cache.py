@@ -0,0 +1,132 @@
+"""
+Process-wide cache of per-semester result aggregates.
+
+Class result tables, the grading dashboard summary and other semester-wide
+reports are rebuilt from the same grades on every page view, but only change when grades are written or
+a semester is finalized, released, recalled or locked. Entries are keyed
+by (academic_year, semester, key) so one semester can be dropped at a time:
+
+  - get_or_build() returns the cached value or calls the builder and stores it
+  - dropped when a SemesterResultRelease or StudentCourseGrade row changes
+    through the ORM (at flush and again after commit), and via touch() for
+    bulk grade writes; the GPA summary refresh
+    (services/gpa_summary_service.py) touches every semester it rewrites
+  - per-entry TTL (SEMESTER_CACHE_TTL_SECONDS) so other worker processes
+    pick up changes too
+  - hit/miss/build counters via stats() (/health/metrics)
+
+Cached values are shared between requests; treat them as read-only.
+"""
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 300
+
+_DIRTY_KEY = "semester_cache_dirty"
+
+
+class SemesterCache:
+    """Flask extension: TTL cache of semester aggregates with per-semester invalidation."""
+
+    def __init__(self, app=None, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}      # (academic_year, semester, key) -> (expires_at, value)
+        self._generations = {}  # (academic_year, semester) -> bumped by invalidate()
+        self._listening = False
+        self._stats = {"hits": 0, "misses": 0, "builds": 0, "invalidations": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("SEMESTER_CACHE_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+        app.extensions["semester_cache"] = self
+        self._listen()
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+    def get_or_build(self, academic_year, semester, key, builder):
+        """Cached value for (academic_year, semester, key), else builder() (stored)."""
+        self._listen()
+        entry_key = (academic_year, semester, key)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry and entry[0] > now:
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+            generation = self._generations.get((academic_year, semester), 0)
+
+        value = builder()
+        with self._lock:
+            self._stats["builds"] += 1
+            # Skip the store if the semester was invalidated while building
+            if self._generations.get((academic_year, semester), 0) == generation:
+                self._entries[entry_key] = (now + self.ttl_seconds, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), ttl_seconds=self.ttl_seconds)
+
+    # -------------------------
+    # Invalidation
+    # -------------------------
+    def invalidate(self, academic_year=None, semester=None):
+        """Drop one semester's entries, or everything when no semester is given."""
+        with self._lock:
+            if academic_year is None and semester is None:
+                dropped = list(self._entries)
+                periods = {(year, sem) for year, sem, _ in dropped} | set(self._generations)
+            else:
+                dropped = [k for k in self._entries if k[0] == academic_year and k[1] == semester]
+                periods = {(academic_year, semester)}
+            for key in dropped:
+                del self._entries[key]
+            for period in periods:
+                self._generations[period] = self._generations.get(period, 0) + 1
+            if dropped:
+                self._stats["invalidations"] += 1
+
+    def touch(self, periods, session=None):
+        """
+        Invalidate these (academic_year, semester) periods now and, when a
+        session is given, again once it commits (a concurrent reader may have
+        rebuilt from pre-commit rows).
+        """
+        self._listen()
+        periods = set(periods)
+        for academic_year, semester in periods:
+            self.invalidate(academic_year, semester)
+        if session is not None and periods:
+            session.info.setdefault(_DIRTY_KEY, set()).update(periods)
+
+    def _listen(self):
+        """Drop a semester after ORM writes to its release row or grades (once per process)."""
+        if self._listening:
+            return
+        self._listening = True
+
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session, object_session
+        from models import SemesterResultRelease, StudentCourseGrade
+
+        def on_change(mapper, connection, target):
+            self.touch([(target.academic_year, target.semester)], object_session(target))
+
+        def after_commit(session):
+            for academic_year, semester in session.info.pop(_DIRTY_KEY, ()):
+                self.invalidate(academic_year, semester)
+
+        def after_rollback(session):
+            for academic_year, semester in session.info.pop(_DIRTY_KEY, ()):
+                self.invalidate(academic_year, semester)
+
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(SemesterResultRelease, name, on_change)
+            event.listen(StudentCourseGrade, name, on_change)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)
@@ -87,3 +87,54 @@ def serialize_message(message):
         "sender_role": message.sender_role,
         "sender_name": message.sender_name,  # resolve from role if needed
     }
+
+
+def serialize_messages(messages, include_reactions=False):
+    """
+    Serialize a list of chat Message objects in bulk.
+
+    Produces the same dicts as Message.to_dict(), but resolves reply targets,
+    sender names and (optionally) reactions with one query each instead of
+    several queries per message.
+    """
+    from models import ArchivedMessage, Message, MessageReaction
+
+    messages = list(messages)
+    if not messages:
+        return []
+
+    reply_ids = {m.reply_to_message_id for m in messages if m.reply_to_message_id}
+    replies = {}
+    if reply_ids:
+        replies = {
+            r.id: r for r in Message.query.filter(Message.id.in_(reply_ids)).all()
+        }
+        archived_ids = reply_ids - replies.keys()
+        if archived_ids:
+            replies.update({
+                r.id: r.to_message()
+                for r in ArchivedMessage.query.filter(ArchivedMessage.id.in_(archived_ids)).all()
+            })
+
+    public_ids = {m.sender_public_id for m in messages}
+    public_ids.update(r.sender_public_id for r in replies.values())
+    names = Message.sender_names_for(public_ids)
+
+    result = [m.serialize_with(names, replies.get(m.reply_to_message_id)) for m in messages]
+
+    if include_reactions:
+        # Archived messages (ArchivedMessage.to_message) carry their own reactions
+        reactions_by_message = {
+            m.id: m.archived_reactions for m in messages if hasattr(m, "archived_reactions")
+        }
+        hot_ids = [m.id for m in messages if m.id not in reactions_by_message]
+        if hot_ids:
+            for r in MessageReaction.query.filter(
+                MessageReaction.message_id.in_(hot_ids)
+            ).order_by(MessageReaction.message_id, MessageReaction.id).all():
+                reactions_by_message.setdefault(r.message_id, []).append(r.to_dict())
+
+        for data in result:
+            data["reactions"] = reactions_by_message.get(data["id"], [])
+
+    return result
@@ -0,0 +1,262 @@
+"""
+In-memory directory of people for the chat and admin recipient pickers.
+
+The pickers used to join and sort User/StudentProfile/Admin on every
+keystroke. This index is built with two queries, then answers from memory:
+
+  - buckets per role ('teacher', 'student', 'admin') and per programme /
+    programme+level cohort, each pre-sorted by name
+  - prefix search over name words, user IDs and index numbers: every query
+    term must be a prefix of one of a person's tokens
+  - paginated top-k (limit/offset) in name order
+
+It is rebuilt lazily after a User, Admin or StudentProfile change that
+touches an indexed field (ORM events, as in utils/identity_cache.py), and
+after DIRECTORY_TTL_SECONDS so other worker processes pick changes up too.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import NamedTuple, Optional
+
+DEFAULT_TTL_SECONDS = 300
+
+# Prefix matches above which a paged search scans its bucket instead
+SCAN_THRESHOLD = 256
+
+_DIRTY_KEY = "user_directory_dirty"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Columns whose changes require a rebuild
+_INDEXED_FIELDS = {
+    "User": ("public_id", "user_id", "first_name", "middle_name", "last_name", "role"),
+    "Admin": ("public_id", "username", "role"),
+    "StudentProfile": ("user_id", "index_number", "current_programme", "programme_level"),
+}
+
+
+class DirectoryEntry(NamedTuple):
+    public_id: str
+    kind: str                  # 'user' | 'admin'
+    role: str
+    name: str                  # display name
+    user_id: Optional[str]     # User.user_id (None for admins)
+    index_number: Optional[str]
+    profile_id: Optional[int]  # StudentProfile.id
+    programme: Optional[str]
+    level: Optional[int]
+
+
+def _tokens(*values):
+    tokens = set()
+    for value in values:
+        if not value:
+            continue
+        value = str(value).lower()
+        tokens.add(value)
+        tokens.update(_TOKEN_RE.findall(value))
+    return tokens
+
+
+class _Index:
+    """One immutable snapshot of the directory."""
+
+    def __init__(self, entries):
+        self.entries = entries  # in name order; position == rank
+        self.buckets = {}       # key -> [rank, ...] in name order
+        self.tokens = []        # rank -> tuple of the entry's search tokens
+        postings = []
+        for rank, e in enumerate(entries):
+            keys = [("admin",)] if e.kind == "admin" else [("user", e.role)]
+            if e.programme is not None:
+                keys += [("cohort", e.programme, None), ("cohort", e.programme, e.level)]
+            for key in keys:
+                self.buckets.setdefault(key, []).append(rank)
+            tokens = tuple(_tokens(e.name, e.user_id, e.index_number))
+            self.tokens.append(tokens)
+            postings.extend((tok, rank) for tok in tokens)
+        postings.sort()
+        self.postings = postings
+        self.bucket_sets = {key: set(ranks) for key, ranks in self.buckets.items()}
+
+    def prefix_range(self, term):
+        """Slice of `postings` whose tokens start with `term`."""
+        lo = bisect_left(self.postings, (term,))
+        hi = bisect_left(self.postings, (term + "\uffff",), lo)
+        return lo, hi
+
+    def matches(self, rank, terms):
+        tokens = self.tokens[rank]
+        return all(any(tok.startswith(term) for tok in tokens) for term in terms)
+
+
+class UserDirectory:
+    """Flask extension: cached, prefix-searchable people directory."""
+
+    def __init__(self, app=None, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index = None
+        self._built_at = 0.0
+        self._generation = 0   # bumped by invalidate(); a build started earlier is discarded
+        self._listening = False
+        self._stats = {"builds": 0, "last_build_ms": None, "searches": 0, "invalidations": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl_seconds = float(app.config.get("DIRECTORY_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+        app.extensions["user_directory"] = self
+        self._listen()
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def search(self, role=None, programme=None, level=None, query=None, limit=None, offset=0,
+               exclude=None, predicate=None):
+        """
+        Entries in one bucket (a role, or a programme / programme+level
+        cohort when `programme` is given) matching every term of `query` as
+        a prefix, in name order. Returns (entries, has_more).
+        """
+        index = self._current()
+        with self._lock:
+            self._stats["searches"] += 1
+
+        if programme is not None:
+            key = ("cohort", programme, level)
+        elif role == "admin":
+            key = ("admin",)  # Admin table accounts
+        else:
+            key = ("user", role)
+        ranks = index.buckets.get(key, [])
+
+        terms = _TOKEN_RE.findall((query or "").lower())
+        if terms:
+            lo, hi = min((index.prefix_range(t) for t in terms), key=lambda r: r[1] - r[0])
+            if hi - lo <= SCAN_THRESHOLD or limit is None:
+                # Selective term: candidates from the postings, in name order
+                members = index.bucket_sets.get(key, ())
+                candidates = {index.postings[i][1] for i in range(lo, hi)}
+                ranks = sorted(r for r in candidates if r in members and index.matches(r, terms))
+            else:
+                # Common prefix: walk the bucket in name order, stop once the page is full
+                ranks = (r for r in ranks if index.matches(r, terms))
+
+        results = []
+        skipped = 0
+        for rank in ranks:
+            entry = index.entries[rank]
+            if entry.public_id == exclude or (predicate is not None and not predicate(entry)):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            if limit is not None and len(results) == limit:
+                return results, True
+            results.append(entry)
+        return results, False
+
+    def stats(self):
+        with self._lock:
+            size = len(self._index.entries) if self._index else 0
+            return dict(self._stats, size=size, ttl_seconds=self.ttl_seconds)
+
+    # -------------------------
+    # Building
+    # -------------------------
+    def _current(self):
+        now = self._clock()
+        with self._lock:
+            if self._index is not None and now - self._built_at < self.ttl_seconds:
+                return self._index
+            generation = self._generation
+
+        started = time.perf_counter()
+        index = _Index(self._load())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            if generation == self._generation:
+                self._index, self._built_at = index, now
+            self._stats["builds"] += 1
+            self._stats["last_build_ms"] = round(elapsed_ms, 2)
+        return index
+
+    def _load(self):
+        from models import Admin, StudentProfile, User
+        from utils.extensions import db
+
+        rows = db.session.query(
+            User.public_id, User.role, User.user_id, User.first_name, User.middle_name, User.last_name,
+            StudentProfile.id, StudentProfile.index_number,
+            StudentProfile.current_programme, StudentProfile.programme_level,
+        ).outerjoin(StudentProfile, StudentProfile.user_id == User.user_id).all()
+
+        keyed = []
+        for r in rows:
+            name = " ".join(n for n in (r.first_name, r.middle_name, r.last_name) if n)
+            keyed.append((
+                ((r.first_name or "").lower(), (r.last_name or "").lower(), r.public_id),
+                DirectoryEntry(r.public_id, "user", r.role, name, r.user_id, r.index_number,
+                               r[6], r.current_programme, r.programme_level),
+            ))
+        for a in db.session.query(Admin.public_id, Admin.username, Admin.role).all():
+            keyed.append((
+                ((a.username or "").lower(), "", a.public_id),
+                DirectoryEntry(a.public_id, "admin", a.role, a.username, None, None, None, None, None),
+            ))
+        keyed.sort(key=lambda item: item[0])
+        return [entry for _, entry in keyed]
+
+    # -------------------------
+    # Invalidation
+    # -------------------------
+    def invalidate(self):
+        with self._lock:
+            if self._index is not None:
+                self._stats["invalidations"] += 1
+            self._index = None
+            self._generation += 1
+
+    def _listen(self):
+        """Rebuild after ORM writes that touch indexed fields (once per process)."""
+        if self._listening:
+            return
+        self._listening = True
+
+        from sqlalchemy import event, inspect
+        from sqlalchemy.orm import Session, object_session
+        from models import Admin, StudentProfile, User
+
+        def mark(target):
+            self.invalidate()
+            session = object_session(target)
+            if session is not None:
+                session.info[_DIRTY_KEY] = True
+
+        def on_insert_or_delete(mapper, connection, target):
+            mark(target)
+
+        def on_update(mapper, connection, target):
+            state = inspect(target)
+            fields = _INDEXED_FIELDS[type(target).__name__]
+            if any(state.attrs[f].history.has_changes() for f in fields):
+                mark(target)
+
+        def after_commit(session):
+            # A concurrent search may have rebuilt from pre-commit rows
+            if session.info.pop(_DIRTY_KEY, None):
+                self.invalidate()
+
+        def after_rollback(session):
+            session.info.pop(_DIRTY_KEY, None)
+
+        for model in (User, Admin, StudentProfile):
+            event.listen(model, "after_insert", on_insert_or_delete)
+            event.listen(model, "after_delete", on_insert_or_delete)
+            event.listen(model, "after_update", on_update)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)